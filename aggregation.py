@@ -0,0 +1,279 @@
+"""
+Aggregation: evaluates the results of a sweep. The faults and the method → line pairs of every project are
+indexed once, only the line ids, the line suspiciousness and the MTP are read from every result (not the
+mutant suspiciousness), and the ranks of the fault lines are looked up in the arrays given by ranking.py.
+
+In the fused mode of sweep.py the results are evaluated in memory instead (collect_result), and only a table
+of metrics per ratio triple is written (write_metrics), plus the full results of the selected configurations.
+
+"""
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ranking import rank_lookup
+from util import artifact_file, dictionary_to_json, iterate_projects, load_artifact, save_artifact
+
+# The fields of the project records used by the evaluation, see iterate_projects
+EVALUATION_FIELDS = ('proj', 'ans', 'edge2')
+# The tables of metrics written by the fused sweep, one per dataset and ratio triple
+METRICS_DIRECTORY = 'data/metrics'
+
+
+def index_project(data: dict) -> dict:
+    """
+    Indexes the fault methods of a project and the lines of these methods.
+
+    Returns:
+    - dict: "proj", "fault" (the fault methods of the record), "methods" (the distinct fault methods),
+      "pair methods" (the position in "methods" of every method → line pair of a fault method) and "pair lines".
+    """
+    methods = list(dict.fromkeys(data['ans']))
+    position = {method: index for index, method in enumerate(methods)}
+    pairs = [(position[method], line) for method, line in data['edge2'] if method in position]
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    return {"proj": data['proj'], "fault": data['ans'], "methods": methods,
+            "pair methods": pairs[:, 0], "pair lines": pairs[:, 1]}
+
+
+def index_projects(dataset_name: str) -> list:
+    return [index_project(data) for data in iterate_projects(dataset_name, EVALUATION_FIELDS)]
+
+
+def load_line_scores(file_path: str):
+    """
+    Reads the line ids, the line suspiciousness and the current MTP of a result. From a .npz artifact only
+    these columns are decompressed.
+
+    Returns:
+    - np.array: The line ids.
+    - np.array: The suspiciousness of the lines.
+    - The "current_MTP" of the result, or None if it has none (e.g. SBFL results).
+    """
+    if file_path.endswith(".npz"):
+        with np.load(file_path) as columns:
+            fields = columns["fields"].tolist()
+            current_MTP = columns[f"field_{fields.index('current_MTP')}"].item() if 'current_MTP' in fields else None
+            return columns["line_ids"].astype(np.int64), columns["line_suspicion"], current_MTP
+    json_data = load_artifact(file_path)
+    line_suspicion = json_data["line suspicion"]
+    ids = np.fromiter((int(line) for line in line_suspicion), dtype=np.int64, count=len(line_suspicion))
+    scores = np.fromiter((details.get('suspicion', 0) for details in line_suspicion.values()),
+                         dtype=float, count=len(line_suspicion))
+    return ids, scores, json_data.get("current_MTP")
+
+
+def evaluate_scores(project: dict, ids, scores, current_MTP) -> dict:
+    """
+    Evaluates the line suspiciousness of a project: a fault method is found in the top N when one of its
+    lines has a worst tie rank of at most N, FR adds the best rank of the lines of every fault method and AR
+    their average rank.
+
+    Args:
+    - project (dict): The result of index_project.
+    - ids (np.array): The line ids.
+    - scores (np.array): The suspiciousness of the lines.
+    - current_MTP: The MTP of the result.
+
+    Returns:
+    - dict: The "top1", "top3", "top5", "top10", "FR", "AR", "fault_count", "line_count" and "MTP" of the project.
+    """
+    lookup = rank_lookup(ids, scores)
+    lines = project["pair lines"]
+    ranks = np.zeros(len(lines), dtype=np.int64)
+    known = (lines >= 0) & (lines < len(lookup))
+    ranks[known] = lookup[lines[known]]
+    ranked = ranks > 0
+    methods, ranks = project["pair methods"][ranked], ranks[ranked]
+
+    number_of_methods = len(project["methods"])
+    line_count = np.bincount(methods, minlength=number_of_methods).tolist()
+    sum_rank = np.bincount(methods, weights=ranks, minlength=number_of_methods).tolist()
+    first = np.full(number_of_methods, sys.maxsize, dtype=np.int64)
+    np.minimum.at(first, methods, ranks)
+    top = {n: np.bincount(methods[ranks <= n], minlength=number_of_methods) > 0 for n in (1, 3, 5, 10)}
+
+    result = {"project_name": project["proj"], "top1": int(top[1].sum()), "top3": int(top[3].sum()),
+              "top5": int(top[5].sum()), "top10": int(top[10].sum()), "FR": 0.0, "AR": 0.0, "fault_count": 0,
+              "line_count": 0}
+    # Summed method by method, in the order of the faults, like the results were before
+    for method_first, method_sum_rank, method_line_count in zip(first.tolist(), sum_rank, line_count):
+        result["FR"] += method_first if method_first != sys.maxsize else 0
+        result["AR"] += int(method_sum_rank) / method_line_count if method_line_count != 0 else 0
+        result["line_count"] += method_line_count
+    result["fault_count"] = len(project["fault"])
+    result["MTP"] = current_MTP
+    return result
+
+
+def evaluate_project(project: dict, directory_path: str) -> dict:
+    """
+    Evaluates the result of a project stored in a directory, e.g. data/mbfl/Lang/0.2/0.8/0.8/Ochiai.
+    """
+    return evaluate_scores(project, *load_line_scores(artifact_file(os.path.join(directory_path, f"{project['proj']}.json"))))
+
+
+def evaluate_result(project: dict, result: dict) -> dict:
+    """
+    Evaluates a result of mbfl.run_project in memory, without storing it.
+    """
+    line_suspicion = result["line suspicion"]
+    ids = np.fromiter((int(line) for line in line_suspicion), dtype=np.int64, count=len(line_suspicion))
+    scores = np.fromiter((details.get('suspicion', 0) for details in line_suspicion.values()),
+                         dtype=float, count=len(line_suspicion))
+    return evaluate_scores(project, ids, scores, result.get("current_MTP"))
+
+
+def sum_up(formula_name: str, results: list) -> dict:
+    """
+    Sums up the results of the projects: the counts are summed, and MFR and MAR are the means of FR and AR
+    over the projects.
+    """
+    sum_up_evaluation = {"formula": formula_name, "top1": 0, "top3": 0, "top5": 0,
+                         "top10": 0, "MFR": 0.0, "MAR": 0.0, "MTP": 0.0, "fault_count": 0, "line_count": 0, "results": {}}
+    for result in results:
+        for key in ("top1", "top3", "top5", "top10", "MTP", "fault_count", "line_count"):
+            sum_up_evaluation[key] += result[key]
+        sum_up_evaluation["MFR"] += result["FR"]
+        sum_up_evaluation["MAR"] += result["AR"]
+        sum_up_evaluation["results"][result["project_name"]] = result
+    sum_up_evaluation["MFR"] = sum_up_evaluation["MFR"] / len(sum_up_evaluation["results"])
+    sum_up_evaluation["MAR"] = sum_up_evaluation["MAR"] / len(sum_up_evaluation["results"])
+    return sum_up_evaluation
+
+
+def summarize(projects: list, directory_path: str, formula_name: str) -> dict:
+    """
+    Evaluates the results of all the projects in a directory and sums them up.
+    """
+    return sum_up(formula_name, [evaluate_project(project, directory_path) for project in projects])
+
+
+def summary_row(sum_up_evaluation: dict, selected_statements_ratio, reduced_test_cases_ratio, reduced_mutant_ratio) -> dict:
+    """
+    Get the row of the evaluation spreadsheet of a summary.
+    """
+    return {
+        'function': sum_up_evaluation["formula"],
+        'type': 'worst',
+        'selected_statements_ratio': selected_statements_ratio,
+        'reduced_test_cases_ratio': reduced_test_cases_ratio,
+        "reduced_mutant_ratio": reduced_mutant_ratio,
+        'ftop1': sum_up_evaluation["top1"],
+        'ftop3': sum_up_evaluation["top3"],
+        'ftop5': sum_up_evaluation["top5"],
+        'ftop10': sum_up_evaluation["top10"],
+        'MAP': sum_up_evaluation["MAR"],
+        'MFR': sum_up_evaluation["MFR"],
+        'MTP': sum_up_evaluation["MTP"],
+    }
+
+
+def score(rows: pd.DataFrame, tied_term=np.nan) -> pd.Series:
+    """
+    Scores the rows of a formula like the spreadsheets of evaluation.py: ftop1, MAP and MFR are normalized
+    between the rows, the best row for each of them scoring 1, and summed.
+
+    Args:
+    - rows (pd.DataFrame): The rows, see summary_row.
+    - tied_term (float): The normalized term of a metric equal for all the rows. The spreadsheets keep NaN,
+      which makes every score NaN; search.py uses 0 so that the other metrics still rank the rows.
+    """
+    def normalized(column, lower_is_better=False):
+        spread = rows[column].max() - rows[column].min()
+        if spread == 0:
+            return pd.Series(tied_term, index=rows.index, dtype=float)
+        normalized_column = (rows[column] - rows[column].min()) / spread
+        return 1 - normalized_column if lower_is_better else normalized_column
+
+    ftop1_normalized = normalized('ftop1')
+    map_normalized = normalized('MAP', lower_is_better=True)
+    mfr_normalized = normalized('MFR', lower_is_better=True)
+    weights = {'ftop1': 1, 'MAP': 1, 'MFR': 1}
+    return weights['ftop1'] * ftop1_normalized + \
+        weights['MAP'] * map_normalized + \
+        weights['MFR'] * mfr_normalized
+
+
+def save_selected_results(selected_statements_ratio, reduced_test_cases_ratio, reduced_mutant_ratio, method):
+    '''
+    Save the selected results with given ratios for plotting
+    '''
+    if method == 'gbsr':
+        return selected_statements_ratio == 0.2 and reduced_test_cases_ratio == 0.8 and reduced_mutant_ratio == 0.8
+    elif method == 'cbtcr':
+        return reduced_test_cases_ratio == 0.8
+    elif method == 'random':
+        return selected_statements_ratio == 0.2 and reduced_mutant_ratio == 0.8
+
+
+def is_evaluated(technique: str, triple) -> bool:
+    """
+    Tells whether evaluation.py evaluates the results of a technique for a ratio triple: every triple for
+    gbsr, only the triples keeping all the statements and mutants for cbtcr, and only the triples keeping
+    all the passed test cases for random.
+    """
+    selected_statements_ratio, reduced_test_cases_ratio, reduced_mutant_ratio = triple
+    if technique == 'cbtcr':
+        return selected_statements_ratio == 1.0 and reduced_mutant_ratio == 1.0
+    elif technique == 'random':
+        return reduced_test_cases_ratio == 1.0
+    return True
+
+
+def is_selected(technique: str, triple) -> bool:
+    """
+    Tells whether the full results of a technique for a ratio triple are kept by the fused sweep
+    """
+    return is_evaluated(technique, triple) and save_selected_results(*triple, method=technique)
+
+
+def metrics_path(dataset_name: str, triple) -> str:
+    return os.path.join(METRICS_DIRECTORY, dataset_name, '_'.join(f'{ratio:.1f}' for ratio in triple) + '.csv')
+
+
+def collect_result(evaluations: dict, project: dict, triple, technique: str, result: dict, file_path: str):
+    """
+    The on_result of mbfl.run_project in the fused sweep: evaluates the result in memory and only writes it
+    to file_path for the selected configurations.
+
+    Args:
+    - evaluations (dict): Maps (triple, technique, formula name) to the evaluations of the projects, in order.
+    - project (dict): The result of index_project.
+    """
+    if is_selected(technique, triple):
+        save_artifact(result, file_path)
+    if is_evaluated(technique, triple):
+        evaluations.setdefault((triple, technique, result["formula"]), []).append(evaluate_result(project, result))
+
+
+def write_metrics(dataset_name: str, evaluations: dict):
+    """
+    Sums up the evaluations collected by collect_result and writes one table of metrics per ratio triple,
+    with a row per technique and formula. The summaries of the selected configurations are written where
+    evaluation.py writes them.
+    """
+    rows = {}
+    for (triple, technique, formula_name), results in evaluations.items():
+        sum_up_evaluation = sum_up(formula_name, results)
+        if is_selected(technique, triple):
+            dictionary_to_json(
+                sum_up_evaluation, f"./data/baseline/{technique}/{dataset_name}/result/{formula_name}.json")
+        rows.setdefault(triple, []).append({'technique': technique, **summary_row(sum_up_evaluation, *triple)})
+    for triple, triple_rows in rows.items():
+        file_path = metrics_path(dataset_name, triple)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        pd.DataFrame(triple_rows).to_csv(file_path, index=False)
+
+
+def load_metrics(dataset_name: str) -> pd.DataFrame:
+    """
+    Loads the tables of metrics of all the ratio triples of a dataset written by write_metrics
+    """
+    files = sorted(glob.glob(os.path.join(METRICS_DIRECTORY, dataset_name, '*.csv')))
+    if not files:
+        raise FileNotFoundError(f"No metrics in {os.path.join(METRICS_DIRECTORY, dataset_name)}, run sweep.py --fused first")
+    return pd.concat([pd.read_csv(file_path) for file_path in files], ignore_index=True)
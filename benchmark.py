@@ -0,0 +1,78 @@
+"""
+Benchmark: compares the set based SBFL preprocessing with the coverage matrix backend, and the set based MBFL
+kill counts with the kill matrix engine, on the biggest project found in pkl_data/, and checks that both
+produce the same results
+
+"""
+import glob
+import time
+
+from baseline import get_mutant_to_lines, get_mutant_to_test_cases
+from preprocess import SBFL_with_contribution, SBFL_with_contribution_by_matrix
+from util import Formula, MBFL_stats, MBFL_stats_by_sets, iterate_project_file
+
+
+def project_size(data: dict) -> int:
+    return len(data['edge']) + len(data['edge10'])
+
+
+def find_biggest_project(pattern: str = 'pkl_data/*.json'):
+    biggest, biggest_dataset = None, None
+    for file_path in sorted(glob.glob(pattern)):
+        for data in iterate_project_file(file_path):
+            if biggest is None or project_size(data) > project_size(biggest):
+                biggest, biggest_dataset = data, file_path
+    return biggest, biggest_dataset
+
+
+def same_suspicion(expected: dict, actual: dict) -> bool:
+    if list(expected.keys()) != list(actual.keys()):
+        return False
+    return all(expected[key]["stats"] == actual[key]["stats"] and
+               expected[key]["suspicion"] == actual[key]["suspicion"] for key in expected)
+
+
+def benchmark(function, data, formula, repeat: int):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(data=data, formula=formula)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_call(function, arguments) -> float:
+    start = time.perf_counter()
+    function(*arguments)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    repeat = 3
+    data, file_path = find_biggest_project()
+    if data is None:
+        raise SystemExit("No project found in pkl_data/")
+    print(f"Project {data['proj']} from {file_path}: {len(data['lines'])} lines, "
+          f"{len(data['ftest']) + len(data['rtest'])} test cases, {project_size(data)} coverage edges")
+    for formula in Formula:
+        dict_time, (dict_methods, dict_lines, _) = benchmark(
+            SBFL_with_contribution, data, formula, repeat)
+        matrix_time, (matrix_methods, matrix_lines, _) = benchmark(
+            SBFL_with_contribution_by_matrix, data, formula, repeat)
+        identical = same_suspicion(dict_lines, matrix_lines) and same_suspicion(dict_methods, matrix_methods)
+        print(f"{Formula.get_formula_name(formula):>10}: dict {dict_time:.3f}s, matrix {matrix_time:.3f}s, "
+              f"speedup {dict_time / matrix_time:.1f}x, identical: {identical}")
+
+    # MBFL kill counts of all the mutants, on the coverage of the SBFL result
+    mutation_to_lines, mutations = get_mutant_to_lines(data['edge12'])
+    mutant_to_passed_test_case, mutant_to_failed_test_case = get_mutant_to_test_cases(data['edge13'], data['edge14'])
+    # The lines are keyed by strings, like in the SBFL result read back from data/sbfl
+    line_test_case_data = {f"{line}": details for line, details in dict_lines.items()}
+    arguments = (mutation_to_lines, mutations, line_test_case_data, mutant_to_passed_test_case, mutant_to_failed_test_case)
+    timings = {}
+    for function in (MBFL_stats_by_sets, MBFL_stats):
+        timings[function] = min(benchmark_call(function, arguments) for _ in range(repeat))
+    identical = MBFL_stats_by_sets(*arguments) == MBFL_stats(*arguments)
+    print(f"MBFL stats of {len(mutations)} mutants: sets {timings[MBFL_stats_by_sets]:.3f}s, "
+          f"kill matrix {timings[MBFL_stats]:.3f}s, speedup {timings[MBFL_stats_by_sets] / timings[MBFL_stats]:.1f}x, "
+          f"identical: {identical}")
@@ -0,0 +1,134 @@
+"""
+Cache: content-addressed cache of the stages of the pipeline. The outputs of a unit of work are keyed by a
+hash of everything they depend on: the project record, the formulas, the ratios, the hashes of the upstream
+artifacts and the source code of the stage. A manifest stored in data/cache records the key and the hashes
+of the outputs, and the unit is only computed again when the key or an output changed.
+
+"""
+import hashlib
+import json
+import logging
+import os
+
+CACHE_DIRECTORY = 'data/cache'
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Hashes of the files already read by this process, keyed by (path, modification time, size)
+_file_hashes = {}
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_json(value) -> str:
+    """
+    Hashes any JSON serializable value, independently of the order of the keys of its dictionaries.
+    Enum members are hashed by name.
+    """
+    return hash_bytes(json.dumps(value, sort_keys=True, default=lambda member: member.name).encode())
+
+
+def file_hash(file_path: str):
+    """
+    Returns:
+    - str: The hash of the content of the file, or None if the file does not exist.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    status = os.stat(file_path)
+    signature = (os.path.abspath(file_path), status.st_mtime_ns, status.st_size)
+    if signature not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+def code_version(*module_names) -> str:
+    """
+    Hashes the source of the modules of a stage, e.g. code_version('graph.py', 'util.py'), so that changing
+    the code of a stage invalidates its outputs.
+    """
+    return hash_json([file_hash(os.path.join(SOURCE_DIRECTORY, module_name)) for module_name in module_names])
+
+
+def unit_key(stage: str, parts: dict, upstream_files: list, modules: list) -> str:
+    """
+    Computes the key of a unit of work.
+
+    Args:
+    - stage (str): The name of the stage.
+    - parts (dict): The JSON serializable inputs of the unit, e.g. the hash of the project record and the formulas.
+    - upstream_files (list): The artifacts of the previous stages read by the unit.
+    - modules (list): The source files of the stage.
+    """
+    return hash_json({
+        "stage": stage,
+        "parts": parts,
+        "upstream": {file_path: file_hash(file_path) for file_path in upstream_files},
+        "code": code_version(*modules),
+    })
+
+
+def manifest_path(stage: str, *names) -> str:
+    return os.path.join(CACHE_DIRECTORY, stage, *names[:-1], f'{names[-1]}.json')
+
+
+def is_up_to_date(manifest_file: str, key: str) -> bool:
+    """
+    Tells whether the manifest was recorded with the same key and all its outputs still have the recorded content.
+    """
+    if not os.path.isfile(manifest_file):
+        return False
+    with open(manifest_file, 'r') as rf:
+        manifest = json.load(rf)
+    if manifest.get("key") != key:
+        return False
+    return all(file_hash(file_path) == digest for file_path, digest in manifest["outputs"].items())
+
+
+def remove_outputs(outputs: list):
+    for file_path in outputs:
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+def record(manifest_file: str, key: str, outputs: list):
+    """
+    Stores the key of a unit and the hashes of its outputs once the unit is computed.
+    """
+    directory = os.path.dirname(manifest_file)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(manifest_file, 'w') as wf:
+        json.dump({"key": key, "outputs": {file_path: file_hash(file_path) for file_path in outputs}}, wf)
+
+
+def run_cached_units(stage: str, units: list, modules: list, function) -> list:
+    """
+    Calls function(names) once with the names of the units whose outputs are not up to date, e.g. the formulas
+    of a project whose results changed, so that the work of the stale units is still done in one call. The
+    stale outputs are removed first, so that the stages which skip existing files write them again.
+
+    Args:
+    - units (list): (name, manifest file, parts, upstream files, outputs) tuples, see unit_key.
+
+    Returns:
+    - list: The names of the units computed.
+    """
+    stale = []
+    for name, manifest_file, parts, upstream_files, outputs in units:
+        key = unit_key(stage, parts, upstream_files, modules)
+        if is_up_to_date(manifest_file, key):
+            logging.info(f"{manifest_file} is up to date. Skipping...")
+            continue
+        remove_outputs(outputs)
+        stale.append((name, manifest_file, key, outputs))
+    if stale:
+        function([name for name, _, _, _ in stale])
+    for _, manifest_file, key, outputs in stale:
+        record(manifest_file, key, outputs)
+    return [name for name, _, _, _ in stale]
@@ -0,0 +1,108 @@
+"""
+Coverage: packs the line-test edge lists of a project into sparse boolean matrices and derives the
+SBFL spectra (ef, ep, nf, np) of every line and method from them with matrix reductions
+
+"""
+import numpy as np
+from scipy import sparse
+
+
+def build_coverage_matrix(edges: list, num_rows: int, num_cols: int) -> sparse.csr_matrix:
+    """
+    Builds a boolean coverage matrix from an edge list.
+
+    Args:
+    - edges (list of pairs): List of edges represented as pairs (row, column), duplicates are allowed.
+    - num_rows (int): The minimum number of rows in the matrix.
+    - num_cols (int): The minimum number of columns in the matrix.
+
+    Returns:
+    - sparse.csr_matrix: A (rows × cols) boolean matrix with sorted indices and no duplicate entries.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    if len(edges) > 0:
+        num_rows = max(num_rows, int(edges[:, 0].max()) + 1)
+        num_cols = max(num_cols, int(edges[:, 1].max()) + 1)
+    matrix = sparse.csr_matrix((np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])),
+                               shape=(num_rows, num_cols))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def count_per_row(matrix: sparse.csr_matrix) -> np.array:
+    """
+    Counts the stored entries of every row of a canonical CSR matrix.
+    """
+    return np.diff(matrix.indptr)
+
+
+class Spectrum:
+    """
+    Coverage spectra of all lines and methods of a project.
+
+    The counts follow the set based implementation in preprocess.SBFL_with_contribution:
+    ef/ep count every distinct test case covering a line, while nf/np only count test cases listed in
+    data["ftest"]/data["rtest"]. A method is covered by the union of the test cases of its lines, and a
+    method without any line keeps all four counts at zero.
+
+    Attributes:
+    - line_ids (np.array): Line indices in the order of data["lines"].
+    - method_ids (np.array): Method indices in the order of data["methods"].
+    - failed_coverage (sparse.csr_matrix): The (lines × failed test cases) boolean matrix built from data["edge"].
+    - passed_coverage (sparse.csr_matrix): The (lines × passed test cases) boolean matrix built from data["edge10"].
+    - line_stats (dict): The arrays "ef", "ep", "nf" and "np" aligned with line_ids.
+    - method_stats (dict): The arrays "ef", "ep", "nf" and "np" aligned with method_ids.
+    """
+
+    def __init__(self, data: dict):
+        self.line_ids = np.fromiter(data["lines"].values(), dtype=np.int64, count=len(data["lines"]))
+        self.method_ids = np.fromiter(data["methods"].values(), dtype=np.int64, count=len(data["methods"]))
+        num_lines = int(self.line_ids.max()) + 1 if self.line_ids.size > 0 else 0
+        num_methods = int(self.method_ids.max()) + 1 if self.method_ids.size > 0 else 0
+
+        self.failed_coverage = build_coverage_matrix(data["edge"], num_lines, len(data["ftest"]))
+        self.passed_coverage = build_coverage_matrix(data["edge10"], num_lines, len(data["rtest"]))
+        failed_tests = np.unique(np.fromiter(data["ftest"].values(), dtype=np.int64, count=len(data["ftest"])))
+        passed_tests = np.unique(np.fromiter(data["rtest"].values(), dtype=np.int64, count=len(data["rtest"])))
+        # Make sure both matrices have one row per line and a column for every listed test case
+        num_rows = max(num_lines, self.failed_coverage.shape[0], self.passed_coverage.shape[0])
+        self.failed_coverage = self._resize(self.failed_coverage, num_rows, failed_tests)
+        self.passed_coverage = self._resize(self.passed_coverage, num_rows, passed_tests)
+
+        line_ef, line_nf = self._counts(self.failed_coverage, failed_tests)
+        line_ep, line_np = self._counts(self.passed_coverage, passed_tests)
+        self.line_stats = {"ef": line_ef[self.line_ids], "ep": line_ep[self.line_ids],
+                           "nf": line_nf[self.line_ids], "np": line_np[self.line_ids]}
+
+        method2lines = build_coverage_matrix(data["edge2"], num_methods, num_rows).astype(np.int32)
+        method2lines.resize((method2lines.shape[0], num_rows))
+        has_lines = count_per_row(method2lines) > 0
+        method_failed = (method2lines @ self.failed_coverage.astype(np.int32)).astype(bool)
+        method_passed = (method2lines @ self.passed_coverage.astype(np.int32)).astype(bool)
+        method_ef, method_nf = self._counts(method_failed.tocsr(), failed_tests)
+        method_ep, method_np = self._counts(method_passed.tocsr(), passed_tests)
+        self.method_stats = {"ef": method_ef[self.method_ids], "ep": method_ep[self.method_ids],
+                             "nf": np.where(has_lines, method_nf, 0)[self.method_ids],
+                             "np": np.where(has_lines, method_np, 0)[self.method_ids]}
+
+    @staticmethod
+    def _resize(matrix: sparse.csr_matrix, num_rows: int, tests: np.array) -> sparse.csr_matrix:
+        num_cols = max(matrix.shape[1], int(tests.max()) + 1 if tests.size > 0 else 0)
+        matrix.resize((num_rows, num_cols))
+        return matrix
+
+    @staticmethod
+    def _counts(coverage: sparse.csr_matrix, tests: np.array):
+        """
+        Returns the number of covering test cases and the number of listed test cases not covering, per row.
+        """
+        covered = count_per_row(coverage)
+        covered_listed = count_per_row(coverage[:, tests]) if tests.size > 0 else np.zeros_like(covered)
+        return covered, tests.size - covered_listed
+
+    def test_cases(self, line: int, passed: bool) -> list:
+        """
+        Returns the sorted indices of the passed or failed test cases covering a line.
+        """
+        coverage = self.passed_coverage if passed else self.failed_coverage
+        return coverage.indices[coverage.indptr[line]:coverage.indptr[line + 1]].tolist()
@@ -1,10 +1,10 @@
 
 from enum import Enum
 import logging
+from profiler import profile
 from util import *
-import json
 import numpy as np
-import pickle
+from scipy import sparse
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.DEBUG)
 np.set_printoptions(suppress=True)
@@ -16,7 +16,47 @@ class Type(Enum):
     FAILED_TEST = 2,
 
 
-def create_adjacency_matrix(length1: int, length2: int, edges: list, suspicion_or_contribution: dict, type: Type) -> np.array:
+def normalized_edges_to_matrix(starts: np.array, ends: np.array, weights: np.array, shape: tuple, as_sparse: bool = False):
+    """
+    Builds an adjacency matrix from weighted edges and min-max normalizes its positive weights.
+
+    Duplicate edges carry the same weight, so only one of them is kept. Only the positive weights are
+    normalized (to 0.5 if they are all equal), the other ones are stored unchanged.
+
+    Args:
+    - starts (np.array): The row of every edge.
+    - ends (np.array): The column of every edge.
+    - weights (np.array): The weight of every edge.
+    - shape (tuple): The shape of the matrix.
+    - as_sparse (bool): True to return a sparse.csr_matrix instead of a dense np.array.
+
+    Returns:
+    - np.array or sparse.csr_matrix: A normalized adjacency matrix.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    _, unique_indices = np.unique(starts * shape[1] + ends, return_index=True)
+    starts, ends = starts[unique_indices], ends[unique_indices]
+    weights = np.asarray(weights, dtype=float)[unique_indices]
+
+    positive = weights > 0
+    if positive.any():
+        min_val = weights[positive].min()
+        max_val = weights[positive].max()
+        # Apply min-max normalization only on non-zero elements
+        weights[positive] = (weights[positive] - min_val) / \
+            (max_val - min_val) if max_val != min_val else 0.5
+
+    if as_sparse:
+        matrix = sparse.csr_matrix((weights, (starts, ends)), shape=shape)
+        matrix.eliminate_zeros()
+        return matrix
+    matrix = np.zeros(shape)
+    matrix[starts, ends] = weights
+    return matrix
+
+
+def create_adjacency_matrix(length1: int, length2: int, edges: list, suspicion_or_contribution: dict, type: Type, as_sparse: bool = False):
     """
     Creates an adjacency matrix from edge list and normalizes it.
 
@@ -26,90 +66,61 @@ def create_adjacency_matrix(length1: int, length2: int, edges: list, suspicion_o
     - edges (list of tuples): List of edges represented as tuples (start, end).
     - suspicion_or_contribution (dict): The suspicious data for line or contribution data for test cases
     - type (Type): The type of data (statement, passed test case or failed test case)
+    - as_sparse (bool): True to return a sparse.csr_matrix instead of a dense np.array.
 
     Returns:
-    - np.array: A normalized adjacency matrix.
+    - np.array or sparse.csr_matrix: A normalized adjacency matrix.
     """
-    matrix = np.zeros((length1, length2))
-    for start, end in edges:
-        if type == Type.STATEMENT:
-            matrix[start][end] = suspicion_or_contribution[f"{end}"]["suspicion"]
-        elif type == Type.PASSED_TEST:
-            matrix[start][end] = suspicion_or_contribution["rtest"][f"{end}"]
-        elif type == Type.FAILED_TEST:
-            matrix[start][end] = suspicion_or_contribution["ftest"][f"{end}"]
-    non_zero_elements = matrix[matrix > 0]
-    if non_zero_elements.size == 0:  # Check if there are any non-zero elements
-        return matrix  # Return the original matrix if all elements are zero
-
-    min_val = non_zero_elements.min()
-    max_val = non_zero_elements.max()
-    # Apply min-max normalization only on non-zero elements
-    for i in range(length1):
-        for j in range(length2):
-            if matrix[i][j] > 0:  # Normalize only non-zero elements
-                matrix[i][j] = (matrix[i][j] - min_val) / \
-                    (max_val - min_val) if max_val != min_val else 0.5
-    return matrix
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    # The weight of an edge only depends on its end, so it is looked up once per distinct end
+    unique_ends, inverse = np.unique(edges[:, 1], return_inverse=True)
+    if type == Type.STATEMENT:
+        end_weights = [suspicion_or_contribution[f"{end}"]["suspicion"] for end in unique_ends.tolist()]
+    elif type == Type.PASSED_TEST:
+        end_weights = [suspicion_or_contribution["rtest"][f"{end}"] for end in unique_ends.tolist()]
+    elif type == Type.FAILED_TEST:
+        end_weights = [suspicion_or_contribution["ftest"][f"{end}"] for end in unique_ends.tolist()]
+    weights = np.asarray(end_weights, dtype=float)[inverse.reshape(-1)]
+    return normalized_edges_to_matrix(edges[:, 0], edges[:, 1], weights, (length1, length2), as_sparse)
 
 
 def integrate_matrices(method_to_method, method_to_lines, lines_to_passed_test_cases, lines_to_failed_test_cases,
                        num_methods, num_lines, num_r_tests, num_f_tests):
     """
-    Integrates various matrices into two larger matrices for different test types.
+    Integrates various matrices into two larger sparse matrices for different test types.
 
     Args:
-    - method_to_method (np.array): Adjacency matrix for method-method relationships.
-    - method_to_lines (np.array): Adjacency matrix for method-lines relationships.
-    - lines_to_tests (np.array): Adjacency matrix for lines-tests relationships.
-    - method_to_tests (np.array): Adjacency matrix for method-tests relationships.
+    - method_to_method (np.array or sparse matrix): Adjacency matrix for method-method relationships.
+    - method_to_lines (np.array or sparse matrix): Adjacency matrix for method-lines relationships.
+    - lines_to_passed_test_cases (np.array or sparse matrix): Adjacency matrix for lines-passed tests relationships.
+    - lines_to_failed_test_cases (np.array or sparse matrix): Adjacency matrix for lines-failed tests relationships.
     - num_methods (int): Number of methods.
     - num_lines (int): Number of lines.
     - num_r_tests (int): Number of r tests.
     - num_f_tests (int): Number of f tests.
 
     Returns:
-    - matrix_p: The graph of the relationship of method, lines and passed test cases
-    - matrix_f: The graph of the relationship of method, lines and failed test cases
+    - matrix_p (sparse.csr_matrix): The graph of the relationship of method, lines and passed test cases
+    - matrix_f (sparse.csr_matrix): The graph of the relationship of method, lines and failed test cases
     """
-
-    total_len = num_methods + num_lines
-    matrix_p_len = total_len + num_r_tests
-    matrix_f_len = total_len + num_f_tests
-
-    matrix_p = np.zeros((matrix_p_len, matrix_p_len))
-    matrix_f = np.zeros((matrix_f_len, matrix_f_len))
-
-    # Method to Method
-    matrix_p[:num_methods, :num_methods] = method_to_method
-    matrix_f[:num_methods, :num_methods] = method_to_method
-
-    # Method to Lines
-    matrix_p[:num_methods, num_methods:num_methods +
-             num_lines] = method_to_lines
-    matrix_p[num_methods:num_methods + num_lines,
-             :num_methods] = method_to_lines.T
-
-    matrix_f[:num_methods, num_methods:num_methods +
-             num_lines] = method_to_lines
-    matrix_f[num_methods:num_methods + num_lines,
-             :num_methods] = method_to_lines.T
-
-    # Lines to R Tests
-    matrix_p[num_methods:num_methods + num_lines,
-             num_methods + num_lines:] = lines_to_passed_test_cases
-    matrix_p[num_methods + num_lines:, num_methods: num_methods +
-             num_lines] = lines_to_passed_test_cases.T
-    # Lines to F Tests
-    matrix_f[num_methods:num_methods + num_lines,
-             num_methods + num_lines:] = lines_to_failed_test_cases
-    matrix_f[num_methods + num_lines:, num_methods: num_methods +
-             num_lines] = lines_to_failed_test_cases.T
-
+    method_to_method = sparse.csr_matrix(method_to_method, shape=(num_methods, num_methods))
+    method_to_lines = sparse.csr_matrix(method_to_lines, shape=(num_methods, num_lines))
+    lines_to_passed_test_cases = sparse.csr_matrix(lines_to_passed_test_cases, shape=(num_lines, num_r_tests))
+    lines_to_failed_test_cases = sparse.csr_matrix(lines_to_failed_test_cases, shape=(num_lines, num_f_tests))
+
+    # Method to Method, Method to Lines, Lines to R/F Tests and the reverse edges
+    matrix_p = sparse.bmat([[method_to_method, method_to_lines, None],
+                            [method_to_lines.T, None, lines_to_passed_test_cases],
+                            [None, lines_to_passed_test_cases.T, None]], format='csr')
+    matrix_f = sparse.bmat([[method_to_method, method_to_lines, None],
+                            [method_to_lines.T, None, lines_to_failed_test_cases],
+                            [None, lines_to_failed_test_cases.T, None]], format='csr')
+    matrix_p.eliminate_zeros()
+    matrix_f.eliminate_zeros()
     return matrix_p, matrix_f
 
 
-def process_method_to_method_matrix(data: list, length: int, method_suspicion: dict) -> np.array:
+def process_method_to_method_matrix(data: list, length: int, method_suspicion: dict, as_sparse: bool = False):
     """
     Processes method to method data.
     The weight of edge in method to method matrix is the sum of 2 adjacent method nodes after normalization.
@@ -137,33 +148,134 @@ def process_method_to_method_matrix(data: list, length: int, method_suspicion: d
     - data (list): Method to method data.
     - length (int): The length of the methods.
     - method_suspicion (dict): The suspiciousness for method and method
+    - as_sparse (bool): True to return a sparse.csr_matrix instead of a dense np.array.
 
     Returns:
-    - np.array: A method to method matrix.
+    - np.array or sparse.csr_matrix: A method to method matrix.
     """
-    matrix = np.zeros((length, length))
-    # min_sus = min(method_suspicion.values(),
-    #               key=lambda x: x["suspicion"])["suspicion"]
-    # max_sus = max(method_suspicion.values(),
-    #               key=lambda x: x["suspicion"])["suspicion"]
-    for index, targets in data:
-        for target in targets:
-            matrix[index][target] = method_suspicion[f"{index}"]["suspicion"] + \
-                method_suspicion[f"{target}"]["suspicion"]
-    # Find non-zero minimum and maximum values for normalization
-    non_zero_elements = matrix[matrix > 0]
-    if non_zero_elements.size == 0:  # Check if there are any non-zero elements
-        return matrix  # Return the original matrix if all elements are zero
-
-    min_val = non_zero_elements.min()
-    max_val = non_zero_elements.max()
-    # Apply min-max normalization only on non-zero elements
-    for i in range(length):
-        for j in range(length):
-            if matrix[i][j] > 0:  # Normalize only non-zero elements
-                matrix[i][j] = (matrix[i][j] - min_val) / \
-                    (max_val - min_val) if max_val != min_val else 0.5
-    return matrix
+    starts = np.asarray([index for index, targets in data for _ in targets], dtype=np.int64)
+    ends = np.asarray([target for _, targets in data for target in targets], dtype=np.int64)
+    # Look up the suspiciousness once per distinct method and gather it for every edge
+    unique_methods, inverse = np.unique(np.concatenate([starts, ends]), return_inverse=True)
+    suspicion = np.asarray([method_suspicion[f"{method}"]["suspicion"]
+                            for method in unique_methods.tolist()], dtype=float)[inverse.reshape(-1)]
+    weights = suspicion[:len(starts)] + suspicion[len(starts):]
+    return normalized_edges_to_matrix(starts, ends, weights, (length, length), as_sparse)
+
+
+def load_call_graph(dataset_name) -> dict:
+    """
+    Reads the call graph of every project of a dataset from data/call_graph.
+
+    Returns:
+    - dict: Maps every project name to its list of method to method edges.
+    """
+    method2method_data = {}
+    with open(f'data/call_graph/{dataset_name}_M2M.txt', 'r') as call_graph:
+        method2method_file = call_graph.readlines()
+    for method2method in method2method_file:
+        project_name = method2method.split(' * ')[0]
+        method2method_list = eval(method2method.split(' * ')[1])
+        method2method_data[project_name] = method2method_list
+    return method2method_data
+
+
+def build_project_graphs(dataset_name, data, formulas, method2method_list):
+    """
+    Builds the graphs with passed and failed test cases of a project for every formula and writes them to
+    data/graph. method2method_list holds the call graph edges of the project.
+    """
+    project_name = data['proj']
+    methods = data['methods']
+    lines = data['lines']
+    mutation = data['mutation']
+    ftest = data['ftest']
+    rtest = data['rtest']
+
+    len_methods = len(data['methods'])
+    len_lines = len(data['lines'])
+    len_mutation = len(data['mutation'])
+    len_ftest = len(data['ftest'])
+    len_rtest = len(data['rtest'])
+    logging.info(f"Begin processing {project_name}")
+    logging.info(f"Number of methods: {len_methods}")
+    logging.info(f"Number of lines: {len_lines}")
+    logging.info(f"Number of mutation: {len_mutation}")
+    logging.info(f"Number of rtest(passed test cases): {len_rtest}")
+    logging.info(f"Number of ftest(failed test cases): {len_ftest}")
+    len_total = len_methods + len_lines + len_mutation + len_rtest + len_ftest
+    logging.info(f"Get vertex information of {project_name}")
+
+    method2method = {}
+    method2lines = data['edge2']
+    mutation2lines = data['edge12']
+    lines2rtest_original = data['edge10']
+    lines2ftest_original = data['edge']
+    mutation2rtest = data['edge13']
+    mutation2ftest = data['edge14']
+
+    line_set, rtest_set, ftest_set = set(lines.values()), set(rtest.values()), set(ftest.values())
+    lines2rtest, lines2ftest = [], []
+    for [line, rt] in lines2rtest_original:
+        if line in line_set and rt in rtest_set:
+            lines2rtest.append([line, rt])
+    for [line, ft] in lines2ftest_original:
+        if line in line_set and ft in ftest_set:
+            lines2ftest.append([line, ft])
+
+    logging.info(f"Get edge information of {project_name}")
+    # The contribution data is shared by all formulas
+    contribution_data = load_artifact(artifact_file(f'data/contribution/{dataset_name}/{project_name}.json'))
+    logging.info("Load contribution data")
+
+    for formula in formulas:
+        with profile('graph', dataset=dataset_name, project=project_name, formula=formula) as record:
+            sbfl_data = load_artifact(artifact_file(
+                f'data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json'))
+            logging.info("Load SBFL suspiciousness")
+
+            method_suspicion = sbfl_data["method suspicion"]
+            line_suspicion = sbfl_data["line suspicion"]
+
+            # method-method 矩阵 建立
+            method2method_matrix = process_method_to_method_matrix(
+                method2method_list, len_methods, method_suspicion, as_sparse=True)
+            # method-lines 矩阵 建立
+            method2lines_matrix = create_adjacency_matrix(
+                len_methods, len_lines, method2lines, line_suspicion, Type.STATEMENT, as_sparse=True)
+
+            # lines-rtest 矩阵 建立
+            lines2rtest_matrix = create_adjacency_matrix(
+                len_lines, len_rtest, lines2rtest, contribution_data, Type.PASSED_TEST, as_sparse=True)
+
+            # line-ftest 矩阵 建立
+            lines2ftest_matrix = create_adjacency_matrix(
+                len_lines, len_ftest, lines2ftest, contribution_data, Type.FAILED_TEST, as_sparse=True)
+
+            logging.info("Integrating matrices")
+            graph_with_passed_test_cases, graph_with_failed_test_cases = integrate_matrices(method2method_matrix, method2lines_matrix, lines2rtest_matrix,
+                                                                                            lines2ftest_matrix, len_methods, len_lines, len_rtest, len_ftest)
+            record.update(nodes=graph_with_passed_test_cases.shape[0] + graph_with_failed_test_cases.shape[0],
+                          edges=graph_with_passed_test_cases.nnz + graph_with_failed_test_cases.nnz)
+
+            graph_with_passed_test_cases_file_path = f'./data/graph/passed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix'
+            graph_with_failed_test_cases_file_path = f'./data/graph/failed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix'
+
+            # 为 graph_with_passed_test_cases_file_path 检查文件是否已存在
+            if not all(map(os.path.isfile, sparse_matrix_files(graph_with_passed_test_cases_file_path))):
+                save_sparse_matrix(graph_with_passed_test_cases, graph_with_passed_test_cases_file_path)
+            else:
+                logging.info(
+                    f"File {graph_with_passed_test_cases_file_path} already exists. Skipping...")
+
+            # 为 graph_with_failed_test_cases_file_path 检查文件是否已存在
+            if not all(map(os.path.isfile, sparse_matrix_files(graph_with_failed_test_cases_file_path))):
+                save_sparse_matrix(graph_with_failed_test_cases, graph_with_failed_test_cases_file_path)
+            else:
+                logging.info(
+                    f"File {graph_with_failed_test_cases_file_path} already exists. Skipping...")
+
+            logging.info(f"Process {project_name} finished")
 
 
 if __name__ == '__main__':
@@ -173,113 +285,8 @@ if __name__ == '__main__':
     method2method_data = {}
     logging.info("Converting call graph to method to method in-memory matrix")
     for dataset_name in dataset:
-        with open(f'data/call_graph/{dataset_name}_M2M.txt', 'r') as call_graph:
-            method2method_file = call_graph.readlines()
-        for method2method in method2method_file:
-            project_name = method2method.split(' * ')[0]
-            method2method_list = eval(method2method.split(' * ')[1])
-            method2method_data[project_name] = method2method_list
+        method2method_data.update(load_call_graph(dataset_name))
         logging.info("Converting finished")
 
-        with open(f'pkl_data/{dataset_name}.json', 'r') as rf:
-            datas = json.load(rf)
-            logging.info("Load relationship from JSON file")
-
-        for data in datas:
-            project_name = data['proj']
-            methods = data['methods']
-            lines = data['lines']
-            mutation = data['mutation']
-            ftest = data['ftest']
-            rtest = data['rtest']
-
-            len_methods = len(data['methods'])
-            len_lines = len(data['lines'])
-            len_mutation = len(data['mutation'])
-            len_ftest = len(data['ftest'])
-            len_rtest = len(data['rtest'])
-            logging.info(f"Begin processing {project_name}")
-            logging.info(f"Number of methods: {len_methods}")
-            logging.info(f"Number of lines: {len_lines}")
-            logging.info(f"Number of mutation: {len_mutation}")
-            logging.info(f"Number of rtest(passed test cases): {len_rtest}")
-            logging.info(f"Number of ftest(failed test cases): {len_ftest}")
-            len_total = len_methods + len_lines + len_mutation + len_rtest + len_ftest
-            logging.info(f"Get vertex information of {project_name}")
-
-            method2method = {}
-            method2lines = data['edge2']
-            mutation2lines = data['edge12']
-            lines2rtest_original = data['edge10']
-            lines2ftest_original = data['edge']
-            mutation2rtest = data['edge13']
-            mutation2ftest = data['edge14']
-            this_method2method_data = method2method_data[project_name]
-
-            lines2rtest, lines2ftest = [], []
-            for [line, rt] in lines2rtest_original:
-                if line in lines.values() and rt in rtest.values():
-                    lines2rtest.append([line, rt])
-            for [line, ft] in lines2ftest_original:
-                if line in lines.values() and ft in ftest.values():
-                    lines2ftest.append([line, ft])
-
-            logging.info(f"Get edge information of {project_name}")
-            for formula in formulas:
-                with open(f'data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json', 'r') as rf:
-                    sbfl_data = json.load(rf)
-                    logging.info("Load SBFL suspiciousness from JSON file")
-                with open(f'data/contribution/{dataset_name}/{project_name}.json', 'r') as rf:
-                    contribution_data = json.load(rf)
-                    logging.info("Load contribution data from JSON file")
-
-                method_suspicion = sbfl_data["method suspicion"]
-                line_suspicion = sbfl_data["line suspicion"]
-
-                # method-method 矩阵 建立
-                method2method_matrix = process_method_to_method_matrix(
-                    this_method2method_data, len_methods, method_suspicion)
-                # method-lines 矩阵 建立
-                method2lines_matrix = create_adjacency_matrix(
-                    len_methods, len_lines, method2lines, line_suspicion, Type.STATEMENT)
-
-                # lines-rtest 矩阵 建立
-                lines2rtest_matrix = create_adjacency_matrix(
-                    len_lines, len_rtest, lines2rtest, contribution_data, Type.PASSED_TEST)
-
-                # line-ftest 矩阵 建立
-                lines2ftest_matrix = create_adjacency_matrix(
-                    len_lines, len_ftest, lines2ftest, contribution_data, Type.FAILED_TEST)
-
-                logging.info("Integrating matrices")
-                graph_with_passed_test_cases, graph_with_failed_test_cases = integrate_matrices(method2method_matrix, method2lines_matrix, lines2rtest_matrix,
-                                                                                                lines2ftest_matrix, len_methods, len_lines, len_rtest, len_ftest)
-
-                graph_with_passed_test_cases_file_path = f'./data/graph/passed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix.pkl'
-                graph_with_failed_test_cases_file_path = f'./data/graph/failed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix.pkl'
-
-                # 为 graph_with_passed_test_cases_file_path 检查文件是否已存在
-                if not os.path.isfile(graph_with_passed_test_cases_file_path):
-                    directory = os.path.dirname(
-                        graph_with_passed_test_cases_file_path)
-                    if not os.path.exists(directory):
-                        os.makedirs(directory, exist_ok=True)
-                    with open(graph_with_passed_test_cases_file_path, 'wb') as wf:
-                        pickle.dump(graph_with_passed_test_cases, wf)
-                else:
-                    logging.info(
-                        f"File {graph_with_passed_test_cases_file_path} already exists. Skipping...")
-
-                # 为 graph_with_failed_test_cases_file_path 检查文件是否已存在
-                if not os.path.isfile(graph_with_failed_test_cases_file_path):
-                    directory = os.path.dirname(
-                        graph_with_failed_test_cases_file_path)
-                    if not os.path.exists(directory):
-                        os.makedirs(directory, exist_ok=True)
-                    with open(graph_with_failed_test_cases_file_path, 'wb') as wf:
-                        pickle.dump(graph_with_failed_test_cases, wf)
-                else:
-                    logging.info(
-                        f"File {graph_with_failed_test_cases_file_path} already exists. Skipping...")
-
-                logging.info(f"Process {project_name} finished")
+        for data in iterate_projects(dataset_name):
+            build_project_graphs(dataset_name, data, formulas, method2method_data[data['proj']])
\ No newline at end of file
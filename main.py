@@ -1,6 +1,11 @@
+import argparse
+import os
 import subprocess
 import numpy as np
-from tqdm import tqdm
+
+from pagerank import Personalization
+from parallel import run_pipeline
+from util import Formula
 
 
 def run_script(script_name, args=[]):
@@ -10,27 +15,40 @@ def run_script(script_name, args=[]):
 
 
 if __name__ == "__main__":
-    # Run the first three scripts
-    run_script('preprocess.py')
-    run_script('graph.py')
-    run_script('pagerank.py')
-
-    # Parameters for mbfl.py
-    ratios = np.arange(0, 1.2, 0.2)
-
-    # Run mbfl.py with different combinations of parameters
-    total_iterations = len(ratios) ** 3
-    with tqdm(total=total_iterations, desc='Running mbfl.py', unit='iter') as pbar:
-        for a in ratios:
-            for b in ratios:
-                for c in ratios:
-                    a = round(a, 1)
-                    b = round(b, 1)
-                    c = round(c, 1)
-                    run_script('mbfl.py', [str(a), str(b), str(c)])
-                    pbar.update(1)
-
-    # Finally, run the evaluation script
-    run_script('evaluation.py')
+    parser = argparse.ArgumentParser(
+        description='Run the whole pipeline.')
+    parser.add_argument('--search', action='store_true',
+                        help='Search the ratios in steps of 0.05 by successive halving (search.py) instead of sweeping the grid')
+    parser.add_argument('--mtp-budget', type=float, default=1.0,
+                        help='Highest current MTP / original MTP of the searched ratios')
+    parser.add_argument('--statement-weights', default='difference', choices=['difference', 'personalized_difference'],
+                        help='PageRank result used to select statements')
+    parser.add_argument('--personalization', default='NONE', choices=[member.name for member in Personalization],
+                        help='Seeds of the personalized PageRank (TESTS or SBFL), needed by --statement-weights personalized_difference')
+    args = parser.parse_args()
+    if args.statement_weights == 'personalized_difference' and args.personalization == 'NONE':
+        parser.error('--statement-weights personalized_difference needs --personalization TESTS or SBFL')
+    personalization = Personalization[args.personalization]
+
+    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
+    dataset = ['Lang']
+    formulas = [formula for _, formula in Formula.__members__.items()]
+    # Number of processes used by every stage
+    workers = os.cpu_count() or 1
+
+    if args.search:
+        # Run preprocess, graph and pagerank, then only evaluate the most promising ratios of a fine grid
+        run_pipeline(dataset, formulas, ['preprocess', 'graph', 'pagerank'], workers, personalization=personalization)
+        run_script('search.py', ['--step', '0.05', '--mtp-budget', str(args.mtp_budget),
+                                 '--statement-weights', args.statement_weights])
+    else:
+        # Run preprocess, graph and pagerank, then the reduction and MBFL of mbfl.py with every
+        # combination of parameters from 0 to 1 in steps of 0.2, every project being loaded once
+        ratios = np.arange(0, 1.2, 0.2)
+        run_pipeline(dataset, formulas, ['preprocess', 'graph', 'pagerank', 'mbfl'], workers, ratios,
+                     args.statement_weights, personalization=personalization)
+
+        # Finally, run the evaluation script
+        run_script('evaluation.py')
 
     print("All processes completed successfully.")
@@ -1,46 +1,44 @@
 import argparse
-import heapq
-import json
 import logging
 import random
 
+import numpy as np
+
+from profiler import profile
 from util import *
 
 random.seed(0)
+# The PageRank of the test cases and statements is rounded before ranking them, so that the scores only differing
+# by floating point noise (e.g. of the sparse PageRank) are ties broken by index like the others
+RANKING_DECIMALS = 12
+
 
-# 创建命令行参数解析器
-parser = argparse.ArgumentParser(
-    description='Reduce statements and test cases.')
-parser.add_argument('selected_statements_ratio', type=float,
-                    help='Ratio for selecting statements to generate mutant (e.g. 0.7 for 70%, \
-                            means that we should select 70% most suspected statement to generate mutant, \
-                            while the 30% \less suspected ones should generate less mutant)')
-parser.add_argument('reduced_test_cases_ratio', type=float,
-                    help='Ratio for reducing passed test cases (e.g. 0.7 for 70%, \
-                        means that we should reserve 70% passed tested cases with higher contribution, \
-                            while just throw away the 30% \less contributed ones.)')
-parser.add_argument('reduced_mutant_ratio', type=float,
-                    help='Radio for selected statements to generate mutant (e.g. 0.7 for 70%, \
-                        means that for selected less suspected statement, we should reserve 70% mutant for them \
-                            while reduce 30% mutant)')
-args = parser.parse_args()
-
-
-def reduce_passed_test_cases(data, passed_test_cases_weights, percentage: float) -> list:
+def rank_passed_test_cases(passed_test_cases_weights) -> list:
     """
-    Get the list of passed test cases after reduction
+    Get the passed test cases from the highest to the lowest PageRank, ties broken like heapq.nlargest.
+    The top N of any ratio is a prefix of this list.
     """
     num_of_methods = passed_test_cases_weights["passed_test_cases_lengths"]["methods"]
     num_of_statements = passed_test_cases_weights["passed_test_cases_lengths"]["statements"]
     num_of_rtest = passed_test_cases_weights["passed_test_cases_lengths"]["rtest"]
+    # Only the slice of the passed test cases is read from the (possibly memory-mapped) vector
+    results = np.round(np.asarray(passed_test_cases_weights["passed_test_cases_results"][
+        num_of_methods + num_of_statements:num_of_methods + num_of_statements + num_of_rtest], dtype=float),
+        RANKING_DECIMALS).tolist()
+    heap = [(result, i) for i, result in enumerate(results)]
+    return [i for _, i in sorted(heap, reverse=True)]
+
+
+def reduce_passed_test_cases(data, passed_test_cases_weights, percentage: float, ranking=None) -> list:
+    """
+    Get the list of passed test cases after reduction. ranking is the result of rank_passed_test_cases,
+    computed here when not given.
+    """
     N = int(
         passed_test_cases_weights["passed_test_cases_lengths"]["rtest"] * percentage)
-    heap = [(passed_test_cases_weights["passed_test_cases_results"][i], i - (num_of_methods + num_of_statements)) for i in range(
-        num_of_methods + num_of_statements, num_of_methods + num_of_statements + num_of_rtest)]
-
-    # Find the top N largest values using the heap
-    largest_values = heapq.nlargest(N, heap)
-    top_n_indices_heap = [i for _, i in largest_values]
+    if ranking is None:
+        ranking = rank_passed_test_cases(passed_test_cases_weights)
+    top_n_indices_heap = set(ranking[:N])
     passed_test_cases_reduced = []
     for passed_test_case in data:
         if passed_test_case in top_n_indices_heap:
@@ -50,17 +48,22 @@ def reduce_passed_test_cases(data, passed_test_cases_weights, percentage: float)
     return passed_test_cases_reduced
 
 
-def reduce_passed_test_cases_based_on_contribution(data, contribution_result, percentage: float) -> list:
+def rank_passed_test_cases_based_on_contribution(contribution_result) -> list:
     """
-    Get the list of passed test cases after reduction based on contribution
+    Get the passed test cases from the highest to the lowest contribution, ties broken like heapq.nlargest
     """
-    rtest = contribution_result.keys()
-    N = int(len(rtest) * percentage)
-    heap = [(contribution_result[i], int(i)) for i in rtest]
+    heap = [(contribution_result[i], int(i)) for i in contribution_result.keys()]
+    return [i for _, i in sorted(heap, reverse=True)]
+
 
-    # Find the top N largest values using the heap
-    largest_values = heapq.nlargest(N, heap)
-    top_n_indices_heap = [i for _, i in largest_values]
+def reduce_passed_test_cases_based_on_contribution(data, contribution_result, percentage: float, ranking=None) -> list:
+    """
+    Get the list of passed test cases after reduction based on contribution
+    """
+    N = int(len(contribution_result) * percentage)
+    if ranking is None:
+        ranking = rank_passed_test_cases_based_on_contribution(contribution_result)
+    top_n_indices_heap = set(ranking[:N])
     passed_test_cases_reduced = []
     for passed_test_case in data:
         if passed_test_case in top_n_indices_heap:
@@ -70,20 +73,28 @@ def reduce_passed_test_cases_based_on_contribution(data, contribution_result, pe
     return passed_test_cases_reduced
 
 
-def reduce_statements(lines, statement_weights, percentage: float) -> list:
+def rank_statements(statement_weights) -> list:
     """
-    Get the list of statement after reduction
+    Get the statements from the highest to the lowest PageRank difference, ties broken like heapq.nlargest
     """
     num_of_methods = statement_weights["failed_passed_diff_lengths"]["methods"]
     num_of_statements = statement_weights["failed_passed_diff_lengths"]["statements"]
+    # Only the slice of the statements is read from the (possibly memory-mapped) vector
+    results = np.round(np.asarray(statement_weights["failed_passed_diff_results"][
+        num_of_methods:num_of_methods + num_of_statements], dtype=float), RANKING_DECIMALS).tolist()
+    heap = [(result, i) for i, result in enumerate(results)]
+    return [i for _, i in sorted(heap, reverse=True)]
+
+
+def reduce_statements(lines, statement_weights, percentage: float, ranking=None) -> list:
+    """
+    Get the list of statement after reduction
+    """
     N = int(statement_weights["failed_passed_diff_lengths"]
             ["statements"] * percentage)
-    heap = [(statement_weights["failed_passed_diff_results"][i], i - num_of_methods) for i in range(
-        num_of_methods, num_of_methods + num_of_statements)]
-
-    # Find the top N largest values using the heap
-    largest_values = heapq.nlargest(N, heap)
-    top_n_indices_heap = [i for _, i in largest_values]
+    if ranking is None:
+        ranking = rank_statements(statement_weights)
+    top_n_indices_heap = set(ranking[:N])
     statements_reduced = []
     for line in lines:
         if line in top_n_indices_heap:
@@ -93,7 +104,7 @@ def reduce_statements(lines, statement_weights, percentage: float) -> list:
     return statements_reduced
 
 
-def reduce_statements_based_on_random(lines, percentage: float) -> list:
+def reduce_statements_based_on_random(lines, percentage: float, rng=random) -> list:
     """
     Get the list of statement after reduction
     """
@@ -101,7 +112,7 @@ def reduce_statements_based_on_random(lines, percentage: float) -> list:
     lines = list(lines)
     # Create a list of indices for all statements
     # Randomly select N indices
-    random_indices = random.sample(lines, N)
+    random_indices = rng.sample(lines, N)
 
     # Get the statements corresponding to the randomly selected indices
     statements_reduced = [lines[i] for i in random_indices]
@@ -109,174 +120,310 @@ def reduce_statements_based_on_random(lines, percentage: float) -> list:
     return statements_reduced
 
 
-def refactor_data(statements_reduced, passed_test_case_reduced, mutant2line, mutant2rtest, mutant2ftest, prob):
-    mutant2line_reduced, mutant2rtest_reduced, mutant2ftest_reduced, mutant_list = {}, {}, {}, []
-    for [mutant, line] in mutant2line:
-        if line in statements_reduced:
-            mutant2line_reduced[mutant] = line
-            mutant_list.append(mutant)
-        else:
-            rand = random.randint(0, 99)
-            if rand < prob * 100:
-                mutant2line_reduced[mutant] = line
-                mutant_list.append(mutant)
-
-    for [mutant, rtest] in mutant2rtest:
-        if mutant in mutant_list and rtest in passed_test_case_reduced:
-            if mutant not in mutant2rtest_reduced:
-                mutant2rtest_reduced[mutant] = [rtest]
-            else:
-                mutant2rtest_reduced[mutant].append(rtest)
-
-    for [mutant, ftest] in mutant2ftest:
-        if mutant in mutant_list:
-            if mutant not in mutant2ftest_reduced:
-                mutant2ftest_reduced[mutant] = [ftest]
-            else:
-                mutant2ftest_reduced[mutant].append(ftest)
-
-    # print("previous mutant2line", mutant2line)
-    # print("reduced mutant2line", mutant2line_reduced)
-    # print("previous mutant2rtest", mutant2rtest)
-    # print("reduced mutant2rtest", mutant2rtest_reduced)
-    # print("reduced mutant2ftest", mutant2ftest_reduced)
-    # print("reduced mutant_list", mutant_list)
+def membership(values, members):
+    """
+    Vectorized `value in members` for integer ids: the members are indexed in a boolean mask, so every
+    lookup is a single array access.
+
+    Args:
+    - values (np.array): The ids to look up.
+    - members (iterable): The ids of the set.
+
+    Returns:
+    - np.array: A boolean array telling for every value whether it is a member.
+    """
+    members = np.fromiter(members, dtype=np.int64)
+    size = max(int(values.max(initial=-1)), int(members.max(initial=-1))) + 1
+    mask = np.zeros(size, dtype=bool)
+    mask[members] = True
+    return mask[values]
+
+
+def group_by_first_column(pairs):
+    """
+    Groups [key, value] pairs into {key: [values]}, with the keys and the values in the order of the pairs.
+    """
+    if len(pairs) == 0:
+        return {}
+    order = np.argsort(pairs[:, 0], kind='stable')
+    keys, starts = np.unique(pairs[order, 0], return_index=True)
+    groups = np.split(pairs[order, 1], starts[1:])
+    first_occurrences = order[starts]
+    return {int(keys[index]): groups[index].tolist() for index in np.argsort(first_occurrences, kind='stable')}
+
+
+def reduce_mutants(statements_reduced, mutant2line, prob, rng=random):
+    """
+    Keeps the mutants of the selected statements, and every mutant of the other statements with probability prob.
+
+    The random numbers are drawn one by one for the mutants of the statements that are not selected, in the
+    order of mutant2line, like the original loop did, so the same mutants are kept for the same seed. rng is
+    the random module or a random.Random instance.
+
+    Returns:
+    - np.array: A boolean mask of the kept mutant2line edges.
+    """
+    mutant2line = np.asarray(mutant2line, dtype=np.int64).reshape(-1, 2)
+    kept = membership(mutant2line[:, 1], statements_reduced)
+    not_selected = np.flatnonzero(~kept)
+    draws = np.array([rng.randint(0, 99) for _ in range(not_selected.size)], dtype=np.int64)
+    kept[not_selected[draws < prob * 100]] = True
+    return kept
+
+
+def refactor_data(statements_reduced, passed_test_case_reduced, mutant2line, mutant2rtest, mutant2ftest, prob, rng=random):
+    """
+    Keeps the mutants given by reduce_mutants, then keeps the kill edges of the kept mutants (only with the
+    selected passed test cases). The edges are filtered with boolean masks.
+    """
+    mutant2line = np.asarray(mutant2line, dtype=np.int64).reshape(-1, 2)
+    mutant2rtest = np.asarray(mutant2rtest, dtype=np.int64).reshape(-1, 2)
+    mutant2ftest = np.asarray(mutant2ftest, dtype=np.int64).reshape(-1, 2)
+
+    kept = reduce_mutants(statements_reduced, mutant2line, prob, rng)
+    kept_edges = mutant2line[kept]
+    mutant_list = kept_edges[:, 0].tolist()
+    mutant2line_reduced = dict(zip(mutant_list, kept_edges[:, 1].tolist()))
+
+    mutant2rtest_reduced = group_by_first_column(mutant2rtest[membership(mutant2rtest[:, 0], mutant_list) &
+                                                              membership(mutant2rtest[:, 1], passed_test_case_reduced)])
+    mutant2ftest_reduced = group_by_first_column(mutant2ftest[membership(mutant2ftest[:, 0], mutant_list)])
     return mutant2line_reduced, mutant2rtest_reduced, mutant2ftest_reduced, mutant_list,
 
 
+def load_project_inputs(dataset_name, data, formulas, statement_weights='difference'):
+    """
+    Loads the SBFL coverage, the contribution and the PageRank results of a project once, and ranks the
+    statements and the passed test cases, so that every ratio only takes a prefix of the rankings.
+
+    Args:
+    - dataset_name (str): The dataset of the project.
+    - data (dict): The project record of pkl_data.
+    - formulas (list): The formulas to load the PageRank results of.
+    - statement_weights (str): "difference" or "personalized_difference", see pagerank.py.
+
+    Returns:
+    - dict: The loaded results and rankings, see run_project.
+    """
+    project_name = data['proj']
+    # The coverage of the lines is the same in the SBFL result of every formula,
+    # and the contribution of the test cases is stored once per project
+    sbfl_result = load_artifact(artifact_file(
+        f'./data/sbfl/{dataset_name}/{Formula.get_formula_name(formulas[0])}/{project_name}.json'))
+    logging.info("Load SBFL coverage")
+
+    contribution_result = load_artifact(artifact_file(f'./data/contribution/{dataset_name}/{project_name}.json'))
+    logging.info("Load contribution")
+
+    inputs = {
+        "line suspicion": sbfl_result["line suspicion"],
+        "contribution": contribution_result["rtest"],
+        "contribution ranking": rank_passed_test_cases_based_on_contribution(contribution_result["rtest"]),
+        "difference": {},
+        "statement ranking": {},
+        "passed test cases": {},
+        "passed test case ranking": {},
+        # The kills of all the mutants, masked by every reduction
+        "kill matrix": kill_matrix(data["edge12"], data["edge13"], data["edge14"], sbfl_result["line suspicion"]),
+    }
+    # The PageRank vectors are memory-mapped, only their statements and passed test cases are read
+    lengths = {"methods": len(data['methods']), "statements": len(data['lines']),
+               "rtest": len(data['rtest']), "ftest": len(data['ftest'])}
+    for formula in formulas:
+        difference = load_page_rank_result(page_rank_file(
+            f'./data/page_rank/{statement_weights}/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json'),
+            "failed_passed_diff", lengths)
+        logging.info("Load difference")
+
+        passed_test_cases = load_page_rank_result(page_rank_file(
+            f'./data/page_rank/passed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json'),
+            "passed_test_cases", lengths)
+        logging.info("Load passed test case")
+
+        inputs["difference"][formula] = difference
+        inputs["statement ranking"][formula] = rank_statements(difference)
+        inputs["passed test cases"][formula] = passed_test_cases
+        inputs["passed test case ranking"][formula] = rank_passed_test_cases(passed_test_cases)
+    return inputs
+
+
+def reduced_MBFL(inputs, line_list, statements_reduced, passed_test_cases_reduced, prob, formulas, rng=random):
+    """
+    Reduces the mutants with reduce_mutants and runs MBFL on them for every formula. The counts are masks of
+    the kill matrix of the project (see util.MBFL_stats_by_masks), computed once for all the formulas.
+
+    Returns:
+    - int: The number of kept mutants.
+    - dict: Maps every formula to the (line suspicion, mutant suspicion) pair returned by MBFL.
+    """
+    kills = inputs["kill matrix"]
+    kept = reduce_mutants(statements_reduced, kills["mutant2line"], prob, rng)
+    mutant_stats = MBFL_stats_by_masks(kills, kept, passed_test_cases_reduced)
+    return int(kept.sum()), {formula: MBFL_scores(formula, kills["mutants2lines"], line_list, mutant_stats)
+                             for formula in formulas}
+
+
+def save_result(technique, result, file_path):
+    """
+    Writes a result of run_project, whatever its technique
+    """
+    save_artifact(result, file_path)
+
+
+def run_project(dataset_name, data, inputs, formulas, selected_statements_ratio, reduced_test_cases_ratio,
+                reduced_mutant_ratio, rng=random, on_result=None):
+    """
+    Reduces the statements, passed test cases and mutants of a project for one ratio triple with GBSR, the
+    contribution based reduction (CBTCR) and the random baseline, runs MBFL on the reduced data and writes
+    the results.
+
+    Args:
+    - inputs (dict): The result of load_project_inputs.
+    - rng: The random module or a random.Random instance, drawn in the same order for every project.
+    - on_result: Called as on_result(technique, result, file_path) with "gbsr", "cbtcr" or "random" instead of
+      writing every result to file_path, e.g. to evaluate the results in memory (see aggregation.collect_result).
+    """
+    if on_result is None:
+        on_result = save_result
+
+    project_name = data['proj']
+    lines = data['lines']
+    ftest = data['ftest']
+    rtest = data['rtest']
+    len_mutation = len(data['mutation'])
+    len_ftest = len(data['ftest'])
+    len_rtest = len(data['rtest'])
+    # Begin MBFL
+    original_MTP = len_mutation * (len_ftest + len_rtest)
+    ratios_directory = f"{selected_statements_ratio:.1f}/{reduced_test_cases_ratio:.1f}/{reduced_mutant_ratio:.1f}"
+    # The fields of the profiler records of the project
+    fields = {"dataset": dataset_name, "project": project_name,
+              "ratios": [selected_statements_ratio, reduced_test_cases_ratio, reduced_mutant_ratio]}
+
+    # Contribution based reduction does not depend on the formula, so the mutants are
+    # reduced and counted once and only the scoring is done for every formula.
+    # It is recorded once per formula, like the other techniques
+    with profile('reduction', technique='cbtcr', formulas=formulas, **fields):
+        passed_test_cases_reduced_based_on_contribution = reduce_passed_test_cases_based_on_contribution(
+            rtest.values(), inputs["contribution"], reduced_test_cases_ratio, inputs["contribution ranking"])
+
+    with profile('mbfl', technique='cbtcr', formulas=formulas, **fields) as record:
+        num_of_mutants_based_on_contribution, results_based_on_contribution = reduced_MBFL(
+            inputs, lines.values(), lines.values(), passed_test_cases_reduced_based_on_contribution, reduced_mutant_ratio, formulas, rng)
+        current_MTP_based_on_contribution = num_of_mutants_based_on_contribution * \
+            (len_ftest + len(passed_test_cases_reduced_based_on_contribution))
+        record.update(num_of_mutants=num_of_mutants_based_on_contribution,
+                      num_of_test_cases=len_ftest + len(passed_test_cases_reduced_based_on_contribution),
+                      original_MTP=original_MTP, current_MTP=current_MTP_based_on_contribution)
+
+    for formula in formulas:
+        # GBSR reduction
+        # Reduce statements with low suspiciousness and passed test case with low contribution
+        # These two kinds of data should be reduced based on pre-computed result
+        with profile('reduction', technique='gbsr', formula=formula, **fields):
+            statements_reduced = reduce_statements(
+                lines.values(), inputs["difference"][formula], selected_statements_ratio, inputs["statement ranking"][formula])
+            passed_test_cases_reduced = reduce_passed_test_cases(
+                rtest.values(), inputs["passed test cases"][formula], reduced_test_cases_ratio, inputs["passed test case ranking"][formula])
+
+        with profile('mbfl', technique='gbsr', formula=formula, **fields) as record:
+            num_of_mutants, results = reduced_MBFL(
+                inputs, lines.values(), statements_reduced, passed_test_cases_reduced, reduced_mutant_ratio, [formula], rng)
+            current_MTP = num_of_mutants * \
+                (len_ftest + len(passed_test_cases_reduced))
+            record.update(num_of_mutants=num_of_mutants, num_of_test_cases=len_ftest + len(passed_test_cases_reduced),
+                          original_MTP=original_MTP, current_MTP=current_MTP)
+
+        line_suspicion, mutant_suspicion = results[formula]
+        result = {
+            "proj": project_name,
+            "formula": Formula.get_formula_name(formula),
+            "num_of_mutants": num_of_mutants,
+            "num_of_test_cases": len_ftest + len(passed_test_cases_reduced),
+            "original_MTP": original_MTP,
+            "current_MTP": current_MTP,
+            "line suspicion": line_suspicion,
+            "mutant suspicion": mutant_suspicion
+        }
+        # print(result)
+        on_result(
+            'gbsr', result, artifact_file(f"./data/mbfl/{dataset_name}/{ratios_directory}/{Formula.get_formula_name(formula)}/{project_name}.json"))
+
+        # Contribution based reduction
+        line_suspicion_based_on_contribution, mutant_suspicion_based_on_contribution = results_based_on_contribution[
+            formula]
+        result = {
+            "proj": project_name,
+            "formula": Formula.get_formula_name(formula),
+            "num_of_mutants": num_of_mutants_based_on_contribution,
+            "num_of_test_cases": len_ftest + len(passed_test_cases_reduced_based_on_contribution),
+            "original_MTP": original_MTP,
+            "current_MTP": current_MTP_based_on_contribution,
+            "line suspicion": line_suspicion_based_on_contribution,
+            "mutant suspicion": mutant_suspicion_based_on_contribution
+        }
+        # print(result)
+        on_result(
+            'cbtcr', result, artifact_file(f"./data/baseline/cbtcr/{dataset_name}/{ratios_directory}/{Formula.get_formula_name(formula)}/{project_name}.json"))
+
+        # Random statement reduction
+        with profile('reduction', technique='random', formula=formula, **fields):
+            statements_reduced_random = reduce_statements_based_on_random(
+                lines.values(), selected_statements_ratio, rng)
+
+        with profile('mbfl', technique='random', formula=formula, **fields) as record:
+            num_of_mutants_random, results_random = reduced_MBFL(
+                inputs, lines.values(), statements_reduced_random, rtest.values(), reduced_mutant_ratio, [formula], rng)
+            # The MTP of the mutants kept by the random reduction
+            current_MTP = num_of_mutants_random * \
+                (len_ftest + len(rtest.values()))
+            record.update(num_of_mutants=num_of_mutants_random, num_of_test_cases=len_ftest + len(rtest.values()),
+                          original_MTP=original_MTP, current_MTP=current_MTP)
+
+        line_suspicion_random, mutant_suspicion_random = results_random[formula]
+        result = {
+            "proj": project_name,
+            "formula": Formula.get_formula_name(formula),
+            "num_of_mutants": num_of_mutants_random,
+            "num_of_test_cases": len_ftest + len(rtest.values()),
+            "original_MTP": original_MTP,
+            "current_MTP": current_MTP,
+            "line suspicion": line_suspicion_random,
+            "mutant suspicion": mutant_suspicion_random
+        }
+        # print(result)
+        on_result(
+            'random', result, artifact_file(f"./data/baseline/random/{dataset_name}/{ratios_directory}/{Formula.get_formula_name(formula)}/{project_name}.json"))
+
+
 if __name__ == "__main__":
+    # 创建命令行参数解析器
+    parser = argparse.ArgumentParser(
+        description='Reduce statements and test cases.')
+    parser.add_argument('selected_statements_ratio', type=float,
+                        help='Ratio for selecting statements to generate mutant (e.g. 0.7 for 70%, \
+                                means that we should select 70% most suspected statement to generate mutant, \
+                                while the 30% \less suspected ones should generate less mutant)')
+    parser.add_argument('reduced_test_cases_ratio', type=float,
+                        help='Ratio for reducing passed test cases (e.g. 0.7 for 70%, \
+                            means that we should reserve 70% passed tested cases with higher contribution, \
+                                while just throw away the 30% \less contributed ones.)')
+    parser.add_argument('reduced_mutant_ratio', type=float,
+                        help='Radio for selected statements to generate mutant (e.g. 0.7 for 70%, \
+                            means that for selected less suspected statement, we should reserve 70% mutant for them \
+                                while reduce 30% mutant)')
+    parser.add_argument('--statement-weights', default='difference', choices=['difference', 'personalized_difference'],
+                        help='PageRank result used to select statements: the difference of PageRank between the graphs \
+                            with failed and passed test cases, or the same difference of personalized PageRank')
+    args = parser.parse_args()
+
     # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
     dataset = ['Lang']
     formulas = [formula for _,
                 formula in Formula.__members__.items()]
 
     for dataset_name in dataset:
-        with open(f'pkl_data/{dataset_name}.json', 'r') as rf:
-            structural_data = json.load(rf)
-            logging.info("Load relationship from JSON file")
-
-        for data in structural_data:
-            project_name = data['proj']
-            methods = data['methods']
-            lines = data['lines']
-            mutation = data['mutation']
-            ftest = data['ftest']
-            rtest = data['rtest']
-            # print(project_name)
-            len_methods = len(data['methods'])
-            len_lines = len(data['lines'])
-            len_mutation = len(data['mutation'])
-            len_ftest = len(data['ftest'])
-            len_rtest = len(data['rtest'])
-            # Begin MBFL
-            method2lines = data['edge2']
-            lines2rtest = data['edge10']
-            lines2ftest = data['edge']
-
-            original_MTP = len_mutation * (len_ftest + len_rtest)
-
-            for formula in formulas:
-
-                with open(f'./data/page_rank/difference/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json', 'r') as diff_file:
-                    difference = json.load(diff_file)
-                    logging.info("Load difference from JSON file")
-
-                with open(f'./data/page_rank/passed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json', 'r') as passed_test_cases_file:
-                    passed_test_cases = json.load(passed_test_cases_file)
-                    logging.info("Load passed test case from JSON file")
-
-                with open(f'./data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json', 'r') as sbfl_file:
-                    sbfl_result = json.load(sbfl_file)
-                    logging.info("Load passed test case from JSON file")
-
-                with open(f'./data/contribution/{dataset_name}/{project_name}.json', 'r') as sbfl_file:
-                    contribution_result = json.load(sbfl_file)
-                    logging.info("Load passed test case from JSON file")
-
-                # GBSR reduction
-                # Reduce statements with low suspiciousness and passed test case with low contribution
-                # These two kinds of data should be reduced based on pre-computed result
-                statements_reduced = reduce_statements(
-                    lines.values(), difference, args.selected_statements_ratio)
-                passed_test_cases_reduced = reduce_passed_test_cases(
-                    rtest.values(), passed_test_cases, args.reduced_test_cases_ratio)
-
-                mutant2line_reduced, mutant2rtest_reduced, mutant2ftest_reduced, mutant_list = refactor_data(
-                    statements_reduced, passed_test_cases_reduced, data["edge12"], data["edge13"], data["edge14"], args.reduced_mutant_ratio)
-                current_MTP = len(mutant_list) * \
-                    (len_ftest + len(passed_test_cases_reduced))
-
-                line_suspicion, mutant_suspicion = MBFL(mutants2lines=mutant2line_reduced, mutants_list=mutant_list,
-                                                        line_list=lines.values(), original_line_test_case_data=sbfl_result["line suspicion"],
-                                                        mutants2passed_test_cases=mutant2rtest_reduced,
-                                                        mutants2failed_test_cases=mutant2ftest_reduced,
-                                                        formula=formula)
-                result = {
-                    "proj": project_name,
-                    "formula": Formula.get_formula_name(formula),
-                    "num_of_mutants": len(mutant_list),
-                    "num_of_test_cases": len_ftest + len(passed_test_cases_reduced),
-                    "original_MTP": original_MTP,
-                    "current_MTP": current_MTP,
-                    "line suspicion": line_suspicion,
-                    "mutant suspicion": mutant_suspicion
-                }
-                # print(result)
-                dictionary_to_json(
-                    result, f"./data/mbfl/{dataset_name}/{args.selected_statements_ratio:.1f}/{args.reduced_test_cases_ratio:.1f}/{args.reduced_mutant_ratio:.1f}/{Formula.get_formula_name(formula)}/{project_name}.json")
-
-                # Contribution based reduction
-                passed_test_cases_reduced_based_on_contribution = reduce_passed_test_cases_based_on_contribution(
-                    rtest.values(), contribution_result["rtest"], args.reduced_test_cases_ratio)
-
-                mutant2line_reduced_based_on_contribution, mutant2rtest_reduced_based_on_contribution, mutant2ftest_reduced_based_on_contribution, mutant_list_based_on_contribution = refactor_data(
-                    lines.values(), passed_test_cases_reduced_based_on_contribution, data["edge12"], data["edge13"], data["edge14"], args.reduced_mutant_ratio)
-                current_MTP = len(mutant_list_based_on_contribution) * \
-                    (len_ftest + len(passed_test_cases_reduced_based_on_contribution))
-
-                line_suspicion_based_on_contribution, mutant_suspicion_based_on_contribution = MBFL(mutants2lines=mutant2line_reduced_based_on_contribution, mutants_list=mutant_list_based_on_contribution,
-                                                                                                    line_list=lines.values(), original_line_test_case_data=sbfl_result["line suspicion"],
-                                                                                                    mutants2passed_test_cases=mutant2rtest_reduced_based_on_contribution,
-                                                                                                    mutants2failed_test_cases=mutant2ftest_reduced_based_on_contribution,
-                                                                                                    formula=formula)
-                result = {
-                    "proj": project_name,
-                    "formula": Formula.get_formula_name(formula),
-                    "num_of_mutants": len(mutant_list_based_on_contribution),
-                    "num_of_test_cases": len_ftest + len(passed_test_cases_reduced_based_on_contribution),
-                    "original_MTP": original_MTP,
-                    "current_MTP": current_MTP,
-                    "line suspicion": line_suspicion_based_on_contribution,
-                    "mutant suspicion": mutant_suspicion_based_on_contribution
-                }
-                # print(result)
-                dictionary_to_json(
-                    result, f"./data/baseline/cbtcr/{dataset_name}/{args.selected_statements_ratio:.1f}/{args.reduced_test_cases_ratio:.1f}/{args.reduced_mutant_ratio:.1f}/{Formula.get_formula_name(formula)}/{project_name}.json")
-
-                # Random statement reduction
-                statements_reduced_random = reduce_statements_based_on_random(
-                    lines.values(), args.selected_statements_ratio)
-
-                mutant2line_reduced_random, mutant2rtest_reduced_random, mutant2ftest_reduced_random, mutant_list_random = refactor_data(
-                    statements_reduced_random, rtest.values(), data["edge12"], data["edge13"], data["edge14"], args.reduced_mutant_ratio)
-                current_MTP = len(mutant_list) * \
-                    (len_ftest + len(rtest.values()))
-
-                line_suspicion_random, mutant_suspicion_random = MBFL(mutants2lines=mutant2line_reduced_random, mutants_list=mutant_list_random,
-                                                                      line_list=lines.values(), original_line_test_case_data=sbfl_result["line suspicion"],
-                                                                      mutants2passed_test_cases=mutant2rtest_reduced_random,
-                                                                      mutants2failed_test_cases=mutant2ftest_reduced_random,
-                                                                      formula=formula)
-                result = {
-                    "proj": project_name,
-                    "formula": Formula.get_formula_name(formula),
-                    "num_of_mutants": len(mutant_list_random),
-                    "num_of_test_cases": len_ftest + len(rtest.values()),
-                    "original_MTP": original_MTP,
-                    "current_MTP": current_MTP,
-                    "line suspicion": line_suspicion_random,
-                    "mutant suspicion": mutant_suspicion_random
-                }
-                # print(result)
-                dictionary_to_json(
-                    result, f"./data/baseline/random/{dataset_name}/{args.selected_statements_ratio:.1f}/{args.reduced_test_cases_ratio:.1f}/{args.reduced_mutant_ratio:.1f}/{Formula.get_formula_name(formula)}/{project_name}.json")
+        for data in iterate_projects(dataset_name):
+            inputs = load_project_inputs(dataset_name, data, formulas, args.statement_weights)
+            run_project(dataset_name, data, inputs, formulas, args.selected_statements_ratio,
+                        args.reduced_test_cases_ratio, args.reduced_mutant_ratio)
@@ -1,183 +1,784 @@
-import json
-import os
-import pickle
-import numpy as np
-import logging
-
-from util import Formula
-
-logging.basicConfig(format='%(asctime)s %(message)s', level=logging.DEBUG)
-np.set_printoptions(suppress=True)
-
-
-def page_rank_internal(transition_matrix, initial_rank_vector, convergence_threshold):
-    """
-    Computes the PageRank vector for a given transition matrix.
-
-    Parameters:
-    - transition_matrix (np.ndarray): The transition probability matrix representing the web graph.
-    - initial_rank_vector (np.ndarray): The initial PageRank vector, typically a uniform distribution.
-    - convergence_threshold (float): The threshold for convergence. The computation stops when the change between iterations falls below this value.
-
-    Returns:
-    - np.ndarray: The converged PageRank vector.
-
-    The function iteratively applies the PageRank algorithm until the rank vector stabilizes within the specified convergence threshold or reaches the iteration limit.
-    """
-    iteration_limit = 10000  # Limit to prevent infinite loop in case of non-convergence
-    for _ in range(iteration_limit):
-        # Set numpy print options for debugging
-        np.set_printoptions(precision=6)
-        # Compute next rank vector
-        next_rank_vector = np.dot(transition_matrix, initial_rank_vector)
-        # Normalize to prevent overflow or underflow
-        normalized_rank_vector = next_rank_vector / max(next_rank_vector)
-        error = max(np.abs(normalized_rank_vector -
-                    initial_rank_vector))  # Compute error
-
-        if error < convergence_threshold:  # Check for convergence
-            return initial_rank_vector  # Return the stabilized rank vector
-
-        initial_rank_vector = normalized_rank_vector  # Prepare for next iteration
-
-    # Return the last computed vector if convergence threshold not met
-    return initial_rank_vector
-
-
-def page_rank(file_path):
-    """
-    Calculates the PageRank vector for a graph defined in a file.
-
-    Parameters:
-    - file_path (str): The path to the file containing the graph's adjacency list, stored in binary format with pickle.
-
-    Returns:
-    - np.ndarray: The PageRank vector of the graph.
-
-    The function reads the graph's adjacency list from the file, constructs the transition matrix, and computes the PageRank vector using the PageRank algorithm.
-    """
-    with open(file_path, 'rb') as file:
-        adjacency_list = pickle.load(file)
-
-    number_of_pages = len(adjacency_list[0])
-    adjacency_matrix = np.array(adjacency_list, dtype=float)
-    # print(adjacency_matrix)
-    initial_rank_vector = np.ones(number_of_pages)
-    damping_factor = 0.8
-    uniform_matrix = np.ones((number_of_pages, number_of_pages))
-    transition_matrix = damping_factor * adjacency_matrix + \
-        ((1 - damping_factor) / number_of_pages) * uniform_matrix
-
-    convergence_threshold = 1e-7
-    page_rank_vector = page_rank_internal(
-        transition_matrix, initial_rank_vector, convergence_threshold)
-
-    return page_rank_vector
-
-
-def page_rank_results_to_string(test_case_results, lengths, prefix=""):
-    """
-    Formats the PageRank results along with the lengths into a string suitable for output.
-
-    Parameters:
-    - test_case_results (np.ndarray): The PageRank results for test cases.
-    - lengths (tuple): Tuple containing lengths of methods, lines, rtest, and ftest.
-    - prefix (str): A prefix to differentiate between passed and failed test cases.
-
-    Returns:
-    - str: Formatted string ready for writing to a file.
-    """
-    len_methods, len_lines, len_rtest, len_ftest = lengths
-    results_dict = {
-        f"{prefix}_lengths": {
-            "methods": len_methods,
-            "statements": len_lines,
-            "rtest": len_rtest,
-            "ftest": len_ftest
-        },
-        f"{prefix}_results": list(test_case_results)
-    }
-    return results_dict
-
-
-if __name__ == '__main__':
-    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
-    dataset = ['Lang']
-    formulas = formula_list = [formula for _,
-                               formula in Formula.__members__.items()]
-    for dataset_name in dataset:
-        with open(f'pkl_data/{dataset_name}.json', 'r') as rf:
-            structural_data = json.load(rf)
-            logging.info("Load relationship from JSON file")
-        for data in structural_data:
-            project_name = data['proj']
-            methods = data['methods']
-            lines = data['lines']
-            mutation = data['mutation']
-            ftest = data['ftest']
-            rtest = data['rtest']
-            # print(project_name)
-            len_methods = len(data['methods'])
-            len_lines = len(data['lines'])
-            len_mutation = len(data['mutation'])
-            len_ftest = len(data['ftest'])
-            len_rtest = len(data['rtest'])
-            for formula in formulas:
-                passed_test_cases_filepath = f'./data/graph/passed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix.pkl'
-                failed_test_cases_filepath = f'./data/graph/failed_test_cases/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix.pkl'
-                passed_test_cases_matrix_after_page_rank = page_rank(
-                    passed_test_cases_filepath)
-                failed_test_cases_matrix_after_page_rank = page_rank(
-                    failed_test_cases_filepath)
-                # print(passed_test_cases_matrix_after_page_rank.round(6))
-                # print(failed_test_cases_matrix_after_page_rank.round(6))
-                # Format lengths for output
-                lengths = (len(data['methods']), len(data['lines']),
-                           len(data['rtest']), len(data['ftest']))
-
-                # Prepare result strings
-                passed_results_str = page_rank_results_to_string(
-                    passed_test_cases_matrix_after_page_rank, lengths, prefix="passed_test_cases")
-                failed_results_str = page_rank_results_to_string(
-                    failed_test_cases_matrix_after_page_rank, lengths, prefix="failed_test_cases")
-                difference_results_str = page_rank_results_to_string(failed_test_cases_matrix_after_page_rank[0:len(data['methods']) + len(
-                    data['lines'])] - passed_test_cases_matrix_after_page_rank[0:len(data['methods']) + len(data['lines'])], lengths, prefix="failed_passed_diff")
-
-                passed_test_cases_dir = os.path.join(
-                    "data", 'page_rank', "passed_test_cases", dataset_name, Formula.get_formula_name(formula))
-                failed_test_cases_dir = os.path.join(
-                    "data", 'page_rank', "failed_test_cases", dataset_name, Formula.get_formula_name(formula))
-                difference_dir = os.path.join(
-                    "data", 'page_rank', "difference", dataset_name, Formula.get_formula_name(formula))
-
-                os.makedirs(passed_test_cases_dir, exist_ok=True)
-                os.makedirs(failed_test_cases_dir, exist_ok=True)
-                os.makedirs(difference_dir, exist_ok=True)
-
-                passed_test_cases_page_rank_result = os.path.join(
-                    passed_test_cases_dir, f'{project_name}.json')
-                failed_test_cases_page_rank_result = os.path.join(
-                    failed_test_cases_dir, f'{project_name}.json')
-                difference_page_rank_result = os.path.join(
-                    difference_dir, f'{project_name}.json')
-
-                if not os.path.isfile(passed_test_cases_page_rank_result):
-                    with open(passed_test_cases_page_rank_result, 'w') as json_file:
-                        json.dump(passed_results_str, json_file, indent=4)
-                else:
-                    logging.info(
-                        f"File {passed_test_cases_page_rank_result} already exists. Skipping...")
-
-                if not os.path.isfile(failed_test_cases_page_rank_result):
-                    with open(failed_test_cases_page_rank_result, 'w') as json_file:
-                        json.dump(failed_results_str, json_file, indent=4)
-                else:
-                    logging.info(
-                        f"File {failed_test_cases_page_rank_result} already exists. Skipping...")
-
-                if not os.path.isfile(difference_page_rank_result):
-                    with open(difference_page_rank_result, 'w') as json_file:
-                        json.dump(difference_results_str, json_file, indent=4)
-                else:
-                    logging.info(
-                        f"File {difference_page_rank_result} already exists. Skipping...")
+import collections
+import os
+import time
+from enum import Enum
+import numpy as np
+import logging
+from scipy import sparse
+from scipy.sparse import linalg
+
+from profiler import profile
+from util import Formula, artifact_file, iterate_projects, load_artifact, load_sparse_matrix, page_rank_file, save_artifact
+
+logging.basicConfig(format='%(asctime)s %(message)s', level=logging.DEBUG)
+np.set_printoptions(suppress=True)
+
+
+class Normalization(Enum):
+    MAX = 0,
+    SUM = 1,
+
+
+class Personalization(Enum):
+    NONE = 0,
+    TESTS = 1,
+    SBFL = 2,
+
+
+class Solver(Enum):
+    AUTO = 0,
+    POWER = 1,
+    GAUSS_SEIDEL = 2,
+    EXTRAPOLATION = 3,
+    DIRECT = 4,
+    PUSH = 5,
+
+
+ITERATION_LIMIT = 10000  # Limit to prevent infinite loop in case of non-convergence
+# Graphs up to this size are ranked with a direct sparse solve (Normalization.SUM), bigger ones with
+# Gauss-Seidel sweeps
+DIRECT_SOLVER_LIMIT = 2000
+# Graphs up to this size are solved with a dense eigendecomposition by Solver.DIRECT and Normalization.MAX
+DENSE_EIGEN_LIMIT = 500
+# Graphs up to this size are ranked by Solver.DIRECT (Normalization.MAX), bigger ones with the power iteration
+DIRECT_EIGEN_SOLVER_LIMIT = 200
+
+
+def transition_matrix_of(adjacency_matrix, normalization: Normalization):
+    """
+    Prepares the sparse matrix used by the iteration.
+
+    With Normalization.MAX the adjacency matrix is used as it is, which is the original behaviour of this
+    module. With Normalization.SUM every column is divided by its sum, so that the iteration is the textbook
+    PageRank of a Markov chain (non-negative weights are expected); columns without any edge are dangling
+    and their rank is spread uniformly.
+
+    Returns:
+    - sparse.csr_matrix: The matrix to multiply the rank vector with.
+    - np.ndarray: A boolean mask of the dangling columns, or None with Normalization.MAX.
+    """
+    matrix = sparse.csr_matrix(adjacency_matrix, dtype=float)
+    matrix.sort_indices()
+    if normalization == Normalization.MAX:
+        return matrix, None
+    column_sums = np.asarray(matrix.sum(axis=0)).ravel()
+    dangling = column_sums == 0
+    scale = np.divide(1, column_sums, out=np.zeros_like(column_sums), where=~dangling)
+    matrix = (matrix @ sparse.diags(scale)).tocsr()
+    matrix.sort_indices()
+    return matrix, dangling
+
+
+def page_rank_internal(adjacency_matrix, initial_rank_vector, convergence_threshold, damping_factor=0.8,
+                       normalization: Normalization = Normalization.MAX):
+    """
+    Computes the PageRank vector for a given adjacency matrix.
+
+    Parameters:
+    - adjacency_matrix (sparse matrix or np.ndarray): The weighted adjacency matrix of the graph.
+    - initial_rank_vector (np.ndarray): The initial PageRank vector, typically a uniform distribution.
+    - convergence_threshold (float): The threshold for convergence. The computation stops when the change between iterations falls below this value.
+    - damping_factor (float): The probability of following an edge instead of teleporting.
+    - normalization (Normalization): MAX keeps the largest rank at 1, SUM computes the textbook PageRank whose ranks sum to 1.
+
+    Returns:
+    - np.ndarray: The converged PageRank vector.
+
+    The function iteratively applies the PageRank algorithm until the rank vector stabilizes within the specified convergence threshold or reaches the iteration limit.
+    Memory and time per iteration are proportional to the number of edges.
+    """
+    return page_rank_batch([adjacency_matrix], convergence_threshold, damping_factor, normalization,
+                           initial_rank_vectors=np.asarray(initial_rank_vector, dtype=float)[None, :])[0]
+
+
+def page_rank(file_path, damping_factor=0.8, convergence_threshold=1e-7, normalization: Normalization = Normalization.MAX,
+              solver: Solver = Solver.AUTO, return_info=False, initial_rank_vector=None, teleport_vector=None):
+    """
+    Calculates the PageRank vector for a graph defined in a file.
+
+    Parameters:
+    - file_path (str): The path of the graph's adjacency matrix, see load_sparse_matrix.
+    - damping_factor (float): The probability of following an edge instead of teleporting.
+    - convergence_threshold (float): The threshold for convergence.
+    - normalization (Normalization): See page_rank_internal.
+    - solver (Solver): See solve_page_rank.
+    - return_info (bool): True to also return the solver report of solve_page_rank.
+    - initial_rank_vector (np.ndarray): The vector to start from, e.g. a cached vector given by warm_start_vector.
+      Ones by default.
+    - teleport_vector (np.ndarray): See personalized_page_rank. None teleports uniformly.
+
+    Returns:
+    - np.ndarray: The PageRank vector of the graph.
+
+    The function reads the graph's adjacency matrix from the file and computes the PageRank vector using the PageRank algorithm.
+    """
+    adjacency_matrix = load_sparse_matrix(file_path)
+    page_rank_vector, info = solve_page_rank(
+        adjacency_matrix, initial_rank_vector, convergence_threshold, damping_factor, normalization, solver, teleport_vector)
+    logging.info(f"PageRank of {file_path}: solver {info['solver']}, {info['iterations']} iterations, "
+                 f"residual {info['residual']:.2e}, {info['time']:.3f}s")
+    if return_info:
+        return page_rank_vector, info
+    return page_rank_vector
+
+
+def page_rank_batch(adjacency_matrices, convergence_threshold=1e-7, damping_factor=0.8,
+                    normalization: Normalization = Normalization.MAX, initial_rank_vectors=None, return_iterations=False,
+                    teleport_vector=None):
+    """
+    Computes the PageRank vectors of several graphs over the same nodes at once, e.g. the graphs of one
+    project built with different formulas, which only differ in their edge weights.
+
+    The edges of all graphs are merged into one sparsity pattern whose weights are stored per graph, and
+    every iteration updates all rank vectors with a single sparse-matrix × dense-matrix product. A graph stops
+    iterating as soon as its own rank vector has converged. page_rank_internal runs a batch of one graph, so
+    the result for every graph is the same as ranking it on its own.
+
+    Parameters:
+    - adjacency_matrices (list): The weighted adjacency matrices, all of the same shape.
+    - convergence_threshold (float): The threshold for convergence.
+    - damping_factor (float): The probability of following an edge instead of teleporting.
+    - normalization (Normalization): See page_rank_internal.
+    - initial_rank_vectors (np.ndarray): A (graphs × nodes) array of initial vectors, ones by default.
+    - return_iterations (bool): True to also return the number of iterations of every graph.
+    - teleport_vector (np.ndarray): See personalized_page_rank. None teleports uniformly.
+
+    Returns:
+    - np.ndarray: A (graphs × nodes) array holding the PageRank vector of every graph.
+    """
+    prepared = [transition_matrix_of(matrix, normalization) for matrix in adjacency_matrices]
+    if len({matrix.shape for matrix, _ in prepared}) > 1:
+        raise ValueError("All graphs of a batch must have the same shape")
+    number_of_graphs = len(prepared)
+    number_of_pages = prepared[0][0].shape[0] if prepared else 0
+
+    # Merge the edges of all graphs, sorted by row then column like the CSR matrices themselves
+    edge_keys = [matrix.tocoo().row.astype(np.int64) * number_of_pages + matrix.tocoo().col
+                 for matrix, _ in prepared]
+    union_keys = np.unique(np.concatenate(edge_keys)) if edge_keys else np.array([], dtype=np.int64)
+    rows, cols = union_keys // max(number_of_pages, 1), union_keys % max(number_of_pages, 1)
+    weights = np.zeros((number_of_graphs, len(union_keys)))
+    for index, ((matrix, _), keys) in enumerate(zip(prepared, edge_keys)):
+        weights[index, np.searchsorted(union_keys, keys)] = matrix.tocoo().data
+    # Sums the weighted ranks of the edges of every row
+    row_selector = sparse.csr_matrix((np.ones(len(union_keys)), (rows, np.arange(len(union_keys)))),
+                                     shape=(number_of_pages, len(union_keys)))
+    dangling = np.array([mask if mask is not None else np.zeros(number_of_pages, dtype=bool)
+                         for _, mask in prepared])
+
+    if initial_rank_vectors is None:
+        rank_vectors = np.ones((number_of_graphs, number_of_pages))
+        if normalization == Normalization.SUM:
+            rank_vectors /= number_of_pages
+    else:
+        rank_vectors = np.array(initial_rank_vectors, dtype=float)
+    results = rank_vectors.copy()
+    iterations = np.zeros(number_of_graphs, dtype=np.int64)
+    active = np.arange(number_of_graphs)
+    for _ in range(ITERATION_LIMIT):
+        if active.size == 0:
+            break
+        iterations[active] += 1
+        current = rank_vectors[active]
+        total_rank = current.sum(axis=1)
+        # Rows of the result are kept contiguous so that every per-graph reduction runs like a 1-D one
+        next_rank_vectors = damping_factor * np.ascontiguousarray(
+            (row_selector @ (weights[active] * current[:, cols]).T).T)
+        if normalization == Normalization.MAX:
+            if teleport_vector is None:
+                next_rank_vectors += ((1 - damping_factor) / number_of_pages) * total_rank[:, None]
+            else:
+                next_rank_vectors += ((1 - damping_factor) * total_rank)[:, None] * teleport_vector[None, :]
+            next_rank_vectors /= next_rank_vectors.max(axis=1)[:, None]
+        else:
+            dangling_rank = np.array([vector[mask].sum() for vector, mask in zip(current, dangling[active])])
+            restart_rank = damping_factor * dangling_rank + (1 - damping_factor) * total_rank
+            if teleport_vector is None:
+                next_rank_vectors += (restart_rank / number_of_pages)[:, None]
+            else:
+                next_rank_vectors += restart_rank[:, None] * teleport_vector[None, :]
+            next_rank_vectors /= next_rank_vectors.sum(axis=1)[:, None]
+        errors = np.abs(next_rank_vectors - current).max(axis=1)
+
+        # Converged graphs keep their previous vector, like page_rank_internal, and stop iterating
+        converged = errors < convergence_threshold
+        results[active[converged]] = current[converged]
+        rank_vectors[active[~converged]] = next_rank_vectors[~converged]
+        active = active[~converged]
+
+    # Return the last computed vectors if convergence threshold not met
+    results[active] = rank_vectors[active]
+    if return_iterations:
+        return results, iterations
+    return results
+
+
+def choose_solver(number_of_pages, normalization: Normalization) -> Solver:
+    """
+    Picks the solver used by Solver.AUTO from the size of the graph.
+
+    With Normalization.MAX, small graphs take the dense eigendecomposition of Solver.DIRECT: the Lang graphs
+    need 550 to 900 power iterations, so it is faster up to about 200 nodes and exact, where the power
+    iteration stops about 5e-8 from the dominant eigenvector. Bigger graphs keep the plain power iteration,
+    as the jumps of Solver.EXTRAPOLATION leave an error in the slow modes that the convergence check does not
+    see (about 3e-5 instead of 4e-8 on 9 Lang graphs joined in one).
+    """
+    if normalization == Normalization.SUM:
+        return Solver.DIRECT if number_of_pages <= DIRECT_SOLVER_LIMIT else Solver.GAUSS_SEIDEL
+    return Solver.DIRECT if number_of_pages <= DIRECT_EIGEN_SOLVER_LIMIT else Solver.POWER
+
+
+def page_rank_step(transition_matrix, rank_vector, damping_factor, normalization: Normalization, dangling=None,
+                   teleport_vector=None):
+    """
+    Applies one PageRank iteration to a single rank vector and normalizes the result by its maximum or by its sum.
+    """
+    number_of_pages = rank_vector.shape[0]
+    next_rank_vector = damping_factor * (transition_matrix @ rank_vector)
+    if normalization == Normalization.MAX:
+        restart_rank = (1 - damping_factor) * rank_vector.sum()
+    else:
+        restart_rank = damping_factor * rank_vector[dangling].sum() + (1 - damping_factor) * rank_vector.sum()
+    if teleport_vector is None:
+        next_rank_vector += restart_rank / number_of_pages
+    else:
+        next_rank_vector += restart_rank * teleport_vector
+    return normalize_rank_vector(next_rank_vector, normalization)
+
+
+def normalize_rank_vector(rank_vector, normalization: Normalization):
+    if normalization == Normalization.MAX:
+        return rank_vector / rank_vector.max()
+    return rank_vector / rank_vector.sum()
+
+
+def extrapolated_page_rank(transition_matrix, dangling, initial_rank_vector, convergence_threshold, damping_factor,
+                           normalization: Normalization, period=10, teleport_vector=None):
+    """
+    Power iteration accelerated with Aitken extrapolation: every `period` iterations, the last three iterates
+    are used to jump towards the limit of every entry.
+
+    Returns:
+    - np.ndarray: The converged PageRank vector.
+    - int: The number of iterations.
+    """
+    rank_vector = initial_rank_vector
+    history = []
+    for iteration in range(1, ITERATION_LIMIT + 1):
+        next_rank_vector = page_rank_step(
+            transition_matrix, rank_vector, damping_factor, normalization, dangling, teleport_vector)
+        if np.abs(next_rank_vector - rank_vector).max() < convergence_threshold:
+            return rank_vector, iteration
+        history = (history + [next_rank_vector])[-3:]
+        if iteration % period == 0 and len(history) == 3:
+            first_difference = history[1] - history[0]
+            second_difference = history[2] - history[1]
+            denominator = second_difference - first_difference
+            correction = np.divide(second_difference ** 2, denominator,
+                                   out=np.zeros_like(denominator), where=np.abs(denominator) > 1e-15)
+            extrapolated = normalize_rank_vector(history[2] - correction, normalization)
+            if np.all(np.isfinite(extrapolated)):
+                next_rank_vector = extrapolated
+            history = []
+        rank_vector = next_rank_vector
+    return rank_vector, ITERATION_LIMIT
+
+
+def gauss_seidel_page_rank(transition_matrix, initial_rank_vector, convergence_threshold, damping_factor,
+                           teleport_vector=None):
+    """
+    Solves (I - d * P) x = v with Gauss-Seidel sweeps, for Normalization.SUM, where v is the teleport vector
+    (1 / n by default).
+
+    Returns:
+    - np.ndarray: The converged PageRank vector, normalized to sum 1.
+    - int: The number of sweeps.
+    """
+    number_of_pages = transition_matrix.shape[0]
+    system = (sparse.identity(number_of_pages, format='csr') - damping_factor * transition_matrix).tocsr()
+    lower = sparse.tril(system, format='csr')
+    upper = -sparse.triu(system, k=1, format='csr')
+    teleport = np.full(number_of_pages, 1 / number_of_pages) if teleport_vector is None else teleport_vector
+    # The iterates are only normalized for the convergence check: the sweeps converge to the unnormalized solution
+    solution = initial_rank_vector / initial_rank_vector.sum()
+    rank_vector = solution
+    for iteration in range(1, ITERATION_LIMIT + 1):
+        solution = linalg.spsolve_triangular(lower, upper @ solution + teleport, lower=True)
+        next_rank_vector = solution / solution.sum()
+        if np.abs(next_rank_vector - rank_vector).max() < convergence_threshold:
+            return next_rank_vector, iteration
+        rank_vector = next_rank_vector
+    return rank_vector, ITERATION_LIMIT
+
+
+def direct_page_rank(transition_matrix, damping_factor, normalization: Normalization, teleport_vector=None):
+    """
+    Computes the PageRank vector without iterating.
+
+    With Normalization.SUM, (I - d * P) x = v is solved with a sparse LU factorization, where v is the teleport
+    vector (1 / n by default). With Normalization.MAX, the vector is the dominant eigenvector of
+    d * A + (1 - d) * v * 1^T, computed densely for small graphs and with ARPACK otherwise.
+    """
+    number_of_pages = transition_matrix.shape[0]
+    if teleport_vector is None:
+        teleport_vector = np.full(number_of_pages, 1 / number_of_pages)
+    if normalization == Normalization.SUM:
+        system = sparse.identity(number_of_pages, format='csc') - damping_factor * transition_matrix.tocsc()
+        solution = linalg.spsolve(system, teleport_vector)
+        return solution / solution.sum()
+
+    teleport = (1 - damping_factor) * teleport_vector
+    if number_of_pages <= DENSE_EIGEN_LIMIT:
+        eigenvalues, eigenvectors = np.linalg.eig(
+            damping_factor * transition_matrix.toarray() + teleport[:, None])
+    else:
+        operator = linalg.LinearOperator(
+            (number_of_pages, number_of_pages),
+            matvec=lambda vector: damping_factor * (transition_matrix @ vector) + teleport * vector.sum(),
+            dtype=float)
+        eigenvalues, eigenvectors = linalg.eigs(operator, k=1, which='LR')
+    eigenvector = np.real(eigenvectors[:, np.argmax(np.real(eigenvalues))])
+    # Eigenvectors are only defined up to their sign
+    eigenvector = eigenvector / eigenvector[np.argmax(np.abs(eigenvector))]
+    return eigenvector / eigenvector.max()
+
+
+def solve_page_rank(adjacency_matrix, initial_rank_vector=None, convergence_threshold=1e-7, damping_factor=0.8,
+                    normalization: Normalization = Normalization.MAX, solver: Solver = Solver.AUTO, teleport_vector=None):
+    """
+    Computes the PageRank vector of a graph with a selectable solver.
+
+    Parameters:
+    - adjacency_matrix (sparse matrix or np.ndarray): The weighted adjacency matrix of the graph.
+    - initial_rank_vector (np.ndarray): The initial vector of the iterative solvers, ones by default.
+    - convergence_threshold (float): The threshold for convergence of the iterative solvers.
+    - damping_factor (float): The probability of following an edge instead of teleporting.
+    - normalization (Normalization): See page_rank_internal.
+    - solver (Solver): POWER is the plain power iteration, EXTRAPOLATION adds Aitken extrapolation to it,
+      GAUSS_SEIDEL sweeps the linear system (Normalization.SUM only) and DIRECT solves it without iterating.
+      PUSH approximates the ranks with forward push from the teleport vector (Normalization.SUM only, see
+      approximate_personalized_page_rank), every node being underestimated by less than convergence_threshold
+      times its degree before the ranks are normalized. AUTO picks one from the size of the graph.
+    - teleport_vector (np.ndarray): See personalized_page_rank. None teleports uniformly.
+
+    Returns:
+    - np.ndarray: The PageRank vector.
+    - dict: The solver used, the number of iterations, the residual (largest change of one more power
+      iteration) and the wall time in seconds.
+    """
+    start_time = time.perf_counter()
+    transition_matrix, dangling = transition_matrix_of(adjacency_matrix, normalization)
+    number_of_pages = transition_matrix.shape[0]
+    if solver == Solver.AUTO:
+        solver = choose_solver(number_of_pages, normalization)
+    if solver == Solver.GAUSS_SEIDEL and normalization != Normalization.SUM:
+        raise ValueError("Gauss-Seidel sweeps need the linear system of Normalization.SUM")
+    if solver == Solver.PUSH and normalization != Normalization.SUM:
+        raise ValueError("Forward push needs the Markov chain of Normalization.SUM")
+    if initial_rank_vector is None:
+        initial_rank_vector = normalize_rank_vector(np.ones(number_of_pages), normalization)
+    initial_rank_vector = np.asarray(initial_rank_vector, dtype=float)
+
+    if solver == Solver.POWER:
+        rank_vectors, iterations = page_rank_batch([adjacency_matrix], convergence_threshold, damping_factor, normalization,
+                                                   initial_rank_vectors=initial_rank_vector[None, :], return_iterations=True,
+                                                   teleport_vector=teleport_vector)
+        page_rank_vector, iterations = rank_vectors[0], int(iterations[0])
+    elif solver == Solver.EXTRAPOLATION:
+        page_rank_vector, iterations = extrapolated_page_rank(
+            transition_matrix, dangling, initial_rank_vector, convergence_threshold, damping_factor, normalization,
+            teleport_vector=teleport_vector)
+    elif solver == Solver.GAUSS_SEIDEL:
+        page_rank_vector, iterations = gauss_seidel_page_rank(
+            transition_matrix, initial_rank_vector, convergence_threshold, damping_factor, teleport_vector)
+    elif solver == Solver.DIRECT:
+        page_rank_vector, iterations = direct_page_rank(transition_matrix, damping_factor, normalization, teleport_vector), 0
+    elif solver == Solver.PUSH:
+        if teleport_vector is None:
+            teleport_vector = np.full(number_of_pages, 1 / number_of_pages)
+        seeds = {int(node): float(teleport_vector[node]) for node in np.flatnonzero(teleport_vector)}
+        ranks = approximate_personalized_page_rank(adjacency_matrix, seeds, damping_factor, convergence_threshold)
+        page_rank_vector = np.zeros(number_of_pages)
+        page_rank_vector[list(ranks.keys())] = list(ranks.values())
+        page_rank_vector, iterations = normalize_rank_vector(page_rank_vector, normalization), 0
+    else:
+        raise ValueError("Unsupported solver")
+
+    residual = float(np.abs(page_rank_step(transition_matrix, page_rank_vector, damping_factor,
+                                           normalization, dangling, teleport_vector) - page_rank_vector).max())
+    info = {"solver": solver.name, "iterations": iterations, "residual": residual,
+            "time": time.perf_counter() - start_time}
+    return page_rank_vector, info
+
+
+def teleport_vector_of(number_of_pages, seed_nodes, seed_weights=None):
+    """
+    Builds a teleport vector concentrated on some nodes.
+
+    Parameters:
+    - number_of_pages (int): The number of nodes of the graph.
+    - seed_nodes (list): The indices of the nodes the random surfer restarts from.
+    - seed_weights (list): The non-negative restart weight of every seed, equal weights by default.
+
+    Returns:
+    - np.ndarray: The teleport vector, which sums to 1, or None (uniform teleport) without any positive weight.
+    """
+    seed_nodes = np.asarray(seed_nodes, dtype=np.int64)
+    seed_weights = np.ones(seed_nodes.size) if seed_weights is None else np.asarray(seed_weights, dtype=float)
+    teleport_vector = np.zeros(number_of_pages)
+    np.add.at(teleport_vector, seed_nodes, np.clip(seed_weights, 0, None))
+    if teleport_vector.sum() <= 0:
+        return None
+    return teleport_vector / teleport_vector.sum()
+
+
+def tests_teleport_vector(data, test_cases_key):
+    """
+    Restarts from the test case nodes of a graph built by graph.py, i.e. from the failed test cases in the
+    graph with failed test cases ("ftest") and from the passed ones in the other ("rtest").
+    """
+    offset = len(data['methods']) + len(data['lines'])
+    number_of_tests = len(data[test_cases_key])
+    return teleport_vector_of(offset + number_of_tests, np.arange(offset, offset + number_of_tests))
+
+
+def sbfl_teleport_vector(data, line_suspicion, test_cases_key, top_ratio=0.1):
+    """
+    Restarts from the most suspicious lines according to SBFL, weighted by their suspiciousness.
+
+    Parameters:
+    - data (dict): The project record.
+    - line_suspicion (dict): The "line suspicion" of an SBFL result, keyed by line index.
+    - test_cases_key (str): "rtest" or "ftest", the test cases of the graph.
+    - top_ratio (float): The ratio of lines used as seeds.
+    """
+    number_of_methods = len(data['methods'])
+    number_of_pages = number_of_methods + len(data['lines']) + len(data[test_cases_key])
+    lines = np.array([int(line) for line in line_suspicion.keys()], dtype=np.int64)
+    suspicion = np.array([details["suspicion"] for details in line_suspicion.values()], dtype=float)
+    top = np.argsort(-suspicion, kind='stable')[:max(1, int(np.ceil(lines.size * top_ratio)))]
+    weights = suspicion[top] - min(suspicion[top].min(), 0)
+    if weights.sum() <= 0:
+        weights = None
+    return teleport_vector_of(number_of_pages, number_of_methods + lines[top], weights)
+
+
+def personalized_page_rank(adjacency_matrix, teleport_vector, convergence_threshold=1e-7, damping_factor=0.8,
+                           normalization: Normalization = Normalization.MAX, solver: Solver = Solver.AUTO):
+    """
+    Topic-sensitive PageRank: instead of restarting uniformly, the random surfer restarts from the nodes of
+    teleport_vector, e.g. tests_teleport_vector or sbfl_teleport_vector. The ranks measure the proximity to
+    these seeds. Same engine as solve_page_rank, with Normalization.SUM the ranks can also be approximated
+    locally with solver=Solver.PUSH.
+
+    Returns:
+    - np.ndarray: The personalized PageRank vector.
+    - dict: The solver report of solve_page_rank.
+    """
+    return solve_page_rank(adjacency_matrix, None, convergence_threshold, damping_factor, normalization, solver,
+                           teleport_vector)
+
+
+def approximate_personalized_page_rank(adjacency_matrix, seeds, damping_factor=0.8, epsilon=1e-6):
+    """
+    Approximates the personalized PageRank of Normalization.SUM with forward push (Andersen, Chung and Lang),
+    used by solve_page_rank with Solver.PUSH. The ranks of Normalization.MAX, which does not normalize the
+    edge weights, are not a random walk and cannot be pushed.
+    Only the nodes whose residual mass exceeds epsilon times their degree are pushed, so the work depends on
+    the neighbourhood of the seeds and not on the size of the graph. Dangling nodes send their mass back to
+    the seeds.
+
+    Parameters:
+    - adjacency_matrix (sparse matrix): The weighted adjacency matrix of the graph. CSC matrices are used as
+      they are, anything else is converted once.
+    - seeds (dict): Maps the seed nodes to their non-negative restart weights.
+    - damping_factor (float): The probability of following an edge instead of teleporting.
+    - epsilon (float): The residual mass per edge below which a node is not pushed anymore.
+
+    Returns:
+    - dict: Maps every reached node to its approximate rank. The ranks sum to at most 1 and are
+      underestimated by less than epsilon times the degree of every node.
+    """
+    matrix = adjacency_matrix if sparse.isspmatrix_csc(adjacency_matrix) else sparse.csc_matrix(adjacency_matrix)
+    total_weight = sum(seeds.values())
+    teleport = {node: weight / total_weight for node, weight in seeds.items() if weight > 0}
+    ranks, residuals = {}, dict(teleport)
+    queue = collections.deque(teleport.keys())
+    queued = set(queue)
+    while queue:
+        node = queue.popleft()
+        queued.discard(node)
+        mass = residuals.pop(node, 0)
+        ranks[node] = ranks.get(node, 0) + (1 - damping_factor) * mass
+        start, end = matrix.indptr[node], matrix.indptr[node + 1]
+        neighbours, weights = matrix.indices[start:end], matrix.data[start:end]
+        column_sum = weights.sum()
+        if column_sum > 0:
+            targets = zip(neighbours.tolist(), (damping_factor * mass * weights / column_sum).tolist())
+        else:
+            targets = ((seed, damping_factor * mass * share) for seed, share in teleport.items())
+        for neighbour, pushed in targets:
+            residuals[neighbour] = residuals.get(neighbour, 0) + pushed
+            degree = max(matrix.indptr[neighbour + 1] - matrix.indptr[neighbour], 1)
+            if neighbour not in queued and residuals[neighbour] > epsilon * degree:
+                queue.append(neighbour)
+                queued.add(neighbour)
+    return ranks
+
+
+def page_rank_graphs(adjacency_matrices, convergence_threshold=1e-7, damping_factor=0.8,
+                     normalization: Normalization = Normalization.MAX, solver: Solver = Solver.AUTO, label="",
+                     initial_rank_vectors=None, teleport_vector=None, return_iterations=False):
+    """
+    Ranks graphs with the same nodes, in one batch when the power iteration is used and one by one otherwise,
+    and logs the solver report of every graph. initial_rank_vectors optionally holds one start vector per graph.
+
+    Returns:
+    - np.ndarray: A (graphs × nodes) array holding the PageRank vector of every graph.
+    - list: With return_iterations, the number of iterations of every graph.
+    """
+    number_of_pages = adjacency_matrices[0].shape[0]
+    if solver == Solver.AUTO:
+        solver = choose_solver(number_of_pages, normalization)
+    if solver == Solver.POWER:
+        start_time = time.perf_counter()
+        results, iterations = page_rank_batch(adjacency_matrices, convergence_threshold, damping_factor, normalization,
+                                              initial_rank_vectors=initial_rank_vectors, return_iterations=True,
+                                              teleport_vector=teleport_vector)
+        logging.info(f"PageRank of {label}: solver POWER, {len(adjacency_matrices)} graphs, "
+                     f"{iterations.tolist()} iterations, {time.perf_counter() - start_time:.3f}s")
+        return (results, iterations.tolist()) if return_iterations else results
+    results = np.empty((len(adjacency_matrices), number_of_pages))
+    iterations = []
+    for index, adjacency_matrix in enumerate(adjacency_matrices):
+        results[index], info = solve_page_rank(
+            adjacency_matrix, None if initial_rank_vectors is None else initial_rank_vectors[index],
+            convergence_threshold, damping_factor, normalization, solver, teleport_vector)
+        logging.info(f"PageRank of {label}[{index}]: solver {info['solver']}, {info['iterations']} iterations, "
+                     f"residual {info['residual']:.2e}, {info['time']:.3f}s")
+        iterations.append(int(info['iterations']))
+    return (results, iterations) if return_iterations else results
+
+
+def graph_node_ids(data, test_cases_key):
+    """
+    Names the nodes of a graph built by graph.py, in matrix order: methods, lines, then the test cases of
+    test_cases_key ("rtest" or "ftest"). The names stay valid when the indices of a project change.
+    """
+    node_ids = []
+    for kind, key in (("method", "methods"), ("line", "lines"), ("test", test_cases_key)):
+        names = sorted(data[key].items(), key=lambda item: item[1])
+        node_ids.extend(f"{kind}:{name}" for name, _ in names)
+    return np.array(node_ids)
+
+
+def save_rank_vector_cache(file_path, node_ids, rank_vector):
+    """
+    Stores a final PageRank vector with the names of its nodes, so that later runs can start from it.
+    """
+    directory = os.path.dirname(file_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(file_path, node_ids=np.asarray(node_ids, dtype=str), rank_vector=rank_vector)
+
+
+def load_rank_vector_cache(file_path):
+    """
+    Returns:
+    - tuple: The (node ids, rank vector) pair stored by save_rank_vector_cache, or None without cache.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    with np.load(file_path) as cache:
+        return cache["node_ids"], cache["rank_vector"]
+
+
+def warm_start_vector(node_ids, cache, normalization: Normalization = Normalization.MAX):
+    """
+    Builds an initial rank vector from a cached vector, matching the nodes by name. Nodes missing from the
+    cache start from the mean of the matched ones.
+
+    Returns:
+    - np.ndarray: The initial vector, or None when no node matches.
+    """
+    if cache is None:
+        return None
+    cached_node_ids, cached_rank_vector = cache
+    order = np.argsort(cached_node_ids)
+    positions = np.searchsorted(cached_node_ids, node_ids, sorter=order).clip(max=max(order.size - 1, 0))
+    matched = order.size > 0
+    if matched:
+        positions = order[positions]
+        found = cached_node_ids[positions] == node_ids
+        matched = found.any()
+    if not matched:
+        return None
+    initial_rank_vector = np.full(len(node_ids), cached_rank_vector[positions[found]].mean())
+    initial_rank_vector[found] = cached_rank_vector[positions[found]]
+    if initial_rank_vector.max() <= 0:
+        return None
+    return normalize_rank_vector(initial_rank_vector, normalization)
+
+
+def page_rank_results_to_string(test_case_results, lengths, prefix=""):
+    """
+    Formats the PageRank results along with the lengths into a string suitable for output.
+
+    Parameters:
+    - test_case_results (np.ndarray): The PageRank results for test cases.
+    - lengths (tuple): Tuple containing lengths of methods, lines, rtest, and ftest.
+    - prefix (str): A prefix to differentiate between passed and failed test cases.
+
+    Returns:
+    - str: Formatted string ready for writing to a file.
+    """
+    len_methods, len_lines, len_rtest, len_ftest = lengths
+    results_dict = {
+        f"{prefix}_lengths": {
+            "methods": len_methods,
+            "statements": len_lines,
+            "rtest": len_rtest,
+            "ftest": len_ftest
+        },
+        f"{prefix}_results": list(test_case_results)
+    }
+    return results_dict
+
+
+def rank_project(dataset_name, data, formulas, solver: Solver = Solver.AUTO, warm_start=False,
+                 personalization: Personalization = Personalization.NONE):
+    """
+    Ranks the graphs of a project for every formula and writes the PageRank of the graphs with passed and
+    failed test cases and their difference to data/page_rank. See the __main__ block for the options.
+    """
+    project_name = data['proj']
+    methods = data['methods']
+    lines = data['lines']
+    mutation = data['mutation']
+    ftest = data['ftest']
+    rtest = data['rtest']
+    # print(project_name)
+    len_methods = len(data['methods'])
+    len_lines = len(data['lines'])
+    len_mutation = len(data['mutation'])
+    len_ftest = len(data['ftest'])
+    len_rtest = len(data['rtest'])
+    # Format lengths for output
+    lengths = (len_methods, len_lines, len_rtest, len_ftest)
+    # All formulas give graphs with the same nodes, so the graphs are ranked together
+    # The final vectors are cached by node name, with warm_start the next run starts from them
+    matrices_after_page_rank, adjacency_matrices = {}, {}
+    for graph_type, test_cases_key in (("passed_test_cases", "rtest"), ("failed_test_cases", "ftest")):
+        node_ids = graph_node_ids(data, test_cases_key)
+        cache_paths = [
+            f'./data/page_rank/cache/{graph_type}/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.npz' for formula in formulas]
+        initial_rank_vectors = None
+        if warm_start:
+            initial_rank_vectors = [warm_start_vector(node_ids, load_rank_vector_cache(cache_path))
+                                    for cache_path in cache_paths]
+            initial_rank_vectors = np.array([np.ones(len(node_ids)) if initial_rank_vector is None else initial_rank_vector
+                                             for initial_rank_vector in initial_rank_vectors])
+        adjacency_matrices[graph_type] = [load_sparse_matrix(
+            f'./data/graph/{graph_type}/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}_matrix') for formula in formulas]
+        with profile('pagerank', dataset=dataset_name, project=project_name, graph=graph_type) as record:
+            matrices_after_page_rank[graph_type], iterations = page_rank_graphs(
+                adjacency_matrices[graph_type], solver=solver, label=f"{project_name} {graph_type}", initial_rank_vectors=initial_rank_vectors,
+                return_iterations=True)
+            record.update(graphs=len(formulas), nodes=len(node_ids),
+                          edges=sum(adjacency_matrix.nnz for adjacency_matrix in adjacency_matrices[graph_type]),
+                          iterations=iterations)
+        for cache_path, rank_vector in zip(cache_paths, matrices_after_page_rank[graph_type]):
+            save_rank_vector_cache(cache_path, node_ids, rank_vector)
+    passed_test_cases_matrices_after_page_rank = matrices_after_page_rank["passed_test_cases"]
+    failed_test_cases_matrices_after_page_rank = matrices_after_page_rank["failed_test_cases"]
+
+    if personalization != Personalization.NONE:
+        for formula_index, formula in enumerate(formulas):
+            personalized_difference_result = page_rank_file(os.path.join(
+                "data", 'page_rank', "personalized_difference", dataset_name, Formula.get_formula_name(formula), f'{project_name}.json'))
+            if os.path.isfile(personalized_difference_result):
+                logging.info(
+                    f"File {personalized_difference_result} already exists. Skipping...")
+                continue
+            if personalization == Personalization.SBFL:
+                line_suspicion = load_artifact(artifact_file(
+                    f'./data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{project_name}.json'))["line suspicion"]
+            personalized_vectors = {}
+            for graph_type, test_cases_key in (("passed_test_cases", "rtest"), ("failed_test_cases", "ftest")):
+                if personalization == Personalization.TESTS:
+                    teleport_vector = tests_teleport_vector(data, test_cases_key)
+                else:
+                    teleport_vector = sbfl_teleport_vector(data, line_suspicion, test_cases_key)
+                personalized_vectors[graph_type], info = personalized_page_rank(
+                    adjacency_matrices[graph_type][formula_index], teleport_vector, solver=solver)
+                logging.info(f"Personalized PageRank of {project_name} {graph_type}: solver {info['solver']}, "
+                             f"{info['iterations']} iterations, residual {info['residual']:.2e}, {info['time']:.3f}s")
+            personalized_difference = personalized_vectors["failed_test_cases"][0:len_methods + len_lines] - \
+                personalized_vectors["passed_test_cases"][0:len_methods + len_lines]
+            save_artifact(page_rank_results_to_string(personalized_difference, lengths, prefix="failed_passed_diff"),
+                          personalized_difference_result)
+    for formula_index, formula in enumerate(formulas):
+        passed_test_cases_matrix_after_page_rank = passed_test_cases_matrices_after_page_rank[formula_index]
+        failed_test_cases_matrix_after_page_rank = failed_test_cases_matrices_after_page_rank[formula_index]
+        # print(passed_test_cases_matrix_after_page_rank.round(6))
+        # print(failed_test_cases_matrix_after_page_rank.round(6))
+        # Prepare result strings
+        passed_results_str = page_rank_results_to_string(
+            passed_test_cases_matrix_after_page_rank, lengths, prefix="passed_test_cases")
+        failed_results_str = page_rank_results_to_string(
+            failed_test_cases_matrix_after_page_rank, lengths, prefix="failed_test_cases")
+        difference_results_str = page_rank_results_to_string(failed_test_cases_matrix_after_page_rank[0:len(data['methods']) + len(
+            data['lines'])] - passed_test_cases_matrix_after_page_rank[0:len(data['methods']) + len(data['lines'])], lengths, prefix="failed_passed_diff")
+
+        passed_test_cases_dir = os.path.join(
+            "data", 'page_rank', "passed_test_cases", dataset_name, Formula.get_formula_name(formula))
+        failed_test_cases_dir = os.path.join(
+            "data", 'page_rank', "failed_test_cases", dataset_name, Formula.get_formula_name(formula))
+        difference_dir = os.path.join(
+            "data", 'page_rank', "difference", dataset_name, Formula.get_formula_name(formula))
+
+        os.makedirs(passed_test_cases_dir, exist_ok=True)
+        os.makedirs(failed_test_cases_dir, exist_ok=True)
+        os.makedirs(difference_dir, exist_ok=True)
+
+        passed_test_cases_page_rank_result = page_rank_file(os.path.join(
+            passed_test_cases_dir, f'{project_name}.json'))
+        failed_test_cases_page_rank_result = page_rank_file(os.path.join(
+            failed_test_cases_dir, f'{project_name}.json'))
+        difference_page_rank_result = page_rank_file(os.path.join(
+            difference_dir, f'{project_name}.json'))
+
+        if not os.path.isfile(passed_test_cases_page_rank_result):
+            save_artifact(passed_results_str, passed_test_cases_page_rank_result)
+        else:
+            logging.info(
+                f"File {passed_test_cases_page_rank_result} already exists. Skipping...")
+
+        if not os.path.isfile(failed_test_cases_page_rank_result):
+            save_artifact(failed_results_str, failed_test_cases_page_rank_result)
+        else:
+            logging.info(
+                f"File {failed_test_cases_page_rank_result} already exists. Skipping...")
+
+        if not os.path.isfile(difference_page_rank_result):
+            save_artifact(difference_results_str, difference_page_rank_result)
+        else:
+            logging.info(
+                f"File {difference_page_rank_result} already exists. Skipping...")
+
+
+if __name__ == '__main__':
+    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
+    dataset = ['Lang']
+    formulas = formula_list = [formula for _,
+                               formula in Formula.__members__.items()]
+    # AUTO picks the solver of every graph, see choose_solver
+    solver = Solver.AUTO
+    # Start from the vectors cached by the previous run, for re-runs where the graphs barely change
+    warm_start = False
+    # TESTS or SBFL also writes the difference of personalized PageRank, which mbfl.py reads with
+    # --statement-weights personalized_difference
+    personalization = Personalization.NONE
+    for dataset_name in dataset:
+        for data in iterate_projects(dataset_name):
+            rank_project(dataset_name, data, formulas, solver, warm_start, personalization)
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Parallel: runs the stages of the pipeline on a process pool. Every stage is split in independent units that
+write their own files: one unit per (dataset, project) for preprocess, graph, pagerank and baseline, and one
+unit per chunk of ratio triples for mbfl. The stages run one after another.
+
+With fused=True the mbfl stage evaluates its results in memory and writes the tables of metrics of
+aggregation.py instead of the result of every project, technique, formula and ratio triple.
+
+With the cache (see cache.py), a unit is only computed when its inputs, its upstream artifacts or the code
+of its stage changed since its outputs were written.
+
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import numpy as np
+
+from aggregation import is_selected, metrics_path
+from baseline import baseline_project
+from cache import hash_json, is_up_to_date, manifest_path, record, remove_outputs, run_cached_units, unit_key
+from graph import build_project_graphs, load_call_graph
+from pagerank import Personalization, Solver, rank_project
+from preprocess import preprocess_project
+from sweep import ratio_triples, sweep
+from util import Formula, artifact_file, iterate_projects, page_rank_file, sparse_matrix_files
+
+STAGES = ['preprocess', 'graph', 'pagerank', 'mbfl', 'baseline']
+# The source files every stage depends on, part of the cache keys
+STAGE_MODULES = {
+    'preprocess': ['preprocess.py', 'coverage.py', 'util.py'],
+    'graph': ['graph.py', 'util.py'],
+    'pagerank': ['pagerank.py', 'util.py'],
+    'mbfl': ['mbfl.py', 'sweep.py', 'aggregation.py', 'ranking.py', 'util.py'],
+    'baseline': ['baseline.py', 'util.py'],
+}
+
+
+def run_units(function, units, workers: int):
+    """
+    Calls function(*unit) for every unit, on `workers` processes. With one worker the units run in this
+    process, in order. The first exception of a unit is raised again once the other units are done.
+
+    units can be a generator: at most two units per worker are submitted at a time, so the project records
+    streamed by project_units are not all held in memory.
+    """
+    if workers <= 1:
+        for unit in units:
+            function(*unit)
+        return
+    errors, pending = [], set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for unit in units:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                errors.extend(future.exception() for future in done)
+            pending.add(executor.submit(function, *unit))
+        errors.extend(future.exception() for future in as_completed(pending))
+    errors = [error for error in errors if error is not None]
+    if errors:
+        raise errors[0]
+
+
+def project_units(dataset, *arguments):
+    """
+    Yields one (dataset name, project record, *arguments) unit per project of the datasets, streaming the records
+    """
+    for dataset_name in dataset:
+        for data in iterate_projects(dataset_name):
+            yield (dataset_name, data) + arguments
+
+
+def mbfl_units(dataset, triples, formulas, workers: int, statement_weights='difference', fused=False):
+    """
+    Splits the ratio triples in one chunk per worker. A chunk sweeps all the projects of the datasets in
+    order, and every triple draws from its own random.Random(0), so the results do not depend on the
+    number of workers nor on the scheduling.
+    """
+    chunks = [triples[index::workers] for index in range(max(workers, 1))]
+    return [(dataset, chunk, formulas, statement_weights, False, fused) for chunk in chunks if chunk]
+
+
+def formula_paths(pattern: str, dataset_name: str, project_name: str, formulas, file=artifact_file) -> list:
+    """
+    Get the path of an artifact for every formula, e.g. formula_paths('data/sbfl/{dataset}/{formula}/{project}.json', ...).
+    file turns the .json path into the path of the stored artifact.
+    """
+    return [file(pattern.format(dataset=dataset_name, formula=Formula.get_formula_name(formula), project=project_name))
+            for formula in formulas]
+
+
+def sbfl_paths(dataset_name, project_name, formulas) -> list:
+    return formula_paths('data/sbfl/{dataset}/{formula}/{project}.json', dataset_name, project_name, formulas)
+
+
+def contribution_path(dataset_name, project_name) -> str:
+    return artifact_file(f'data/contribution/{dataset_name}/{project_name}.json')
+
+
+def graph_paths(dataset_name, project_name, formulas) -> list:
+    return [array_file for graph_type in ('passed_test_cases', 'failed_test_cases') for path in formula_paths(
+        f'data/graph/{graph_type}/{{dataset}}/{{formula}}/{{project}}_matrix', dataset_name, project_name, formulas)
+        for array_file in sparse_matrix_files(path)]
+
+
+def page_rank_paths(dataset_name, project_name, formulas, results=('passed_test_cases', 'failed_test_cases', 'difference')) -> list:
+    return [path for result in results for path in formula_paths(
+        f'data/page_rank/{result}/{{dataset}}/{{formula}}/{{project}}.json', dataset_name, project_name, formulas, page_rank_file)]
+
+
+def mbfl_paths(dataset_name, project_name, formulas, triple, fused=False) -> list:
+    """
+    Get the results of a project for a ratio triple, only the selected ones (see aggregation.is_selected) with fused=True
+    """
+    ratios_directory = '/'.join(f'{ratio:.1f}' for ratio in triple)
+    return [path for technique, directory in (('gbsr', 'mbfl'), ('cbtcr', 'baseline/cbtcr'), ('random', 'baseline/random'))
+            if not fused or is_selected(technique, triple) for path in formula_paths(
+        f'data/{directory}/{{dataset}}/{ratios_directory}/{{formula}}/{{project}}.json', dataset_name, project_name, formulas)]
+
+
+def metrics_paths(dataset, formulas, triple) -> list:
+    """
+    Get the tables of metrics of a ratio triple and the summaries of its selected configurations, written by the fused sweep
+    """
+    return [metrics_path(dataset_name, triple) for dataset_name in dataset] + \
+        [path for dataset_name in dataset for technique in ('gbsr', 'cbtcr', 'random') if is_selected(technique, triple)
+         for path in formula_paths(f'data/baseline/{technique}/{{dataset}}/result/{{formula}}.json', dataset_name, '', formulas, str)]
+
+
+def project_cache_units(stage: str, unit) -> list:
+    """
+    Get the cache units of a (dataset name, project record, formulas, ...) unit of a stage, see
+    cache.run_cached_units.
+
+    preprocess, graph and pagerank have one cache unit per formula, keyed by the project record, the formula,
+    the other arguments and the artifacts of this formula in the previous stages, so that adding or changing
+    a formula only computes that formula. The contribution written by preprocess is computed with the last
+    formula and has its own cache unit. baseline has one cache unit per project.
+    """
+    dataset_name, data, formulas = unit[:3]
+    project_name = data['proj']
+    project, arguments = hash_json(data), hash_json(list(unit[3:]))
+    if stage == 'baseline':
+        parts = {"project": project, "formulas": formulas, "arguments": arguments}
+        upstream = sbfl_paths(dataset_name, project_name, formulas[:1])
+        outputs = formula_paths('data/baseline/mbfl/{dataset}/{formula}/{project}.json', dataset_name, project_name, formulas) + \
+            formula_paths('data/baseline/ftmes/{dataset}/{formula}/{project}.json', dataset_name, project_name, formulas)
+        return [(None, manifest_path(stage, dataset_name, project_name), parts, upstream, outputs)]
+    units = []
+    if stage == 'preprocess':
+        units.append(('contribution', manifest_path(stage, dataset_name, project_name, 'contribution'),
+                      {"project": project, "formula": formulas[-1]}, [], [contribution_path(dataset_name, project_name)]))
+    for formula in formulas:
+        parts = {"project": project, "formula": formula, "arguments": arguments}
+        if stage == 'preprocess':
+            upstream, outputs = [], sbfl_paths(dataset_name, project_name, [formula])
+        elif stage == 'graph':
+            upstream = sbfl_paths(dataset_name, project_name, [formula]) + [contribution_path(dataset_name, project_name)]
+            outputs = graph_paths(dataset_name, project_name, [formula])
+        else:
+            personalization = unit[5]
+            upstream = graph_paths(dataset_name, project_name, [formula])
+            outputs = page_rank_paths(dataset_name, project_name, [formula])
+            if personalization != Personalization.NONE:
+                outputs += page_rank_paths(dataset_name, project_name, [formula], ('personalized_difference',))
+            if personalization == Personalization.SBFL:
+                upstream += sbfl_paths(dataset_name, project_name, [formula])
+        units.append((formula, manifest_path(stage, dataset_name, project_name, Formula.get_formula_name(formula)),
+                      parts, upstream, outputs))
+    return units
+
+
+def run_cached_project(stage, *unit):
+    """
+    Runs a (dataset name, project record, formulas, ...) unit of a stage for the formulas whose outputs are
+    stale, in one call, see project_cache_units.
+    """
+    dataset_name, data, formulas = unit[:3]
+    function = {'preprocess': preprocess_project, 'graph': build_project_graphs,
+                'pagerank': rank_project, 'baseline': baseline_project}[stage]
+
+    def compute(names):
+        stale_formulas = [formula for formula in formulas if formula in names]
+        if stage == 'baseline':
+            function(*unit)
+        elif stage == 'preprocess':
+            preprocess_project(dataset_name, data, stale_formulas, formulas[-1], 'contribution' in names)
+        else:
+            function(dataset_name, data, stale_formulas, *unit[3:])
+
+    run_cached_units(stage, project_cache_units(stage, unit), STAGE_MODULES[stage], compute)
+
+
+def run_project_again(stage, *unit):
+    """
+    Runs a (dataset name, project record, formulas, ...) unit of graph or pagerank without the cache. Their
+    outputs are removed first, because these stages skip the files that already exist.
+    """
+    remove_outputs([path for *_, outputs in project_cache_units(stage, unit) for path in outputs])
+    {'graph': build_project_graphs, 'pagerank': rank_project}[stage](*unit)
+
+
+def sweep_unit(dataset, triple, formulas, statement_weights, projects, fused=False):
+    """
+    Get the manifest, the key and the outputs of the mbfl unit of a ratio triple, see cached_sweep.
+
+    Returns:
+    - str: The manifest file of the triple.
+    - str: The key of the unit.
+    - list: The outputs of the unit.
+    """
+    upstream, outputs = [], metrics_paths(dataset, formulas, triple) if fused else []
+    for dataset_name, project_name, _ in projects:
+        upstream += sbfl_paths(dataset_name, project_name, formulas[:1]) + [contribution_path(dataset_name, project_name)] + \
+            page_rank_paths(dataset_name, project_name, formulas, (statement_weights, 'passed_test_cases'))
+        outputs += mbfl_paths(dataset_name, project_name, formulas, triple, fused)
+    parts = {"projects": projects, "formulas": formulas, "triple": triple, "statement_weights": statement_weights,
+             "fused": fused}
+    manifest_file = manifest_path('mbfl', '_'.join(dataset), '_'.join(f'{ratio:.1f}' for ratio in triple))
+    return manifest_file, unit_key('mbfl', parts, upstream, STAGE_MODULES['mbfl']), outputs
+
+
+def cached_sweep(dataset, triples, formulas, statement_weights, projects, fused=False):
+    """
+    Sweeps the ratio triples whose results are stale. A triple is cached as a whole, over all the projects of
+    the datasets, because its random choices depend on all the projects before.
+
+    Args:
+    - projects (list): The (dataset name, project name, hash of the project record) of every project, in order.
+    - fused (bool): True to sweep with the fused mode of sweep.py.
+    """
+    stale = []
+    for triple in triples:
+        manifest_file, key, outputs = sweep_unit(dataset, triple, formulas, statement_weights, projects, fused)
+        if is_up_to_date(manifest_file, key):
+            logging.info(f"{manifest_file} is up to date. Skipping...")
+            continue
+        remove_outputs(outputs)
+        stale.append((triple, manifest_file, key, outputs))
+    if stale:
+        sweep(dataset, [triple for triple, _, _, _ in stale], formulas, statement_weights, False, fused)
+    for _, manifest_file, key, outputs in stale:
+        record(manifest_file, key, outputs)
+
+
+def run_pipeline(dataset, formulas, stages=STAGES, workers: int = os.cpu_count() or 1, ratios=np.arange(0, 1.2, 0.2),
+                 statement_weights='difference', use_cache=True, fused=False,
+                 personalization: Personalization = Personalization.NONE):
+    """
+    Runs the stages of the pipeline over all the projects of the datasets.
+
+    Args:
+    - dataset (list): The names of the datasets.
+    - formulas (list): The formulas.
+    - stages (list): The stages to run, in the order of STAGES.
+    - workers (int): The number of processes.
+    - ratios (list): The ratios swept by the mbfl stage.
+    - statement_weights (str): "difference" or "personalized_difference", see pagerank.py.
+    - use_cache (bool): False to compute every unit again, the existing outputs of graph and pagerank being removed first.
+    - fused (bool): True to only write the metrics of the mbfl stage, see sweep.py.
+    - personalization (Personalization): TESTS or SBFL to also write the difference of personalized PageRank
+      in the pagerank stage, which the mbfl stage reads with statement_weights="personalized_difference".
+    """
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        logging.info(f"Running {stage} with {workers} workers")
+        if use_cache and stage == 'mbfl':
+            projects = [(dataset_name, data['proj'], hash_json(data)) for dataset_name, data in project_units(dataset)]
+            units = [unit[:4] + (projects, fused) for unit in mbfl_units(dataset, ratio_triples(ratios), formulas, workers, statement_weights)]
+            run_units(cached_sweep, units, workers)
+        elif use_cache and stage == 'graph':
+            call_graphs = {dataset_name: load_call_graph(dataset_name) for dataset_name in dataset}
+            units = ((dataset_name, data, formulas, call_graphs[dataset_name][data['proj']])
+                     for dataset_name, data, formulas in project_units(dataset, formulas))
+            run_units(run_cached_project, ((stage,) + unit for unit in units), workers)
+        elif use_cache and stage == 'pagerank':
+            units = project_units(dataset, formulas, Solver.AUTO, False, personalization)
+            run_units(run_cached_project, ((stage,) + unit for unit in units), workers)
+        elif use_cache:
+            run_units(run_cached_project, ((stage,) + unit for unit in project_units(dataset, formulas)), workers)
+        elif stage == 'preprocess':
+            run_units(preprocess_project, project_units(dataset, formulas), workers)
+        elif stage == 'graph':
+            call_graphs = {dataset_name: load_call_graph(dataset_name) for dataset_name in dataset}
+            units = ((dataset_name, data, formulas, call_graphs[dataset_name][data['proj']])
+                     for dataset_name, data, formulas in project_units(dataset, formulas))
+            run_units(run_project_again, ((stage,) + unit for unit in units), workers)
+        elif stage == 'pagerank':
+            units = project_units(dataset, formulas, Solver.AUTO, False, personalization)
+            run_units(run_project_again, ((stage,) + unit for unit in units), workers)
+        elif stage == 'mbfl':
+            run_units(sweep, mbfl_units(dataset, ratio_triples(ratios), formulas, workers, statement_weights, fused), workers)
+        elif stage == 'baseline':
+            run_units(baseline_project, project_units(dataset, formulas), workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the stages of the pipeline on several processes.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of processes, 1 runs everything in this process')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                        help='Stages to run, always in the order of the pipeline')
+    parser.add_argument('--statement-weights', default='difference', choices=['difference', 'personalized_difference'],
+                        help='PageRank result used by mbfl to select statements')
+    parser.add_argument('--personalization', default='NONE', choices=[member.name for member in Personalization],
+                        help='Seeds of the personalized PageRank written by pagerank (TESTS or SBFL), \
+                            needed by --statement-weights personalized_difference')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Compute every unit again instead of skipping the ones whose inputs did not change')
+    parser.add_argument('--fused', action='store_true',
+                        help='Evaluate the mbfl results in memory and only write the tables of metrics and the selected results')
+    args = parser.parse_args()
+    if args.statement_weights == 'personalized_difference' and 'pagerank' in args.stages and args.personalization == 'NONE':
+        parser.error('--statement-weights personalized_difference needs --personalization TESTS or SBFL')
+
+    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
+    dataset = ['Lang']
+    formulas = [formula for _,
+                formula in Formula.__members__.items()]
+    run_pipeline(dataset, formulas, args.stages, args.workers, statement_weights=args.statement_weights,
+                 use_cache=not args.no_cache, fused=args.fused, personalization=Personalization[args.personalization])
@@ -1,49 +1,43 @@
 
 import matplotlib.pyplot as plt
-import pandas as pd
 
 
+from store import query_metrics
 from util import Formula
 
 if __name__ == "__main__":
     # 设置绘图的大小
     fig, axs = plt.subplots(3, 2, figsize=(12, 8))  # 假设你有6个公式，所以创建3行2列的子图
 
-    # 打开Excel文件
-    excel_file = 'Lang_evaluation_results.xlsx'
+    # 从结果库（store.py）读取Lang数据集GBSR的指标，每个公式对应一个子图
+    dataset_name = 'Lang'
+    formula_names = [Formula.get_formula_name(formula) for formula in Formula]
 
-    # 获取Excel文件中所有工作表的名称，每个工作表对应一个公式
-    xls = pd.ExcelFile(excel_file)
-    sheet_names = xls.sheet_names
-
-    # 遍历每个工作表（公式）
-    for i, sheet_name in enumerate(sheet_names):
-        # 读取当前工作表的数据
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
-        df_selected = df[df['selected_statements_ratio'] == 0.2]
+    # 遍历每个公式
+    for i, formula_name in enumerate(formula_names):
+        # 按约简比例分组，求MAP和MFR的平均值
+        by_test_cases = query_metrics(dataset_name, 'gbsr', formula_name, group_by='reduced_test_cases_ratio',
+                                      selected_statements_ratio=0.2)
+        by_mutants = query_metrics(dataset_name, 'gbsr', formula_name, group_by='reduced_mutant_ratio',
+                                   selected_statements_ratio=0.2)
 
         # 定位当前的子图位置
         ax1 = axs[i // 2, i % 2]
         ax2 = ax1.twinx()
 
-        # 假设'reduced_test_cases_ratio'和'reduced_mutant_ratio'是横轴的两组数据
-        x = df['reduced_test_cases_ratio'].unique()
-        x.sort()
+        # 'reduced_test_cases_ratio'和'reduced_mutant_ratio'是横轴的两组数据
+        x = by_test_cases['reduced_test_cases_ratio']
 
         # 绘制MAP的折线图
-        ax1.plot(x, df_selected.groupby('reduced_test_cases_ratio')[
-            'MAP'].mean(), label='MAR (reduced test cases)', color='blue')
-        ax1.plot(x, df_selected.groupby('reduced_mutant_ratio')['MAP'].mean(
-        ), label='MAR (reduced mutants)', color='blue', linestyle='dashed')
+        ax1.plot(x, by_test_cases['MAP'], label='MAR (reduced test cases)', color='blue')
+        ax1.plot(x, by_mutants['MAP'], label='MAR (reduced mutants)', color='blue', linestyle='dashed')
 
         # 绘制MFR的折线图
-        ax2.plot(x, df_selected.groupby('reduced_test_cases_ratio')[
-                'MFR'].mean(), label='MFR (reduced test cases)', color='orange')
-        ax2.plot(x, df_selected.groupby('reduced_mutant_ratio')['MFR'].mean(
-        ), label='MFR (reduced mutants)', color='orange', linestyle='dashed')
+        ax2.plot(x, by_test_cases['MFR'], label='MFR (reduced test cases)', color='orange')
+        ax2.plot(x, by_mutants['MFR'], label='MFR (reduced mutants)', color='orange', linestyle='dashed')
 
         # 设置子图标题和轴标签
-        ax1.set_title(sheet_name)
+        ax1.set_title(formula_name)
         ax1.set_xlabel('Reduction ratio')
         ax1.set_ylabel('MAR')
         ax2.set_ylabel('MFR')
@@ -2,27 +2,13 @@
 Preprocess: preprocess stage is aimed to get pre-computed SBFL suspiciousness of methods and statements, as well as the contribution value of test cases
 
 """
-import json
-import math
 from enum import Enum
-from util import *
 
+import numpy as np
 
-def CalculateSuspiciousnessBySBFL(formula_type, line_suspicion):
-    if formula_type == Formula.GP13:
-        return GP13(line_suspicion, FaultLocalization.SBFL)
-    elif formula_type == Formula.OCHIAI:
-        return Ochiai(line_suspicion, FaultLocalization.SBFL)
-    elif formula_type == Formula.JACCARD:
-        return Jaccard(line_suspicion, FaultLocalization.SBFL)
-    elif formula_type == Formula.OP2:
-        return OP2(line_suspicion, FaultLocalization.SBFL)
-    elif formula_type == Formula.TARANTULA:
-        return Tarantula(line_suspicion, FaultLocalization.SBFL)
-    elif formula_type == Formula.DSTAR:
-        return Dstar(line_suspicion, FaultLocalization.SBFL)
-    else:
-        raise ValueError("Unsupported formula type")
+from coverage import Spectrum
+from profiler import profile
+from util import *
 
 
 def SBFL_with_contribution(data, formula):
@@ -42,7 +28,7 @@ def SBFL_with_contribution(data, formula):
         line_set[line_index]['ef']['case_number'].add(test_case)
         line_set[line_index]['ef']['count'] = len(
             line_set[line_index]['ef']['case_number'])
-    for line_index in lines.values():
+    for line_index in data['lines'].values():
         line_set[line_index]['nf']['case_number'] = failed_test_set.difference(
             line_set[line_index]['ef']['case_number'])
         line_set[line_index]['nf']['count'] = len(
@@ -51,7 +37,7 @@ def SBFL_with_contribution(data, formula):
         line_set[line_index]['ep']['case_number'].add(test_case)
         line_set[line_index]['ep']['count'] = len(
             line_set[line_index]['ef']['case_number'])
-    for line_index in lines.values():
+    for line_index in data['lines'].values():
         line_set[line_index]['np']['case_number'] = passed_test_set.difference(
             line_set[line_index]['ep']['case_number'])
         line_set[line_index]['np']['count'] = len(
@@ -113,6 +99,116 @@ def contribution(data, line_suspicion, line_list, ftest_list, rtest_list):
     return test_case_contribution
 
 
+def SBFL_with_contribution_by_matrix(data, formula):
+    """
+    Same results as SBFL_with_contribution, but the spectra of all lines and methods are computed at once
+    from the sparse coverage matrices in coverage.Spectrum instead of per-line Python sets.
+    """
+    return SBFL_with_contribution_by_formulas(data, [formula])[formula]
+
+
+def SBFL_with_contribution_by_formulas(data, formulas):
+    """
+    Computes the spectra of a project once and scores them with every formula.
+
+    Returns:
+    - dict: Maps every formula to the (method suspicion, line suspicion, test case contribution) triple
+      returned by SBFL_with_contribution.
+    """
+    spectrum = Spectrum(data)
+    line_ids, method_ids = spectrum.line_ids.tolist(), spectrum.method_ids.tolist()
+    line_stats = [dict(zip(('ef', 'ep', 'nf', 'np'), stats)) for stats in zip(
+        *[spectrum.line_stats[key].tolist() for key in ('ef', 'ep', 'nf', 'np')])]
+    method_stats = [dict(zip(('ef', 'ep', 'nf', 'np'), stats)) for stats in zip(
+        *[spectrum.method_stats[key].tolist() for key in ('ef', 'ep', 'nf', 'np')])]
+    line_test_cases = [{'passed_test_cases': spectrum.test_cases(line, passed=True),
+                        'failed_test_cases': spectrum.test_cases(line, passed=False)} for line in line_ids]
+    contribution_edges = covered_test_case_edges(data, spectrum.line_ids)
+
+    results = {}
+    for formula in formulas:
+        line_scores = suspiciousness(formula, *[spectrum.line_stats[key] for key in ('ef', 'ep', 'nf', 'np')])
+        method_scores = suspiciousness(formula, *[spectrum.method_stats[key] for key in ('ef', 'ep', 'nf', 'np')])
+        line_suspicion = {line: {"stats": dict(stats), "test_cases": test_cases, "suspicion": score}
+                          for line, stats, test_cases, score in zip(line_ids, line_stats, line_test_cases, line_scores.tolist())}
+        method_suspicion = {method: {"stats": dict(stats), "suspicion": score}
+                            for method, stats, score in zip(method_ids, method_stats, method_scores.tolist())}
+        test_case_contribution = contribution_by_matrix(
+            data, spectrum.line_ids, line_scores, contribution_edges)
+        results[formula] = (method_suspicion, line_suspicion, test_case_contribution)
+    return results
+
+
+def covered_test_case_edges(data, line_ids):
+    """
+    Returns the line-test edges of data["edge"] and data["edge10"] whose line and test case are both listed.
+    """
+    covered_edges = {}
+    for key, edges in (("ftest", data['edge']), ("rtest", data['edge10'])):
+        test_ids = np.fromiter(data[key].values(), dtype=np.int64, count=len(data[key]))
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        covered_edges[key] = edges[np.isin(edges[:, 0], line_ids) & np.isin(edges[:, 1], test_ids)]
+    return covered_edges
+
+
+def contribution_by_matrix(data, line_ids, line_scores, covered_edges):
+    """
+    Vectorized version of contribution: the suspiciousness of the covered lines is added to every
+    test case in edge order, so the sums are the same as the ones of the loop.
+    """
+    suspicion = np.zeros(int(line_ids.max()) + 1 if line_ids.size > 0 else 0)
+    suspicion[line_ids] = line_scores
+
+    test_case_contribution = {}
+    for key, edges in covered_edges.items():
+        test_ids = list(data[key].values())
+        sums = np.zeros(max(test_ids) + 1 if test_ids else 0)
+        np.add.at(sums, edges[:, 1], suspicion[edges[:, 0]])
+        test_case_contribution[key] = {test_case_index: float(sums[test_case_index])
+                                       for test_case_index in test_ids}
+    return test_case_contribution
+
+
+def preprocess_project(dataset_name, data, formulas, contribution_formula=None, write_contribution=True):
+    """
+    Computes the SBFL suspiciousness of every formula and the contribution of the test cases of a project,
+    and writes them to data/sbfl and data/contribution.
+
+    Args:
+    - contribution_formula (Formula): The formula whose contribution is written, the last of formulas by
+      default (every formula used to overwrite the contribution of the previous one).
+    - write_contribution (bool): False to only write the SBFL results, e.g. when parallel.py only computes
+      the formulas whose results are stale.
+    """
+    proj = data["proj"]
+    if contribution_formula is None:
+        contribution_formula = formulas[-1]
+    with profile('preprocess', dataset=dataset_name, project=proj) as record:
+        scored_formulas = list(formulas)
+        if write_contribution and contribution_formula not in scored_formulas:
+            scored_formulas.append(contribution_formula)
+        # 一次性计算所有公式的怀疑度，覆盖矩阵只构建一次
+        results = SBFL_with_contribution_by_formulas(
+            data=data, formulas=scored_formulas)
+        for formula in formulas:
+            method_suspicion, line_suspicion, _ = results[formula]
+
+            # 处理 ds_result，保存怀疑度结果
+            result = {
+                "proj": proj,
+                "formula": Formula.get_formula_name(formula),
+                "method suspicion": method_suspicion,
+                "line suspicion": line_suspicion
+            }
+            save_artifact(
+                result, artifact_file(f"./data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{proj}.json"))
+        if write_contribution:
+            save_artifact(results[contribution_formula][2],
+                          artifact_file(f"./data/contribution/{dataset_name}/{proj}.json"))
+        record.update(lines=len(data['lines']), test_cases=len(data['rtest']) + len(data['ftest']),
+                      coverage=len(data['edge10']) + len(data['edge']), formulas=len(formulas))
+
+
 if __name__ == '__main__':
     # To support different dataset, just add the project name here
     # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
@@ -120,25 +216,5 @@ if __name__ == '__main__':
     formulas = formula_list = [formula for _,
                                formula in Formula.__members__.items()]
     for dataset_name in dataset:
-        with open(f'pkl_data/{dataset_name}.json', 'r') as rf:
-            structural_data = json.load(rf)
-
-        for data in structural_data:
-            proj = data["proj"]
-            lines = data["lines"]
-            # 存储每条代码行的 ef, ep, nf, np 值
-            for formula in formulas:
-                method_suspicion, line_suspicion, test_case_contribution = SBFL_with_contribution(
-                    data=data, formula=formula)
-
-                # 处理 ds_result，保存怀疑度结果
-                result = {
-                    "proj": proj,
-                    "formula": Formula.get_formula_name(formula),
-                    "method suspicion": method_suspicion,
-                    "line suspicion": line_suspicion
-                }
-                dictionary_to_json(
-                    result, f"./data/sbfl/{dataset_name}/{Formula.get_formula_name(formula)}/{proj}.json")
-                dictionary_to_json(test_case_contribution,
-                                   f"./data/contribution/{dataset_name}/{proj}.json")
+        for data in iterate_projects(dataset_name):
+            preprocess_project(dataset_name, data, formulas)
\ No newline at end of file
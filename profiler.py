@@ -0,0 +1,179 @@
+"""
+Profiler: records the cost of every stage of the pipeline (preprocess, graph, PageRank, reduction, MBFL and
+evaluation) to a structured log, one JSON line per unit of work: the stage, the project and the formula or
+technique, the wall time, the peak resident set size during the unit, and the counts of the stage (nodes,
+edges, iterations, mutants, test cases, MTP). Comparing the time of graph and pagerank with the time saved by
+the reduction tells whether the overhead of GBSR eats its MTP savings, see summarize_profile.
+
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set PROFILE = False to record nothing
+PROFILE = True
+PROFILE_PATH = 'data/profile/profile.jsonl'
+
+# The log file of this process, opened on the first record
+_log_file = None
+# The peaks of the blocks being profiled, innermost last, see profile
+_peaks = []
+# The descriptors of /proc/self/status and /proc/self/clear_refs, kept open by the process that opened them
+# (None where they cannot be opened), as opening them costs more than reading them
+_proc_files = {}
+
+
+def proc_file(name: str, flags: int):
+    key = (os.getpid(), name)
+    if key not in _proc_files:
+        try:
+            _proc_files[key] = os.open(f'/proc/self/{name}', flags)
+        except OSError:
+            _proc_files[key] = None
+    return _proc_files[key]
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident set size of this process (VmHWM) to its current resident set size.
+
+    Returns:
+    - bool: False where /proc/self/clear_refs is not available, e.g. outside Linux.
+    """
+    descriptor = proc_file('clear_refs', os.O_WRONLY)
+    if descriptor is None:
+        return False
+    try:
+        os.write(descriptor, b'5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of this process in bytes since the last reset_peak_rss, or None where
+    /proc/self/status is not available
+    """
+    descriptor = proc_file('status', os.O_RDONLY)
+    if descriptor is None:
+        return None
+    status = os.pread(descriptor, 1 << 14, 0)
+    start = status.find(b'VmHWM:')
+    if start < 0:
+        return None
+    # In kilobytes
+    return int(status[start + len(b'VmHWM:'):status.index(b'kB', start)]) * 1024
+
+
+def process_peak_rss():
+    """
+    Get the peak resident set size of this process in bytes over its lifetime, or None where the resource
+    module is missing
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def write_record(record: dict):
+    """
+    Appends a record to PROFILE_PATH. Every record is written with one call, so the processes of
+    parallel.py can append to the same log.
+    """
+    global _log_file
+    if _log_file is None or _log_file.closed:
+        directory = os.path.dirname(PROFILE_PATH)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        _log_file = open(PROFILE_PATH, 'a', buffering=1)
+    _log_file.write(json.dumps(record, default=lambda member: member.name) + '\n')
+
+
+@contextmanager
+def profile(stage: str, formulas=None, **fields):
+    """
+    Records the wall time and the peak RSS of the block, e.g.
+
+        with profile('graph', dataset=dataset_name, project=project_name) as record:
+            ...
+            record['edges'] = graph.nnz
+
+    The counts added to the record inside the block are written with it. Nothing is written when the block
+    raises an exception.
+
+    The peak RSS of the process is reset when the block starts, so "peak_rss" is the peak during the block
+    (blocks nested in it included). Where it cannot be reset, only "process_peak_rss", the peak over the
+    lifetime of the process, is recorded.
+
+    With formulas, the block is shared by these formulas (e.g. the CBTCR reduction, done once for all of
+    them) and one record is written per formula, with the same counts and an equal share of the wall time,
+    so that every technique is summed up per formula by summarize_profile.
+    """
+    record = {"stage": stage, **fields}
+    if not PROFILE:
+        yield record
+        return
+    if _peaks:
+        # The peak of the outer block so far, before it is reset
+        _peaks[-1] = max(_peaks[-1], peak_rss() or 0)
+    resettable = reset_peak_rss()
+    _peaks.append(0)
+    start_time = time.perf_counter()
+    try:
+        yield record
+    finally:
+        # The peak of this block is also a peak of the outer blocks
+        block_peak = max(peak_rss() or 0, _peaks.pop())
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], block_peak)
+    record["wall_time"] = time.perf_counter() - start_time
+    if resettable:
+        record["peak_rss"] = block_peak
+    else:
+        record["process_peak_rss"] = process_peak_rss()
+    record["pid"] = os.getpid()
+    if formulas is None:
+        write_record(record)
+        return
+    for formula in formulas:
+        write_record({**record, "formula": formula, "wall_time": record["wall_time"] / len(formulas)})
+
+
+def load_profile(path: str = None) -> pd.DataFrame:
+    """
+    Loads the records of the log, one row per record
+    """
+    with open(path or PROFILE_PATH, 'r') as rf:
+        return pd.DataFrame([json.loads(line) for line in rf if line.strip()])
+
+
+def summarize_profile(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sums up the wall time and the MTP of every stage and technique, and takes the highest peak RSS
+    """
+    records = records.copy()
+    if 'peak_rss' not in records:
+        records['peak_rss'] = records.get('process_peak_rss')
+    if 'technique' not in records:
+        records['technique'] = None
+    records['technique'] = records['technique'].fillna('')
+    for column in ('current_MTP', 'original_MTP'):
+        if column not in records:
+            records[column] = 0
+    return records.groupby(['stage', 'technique'], sort=False).agg(
+        units=('wall_time', 'size'), wall_time=('wall_time', 'sum'), peak_rss=('peak_rss', 'max'),
+        current_MTP=('current_MTP', 'sum'), original_MTP=('original_MTP', 'sum')).reset_index()
+
+
+if __name__ == '__main__':
+    print(summarize_profile(load_profile()).to_string(index=False))
@@ -0,0 +1,40 @@
+"""
+Ranking: ranks of suspiciousness scores with ties, shared by evaluation.py and baseline_evaluation.py. The
+ranks are computed with np.argsort and np.unique on a score array, and returned as an id → rank array so
+that the rank of a line is a single array access.
+
+"""
+import numpy as np
+
+
+def tie_ranks(scores) -> np.ndarray:
+    """
+    Ranks scores from the highest (rank 1) to the lowest. Tied scores all take the rank of the last of them,
+    i.e. the number of entries scored at least as high.
+
+    Args:
+    - scores (np.array): The scores.
+
+    Returns:
+    - np.array: The rank of every score.
+    """
+    values = -np.asarray(scores, dtype=float)
+    order = np.argsort(values, kind='stable')
+    _, starts, counts = np.unique(values[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(values), dtype=starts.dtype)
+    ranks[order] = np.repeat(starts + counts, counts)
+    return ranks
+
+
+def rank_lookup(ids, scores) -> np.ndarray:
+    """
+    Ranks the scores of non-negative integer ids.
+
+    Returns:
+    - np.array: The rank of every id at its index, 0 for the ids without a score.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    ranks = tie_ranks(scores)
+    lookup = np.zeros(int(ids.max(initial=-1)) + 1, dtype=ranks.dtype)
+    lookup[ids] = ranks
+    return lookup
@@ -0,0 +1,203 @@
+"""
+Search: finds the ratio triple with the best score (see aggregation.score) for a formula without evaluating the
+full grid of ratios, so that fine grids (e.g. steps of 0.05) stay affordable.
+
+The candidates are pruned by successive halving, the budget being the number of projects: every candidate is
+evaluated on the first projects, only the best 1/eta of them are evaluated on the next projects, and so on. The
+projects are streamed once, the inputs of a project (kill matrix, rankings) are shared by all the candidates,
+and every (candidate, project) pair is scored once and evaluated in memory. Every candidate draws from its own
+random.Random(0) like in sweep.py, so the metrics of a candidate on the projects it reached are the metrics a
+sweep of the same formulas would give.
+
+The candidates swept by parallel.py whose cache is up to date (see cached_triples) are not scored again: their
+results are read from data/mbfl. The other candidates, e.g. off the grid of the sweep, are scored.
+
+"""
+import argparse
+import logging
+import math
+import random
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from aggregation import evaluate_project, evaluate_result, index_project, score, sum_up, summary_row
+from cache import hash_json, is_up_to_date
+from mbfl import load_project_inputs, run_project
+from parallel import sweep_unit
+from store import store_metrics
+from util import Formula, iterate_projects
+
+# The technique of the rows stored by the search, see store.py
+SEARCH_TECHNIQUE = 'gbsr_search'
+
+
+def ratio_grid(step: float) -> list:
+    """
+    Get the ratios from step to 1 in steps of step, e.g. [0.05, 0.1, ..., 1.0]
+    """
+    return [round(float(ratio), 2) for ratio in np.arange(step, 1 + step / 2, step)]
+
+
+def collect_gbsr(evaluations: dict, costs: dict, project: dict, triple, formula_name: str, technique: str,
+                 result: dict, file_path: str):
+    """
+    The on_result of mbfl.run_project in the search: only the GBSR results are evaluated, and the MTP of the
+    formula of the search is summed up in costs[triple] as [current MTP, original MTP].
+    """
+    if technique != 'gbsr':
+        return
+    evaluations.setdefault((triple, result["formula"]), []).append(evaluate_result(project, result))
+    if result["formula"] == formula_name:
+        cost = costs.setdefault(triple, [0, 0])
+        cost[0] += result["current_MTP"]
+        cost[1] += result["original_MTP"]
+
+
+def cached_triples(dataset_name: str, candidates, formulas, statement_weights='difference') -> set:
+    """
+    Get the candidates whose results were written by the mbfl stage of parallel.py for this dataset alone,
+    with the same formulas and statement weights, and are still up to date (see parallel.cached_sweep).
+    Only the triples of the grid of the sweep (steps of 0.1) can be cached.
+    """
+    on_grid = [triple for triple in candidates if all(round(ratio, 1) == ratio for ratio in triple)]
+    if not on_grid:
+        return set()
+    projects = [(dataset_name, data['proj'], hash_json(data)) for data in iterate_projects(dataset_name)]
+    return {triple for triple in on_grid
+            if is_up_to_date(*sweep_unit([dataset_name], triple, formulas, statement_weights, projects)[:2])}
+
+
+def load_gbsr(evaluations: dict, costs: dict, project: dict, triple, formulas, formula_name: str, dataset_name: str,
+              original_MTP):
+    """
+    Evaluates the cached GBSR results of a project for a triple, like collect_gbsr does with computed results.
+    """
+    ratios_directory = '/'.join(f'{ratio:.1f}' for ratio in triple)
+    for formula in formulas:
+        result = evaluate_project(project, f"./data/mbfl/{dataset_name}/{ratios_directory}/{Formula.get_formula_name(formula)}")
+        evaluations.setdefault((triple, Formula.get_formula_name(formula)), []).append(result)
+        if Formula.get_formula_name(formula) == formula_name:
+            cost = costs.setdefault(triple, [0, 0])
+            cost[0] += result["MTP"]
+            cost[1] += original_MTP
+
+
+def rank_candidates(candidates, evaluations: dict, costs: dict, formula_name: str, mtp_budget: float) -> pd.DataFrame:
+    """
+    Ranks the candidates on the projects evaluated so far.
+
+    Returns:
+    - pd.DataFrame: The rows (see aggregation.summary_row) of the candidates within the MTP budget, with their
+      "MTP ratio" (current MTP / original MTP) and their "score", best first.
+    """
+    rows = []
+    for triple in candidates:
+        row = summary_row(sum_up(formula_name, evaluations[(triple, formula_name)]), *triple)
+        current_MTP, original_MTP = costs[triple]
+        row['MTP ratio'] = current_MTP / original_MTP if original_MTP != 0 else 0.0
+        rows.append(row)
+    rows = pd.DataFrame(rows)
+    if rows.empty:
+        return rows
+    rows = rows[rows['MTP ratio'] <= mtp_budget].copy()
+    # A metric equal for all the candidates does not tell them apart, its term is 0 for all of them
+    rows['score'] = score(rows, tied_term=0.0)
+    return rows.sort_values('score', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def search(dataset_name: str, formulas, formula, step: float = 0.05, eta: int = 3, mtp_budget: float = 1.0,
+           min_projects: int = 1, statement_weights='difference', triples=None, use_cache=True):
+    """
+    Searches the ratio triples of a dataset by successive halving.
+
+    Args:
+    - dataset_name (str): The name of the dataset.
+    - formulas (list): The formulas run by mbfl.run_project, like in the sweep.
+    - formula (Formula): The formula whose score is optimized.
+    - step (float): The step of the grid of ratios.
+    - eta (int): Only the best 1/eta of the candidates are kept at the end of every rung.
+    - mtp_budget (float): The highest current MTP / original MTP of a candidate, estimated on the projects
+      evaluated so far.
+    - min_projects (int): The number of projects of the first rung, the next rungs being eta times longer.
+    - statement_weights (str): "difference" or "personalized_difference", see pagerank.py.
+    - triples (list): The candidates, every triple of the grid by default.
+    - use_cache (bool): False to score the candidates cached by parallel.py again.
+
+    Returns:
+    - pd.DataFrame: The rows of the candidates evaluated on all the projects, best first (see rank_candidates).
+    - dict: The evaluations of the projects, keyed by (triple, formula name), for all the formulas.
+    """
+    formula_name = Formula.get_formula_name(formula)
+    grid = ratio_grid(step)
+    candidates = list(triples) if triples is not None else [(a, b, c) for a in grid for b in grid for c in grid]
+    generators = {triple: random.Random(0) for triple in candidates}
+    cached = cached_triples(dataset_name, candidates, formulas, statement_weights) if use_cache else set()
+    logging.info(f"{len(cached)} of {len(candidates)} candidates read from the cache of the sweep")
+    evaluations, costs = {}, {}
+    number_of_projects, rung_end = 0, min_projects
+    for data in iterate_projects(dataset_name):
+        if not candidates:
+            break
+        project = index_project(data)
+        original_MTP = len(data['mutation']) * (len(data['ftest']) + len(data['rtest']))
+        for triple in candidates:
+            if triple in cached:
+                load_gbsr(evaluations, costs, project, triple, formulas, formula_name, dataset_name, original_MTP)
+        computed = [triple for triple in candidates if triple not in cached]
+        if computed:
+            inputs = load_project_inputs(dataset_name, data, formulas, statement_weights)
+        for triple in computed:
+            run_project(dataset_name, data, inputs, formulas, *triple, rng=generators[triple],
+                        on_result=partial(collect_gbsr, evaluations, costs, project, triple, formula_name))
+        number_of_projects += 1
+        if number_of_projects == rung_end:
+            ranked = rank_candidates(candidates, evaluations, costs, formula_name, mtp_budget)
+            kept = ranked.head(math.ceil(len(ranked) / eta)) if len(ranked) > 1 else ranked
+            kept = set(zip(kept['selected_statements_ratio'], kept['reduced_test_cases_ratio'],
+                           kept['reduced_mutant_ratio'])) if not kept.empty else set()
+            logging.info(f"{number_of_projects} projects: {len(kept)} of {len(candidates)} candidates kept")
+            candidates = [triple for triple in candidates if triple in kept]
+            # The evaluations of the pruned candidates are not needed anymore
+            evaluations = {key: results for key, results in evaluations.items() if key[0] in kept}
+            rung_end *= eta
+    if not candidates:
+        logging.warning(f"No candidate within an MTP budget of {mtp_budget}")
+    return rank_candidates(candidates, evaluations, costs, formula_name, mtp_budget), evaluations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Search the ratios with the best score by successive halving instead of sweeping the full grid.')
+    parser.add_argument('--formula', default='OCHIAI', choices=[formula.name for formula in Formula],
+                        help='Formula whose score is optimized')
+    parser.add_argument('--step', type=float, default=0.05,
+                        help='Step of the grid of ratios')
+    parser.add_argument('--eta', type=int, default=3,
+                        help='Only the best 1/eta of the candidates go on to the next rung')
+    parser.add_argument('--mtp-budget', type=float, default=1.0,
+                        help='Highest current MTP / original MTP of a candidate (e.g. 0.3)')
+    parser.add_argument('--min-projects', type=int, default=1,
+                        help='Number of projects of the first rung')
+    parser.add_argument('--statement-weights', default='difference', choices=['difference', 'personalized_difference'],
+                        help='PageRank result used to select statements')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Score the candidates swept by parallel.py again instead of reading their results')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
+    dataset = ['Lang']
+    formulas = [formula for _,
+                formula in Formula.__members__.items()]
+    for dataset_name in dataset:
+        ranked, evaluations = search(dataset_name, formulas, Formula[args.formula], args.step, args.eta, args.mtp_budget,
+                                     args.min_projects, args.statement_weights, use_cache=not args.no_cache)
+        print(ranked.head(10).to_string(index=False))
+        if not evaluations:
+            continue
+        # The candidates left were evaluated on all the projects, their metrics are stored for every formula.
+        # They are off the grid of the sweep, so they are kept apart from its rows (plots, scores of evaluation.py)
+        store_metrics(pd.DataFrame([summary_row(sum_up(formula_name, results), *triple)
+                                    for (triple, formula_name), results in evaluations.items()]), dataset_name, SEARCH_TECHNIQUE)
@@ -0,0 +1,91 @@
+"""
+Store: SQLite database of the metrics of the evaluations, one row per dataset, technique, formula and ratio
+triple. The rows are clustered by (dataset, technique, function) so that a formula of a technique is read as
+one contiguous range, and plotting or comparing hundreds of configurations does not read any spreadsheet.
+
+"""
+import os
+import sqlite3
+
+import pandas as pd
+
+STORE_PATH = 'data/results.db'
+# The columns identifying a row, in the order of the primary key
+KEY_COLUMNS = ['dataset', 'technique', 'function', 'type',
+               'selected_statements_ratio', 'reduced_test_cases_ratio', 'reduced_mutant_ratio']
+METRIC_COLUMNS = ['ftop1', 'ftop3', 'ftop5', 'ftop10', 'MAP', 'MFR', 'MTP']
+COLUMN_TYPES = {'dataset': 'TEXT', 'technique': 'TEXT', 'function': 'TEXT', 'type': 'TEXT',
+                'selected_statements_ratio': 'REAL', 'reduced_test_cases_ratio': 'REAL', 'reduced_mutant_ratio': 'REAL',
+                'ftop1': 'INTEGER', 'ftop3': 'INTEGER', 'ftop5': 'INTEGER', 'ftop10': 'INTEGER',
+                'MAP': 'REAL', 'MFR': 'REAL', 'MTP': 'REAL'}
+
+
+def connect(path: str = STORE_PATH) -> sqlite3.Connection:
+    """
+    Opens the store, creating the table of metrics if needed
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path)
+    columns = ', '.join(f'{column} {COLUMN_TYPES[column]}' for column in KEY_COLUMNS + METRIC_COLUMNS)
+    connection.execute(
+        f'CREATE TABLE IF NOT EXISTS metrics ({columns}, PRIMARY KEY ({", ".join(KEY_COLUMNS)})) WITHOUT ROWID')
+    return connection
+
+
+def store_metrics(rows: pd.DataFrame, dataset_name: str, technique: str = None, path: str = STORE_PATH):
+    """
+    Stores the rows of an evaluation, replacing the rows with the same key.
+
+    Args:
+    - rows (pd.DataFrame): The rows of evaluation.py (see aggregation.summary_row), with a "technique" column
+      unless technique is given.
+    - dataset_name (str): The name of the dataset.
+    - technique (str): "gbsr", "cbtcr" or "random", or "gbsr_search" for the candidates of search.py.
+    """
+    rows = rows.assign(dataset=dataset_name)
+    if technique is not None:
+        rows = rows.assign(technique=technique)
+    columns = KEY_COLUMNS + METRIC_COLUMNS
+    values = [tuple(value.item() if hasattr(value, 'item') else value for value in row)
+              for row in rows[columns].itertuples(index=False, name=None)]
+    with connect(path) as connection:
+        connection.executemany(
+            f'INSERT OR REPLACE INTO metrics ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', values)
+    connection.close()
+
+
+def query_metrics(dataset_name: str = None, technique: str = None, formula_name: str = None, group_by=None,
+                  path: str = STORE_PATH, **ratios) -> pd.DataFrame:
+    """
+    Queries the rows of the store.
+
+    Args:
+    - dataset_name (str): Only the rows of a dataset.
+    - technique (str): Only the rows of a technique.
+    - formula_name (str): Only the rows of a formula, e.g. "Ochiai".
+    - group_by (list): Columns to group the rows by, the metrics being averaged over every group.
+    - ratios: Only the rows with these ratios, e.g. selected_statements_ratio=0.2.
+
+    Returns:
+    - pd.DataFrame: The rows, ordered by their key (or by the group).
+    """
+    conditions = {'dataset': dataset_name, 'technique': technique, 'function': formula_name, **ratios}
+    unknown = set(conditions) - set(KEY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    conditions = {column: value for column, value in conditions.items() if value is not None}
+    # Ratios are compared rounded to two decimals, the finest grid of search.py being in steps of 0.05
+    parameters = [round(float(value), 2) if COLUMN_TYPES[column] == 'REAL' else value for column, value in conditions.items()]
+    where = ' AND '.join(f'{column} = ?' for column in conditions) or '1'
+    if group_by:
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        selected = ', '.join(group_by + [f'AVG({column}) AS {column}' for column in METRIC_COLUMNS])
+        sql = f'SELECT {selected} FROM metrics WHERE {where} GROUP BY {", ".join(group_by)} ORDER BY {", ".join(group_by)}'
+    else:
+        sql = f'SELECT * FROM metrics WHERE {where} ORDER BY {", ".join(KEY_COLUMNS)}'
+    with connect(path) as connection:
+        result = pd.read_sql_query(sql, connection, params=parameters)
+    connection.close()
+    return result
@@ -0,0 +1,74 @@
+"""
+Sweep: runs the reduction and MBFL of mbfl.py for many ratio triples in one process. Every project is loaded
+once, its statements and passed test cases are ranked once, and every ratio triple only takes prefixes of
+the rankings.
+
+With fused=True the results are evaluated in memory right after the scoring (see aggregation.py): only a
+table of metrics per ratio triple is written, and the full results only for the selected configurations.
+
+"""
+import argparse
+import random
+from functools import partial
+
+import numpy as np
+from tqdm import tqdm
+
+from aggregation import collect_result, index_project, write_metrics
+from mbfl import load_project_inputs, run_project
+from util import Formula, iterate_projects
+
+
+def ratio_triples(ratios) -> list:
+    """
+    Get every (selected statements, reduced test cases, reduced mutant) combination of the ratios, rounded
+    like the command line arguments of mbfl.py
+    """
+    ratios = [round(float(ratio), 1) for ratio in ratios]
+    return [(a, b, c) for a in ratios for b in ratios for c in ratios]
+
+
+def sweep(dataset, triples, formulas, statement_weights='difference', progress=True, fused=False):
+    """
+    Writes the same results as running mbfl.py once for every ratio triple, or with fused=True the metrics
+    evaluation.py would compute from them.
+
+    Every triple draws from its own random.Random(0), like a fresh mbfl.py process seeded at import, so the
+    random choices of every triple are the same as with one process per triple.
+
+    Args:
+    - dataset (list): The names of the datasets.
+    - triples (list): The (selected statements, reduced test cases, reduced mutant) ratios.
+    - formulas (list): The formulas.
+    - statement_weights (str): "difference" or "personalized_difference", see pagerank.py.
+    - progress (bool): False to hide the progress bar, e.g. in the workers of parallel.py.
+    - fused (bool): True to evaluate the results in memory and write the tables of metrics of aggregation.py.
+    """
+    generators = {triple: random.Random(0) for triple in triples}
+    for dataset_name in dataset:
+        evaluations = {}
+        # The projects are streamed, so the progress bar counts the (project, triple) pairs without a total
+        with tqdm(desc=f'Sweeping {dataset_name}', unit='iter', disable=not progress) as pbar:
+            for data in iterate_projects(dataset_name):
+                inputs = load_project_inputs(dataset_name, data, formulas, statement_weights)
+                project = index_project(data) if fused else None
+                for triple in triples:
+                    on_result = partial(collect_result, evaluations, project, triple) if fused else None
+                    run_project(dataset_name, data, inputs, formulas, *triple, rng=generators[triple], on_result=on_result)
+                    pbar.update(1)
+        if fused:
+            write_metrics(dataset_name, evaluations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the reduction and MBFL for all the ratio triples.')
+    parser.add_argument('--fused', action='store_true',
+                        help='Evaluate the results in memory and only write the tables of metrics and the selected results')
+    args = parser.parse_args()
+
+    # dataset = ['Chart', 'Cli', 'JxPath', 'Lang', 'Math']
+    dataset = ['Lang']
+    formulas = [formula for _,
+                formula in Formula.__members__.items()]
+    sweep(dataset, ratio_triples(np.arange(0, 1.2, 0.2)), formulas, fused=args.fused)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import rank_candidates  # noqa: E402
+
+
+def project_result(project_name, top1, FR, AR):
+    return {"project_name": project_name, "top1": top1, "top3": top1, "top5": top1, "top10": top1,
+            "FR": FR, "AR": AR, "fault_count": 1, "line_count": 1, "MTP": 10}
+
+
+def test_metric_equal_for_all_candidates_does_not_zero_the_scores():
+    # ftop1 is 0 for all the candidates, MAP and MFR still tell them apart
+    candidates = [(0.25, 0.25, 0.25), (0.5, 0.5, 0.5), (0.75, 0.75, 0.75)]
+    ranks = {(0.25, 0.25, 0.25): 30, (0.5, 0.5, 0.5): 1, (0.75, 0.75, 0.75): 10}
+    evaluations = {(triple, 'Ochiai'): [project_result('Lang1', 0, rank, rank)] for triple, rank in ranks.items()}
+    costs = {triple: [5, 10] for triple in candidates}
+
+    ranked = rank_candidates(candidates, evaluations, costs, 'Ochiai', 1.0)
+
+    assert ranked['score'].notna().all()
+    assert list(ranked['selected_statements_ratio']) == [0.5, 0.75, 0.25]
+    assert ranked['score'].tolist() == [2.0, 2 * 20 / 29, 0.0]
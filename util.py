@@ -1,9 +1,11 @@
 from enum import Enum
 import json
-import math
 import os
 import logging
 
+import numpy as np
+from scipy import sparse
+
 
 def dictionary_to_json(dictionary: dict, file_path: str):
     # if os.path.isfile(file_path):
@@ -16,6 +18,304 @@ def dictionary_to_json(dictionary: dict, file_path: str):
         json.dump(dictionary, fp)
 
 
+def iterate_project_file(file_path: str, fields=None, chunk_size: int = 1 << 20):
+    """
+    Yields the project records of a JSON list one at a time. The file is read by chunks and every record is
+    parsed as soon as it is complete, so the memory used is bounded by the biggest project instead of the
+    whole dataset, and the first project is processed before the file is fully read.
+
+    Args:
+    - file_path (str): The path of the JSON list, e.g. pkl_data/Lang.json.
+    - fields (tuple): The keys to keep in every record, e.g. ('proj', 'ans', 'edge2'). All keys by default.
+    - chunk_size (int): The number of characters read at once. The size doubles while a record is incomplete.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as rf:
+        buffer, position, read_size, started = '', 0, chunk_size, False
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                chunk = rf.read(read_size)
+                if not chunk:
+                    raise ValueError(f"{file_path} ends before the end of the list")
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError(f"{file_path} is not a JSON list")
+                started, position = True, position + 1
+                continue
+            if buffer[position] == ']':
+                return
+            if buffer[position] == ',':
+                position += 1
+                continue
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The record is incomplete: keep it and read a bigger chunk
+                chunk = rf.read(read_size)
+                if not chunk:
+                    raise
+                buffer, position, read_size = buffer[position:] + chunk, 0, read_size * 2
+                continue
+            read_size = chunk_size
+            yield record if fields is None else {key: record[key] for key in fields}
+
+
+def iterate_projects(dataset_name: str, fields=None):
+    """
+    Yields the project records of pkl_data/{dataset_name}.json one at a time, see iterate_project_file.
+    """
+    logging.info(f"Stream relationship of {dataset_name} from JSON file")
+    yield from iterate_project_file(f'pkl_data/{dataset_name}.json', fields)
+
+
+# The arrays of a CSR matrix stored as raw .npy files, see save_sparse_matrix
+SPARSE_ARRAYS = ('data', 'indices', 'indptr', 'shape')
+
+
+def sparse_matrix_files(file_path: str) -> list:
+    """
+    Get the files of a sparse matrix: the .npz file itself, or the raw arrays of a matrix stored in a directory.
+    """
+    if file_path.endswith(".npz"):
+        return [file_path]
+    return [os.path.join(file_path, f"{name}.npy") for name in SPARSE_ARRAYS]
+
+
+def save_sparse_matrix(matrix, file_path: str):
+    """
+    Stores a sparse matrix, creating the directory if needed. A path ending with .npz is written in the
+    compressed .npz format of scipy. Any other path is a directory holding the CSR arrays as raw .npy files,
+    which load_sparse_matrix memory-maps instead of reading them.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    directory = os.path.dirname(file_path) if file_path.endswith(".npz") else file_path
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    if file_path.endswith(".npz"):
+        sparse.save_npz(file_path, matrix, compressed=True)
+        return
+    # The indices are sorted once here, so that the read-only arrays are never sorted in place after loading
+    matrix.sort_indices()
+    arrays = (matrix.data, matrix.indices, matrix.indptr, np.asarray(matrix.shape, dtype=np.int64))
+    for array_file, array in zip(sparse_matrix_files(file_path), arrays):
+        np.save(array_file, array)
+
+
+def load_sparse_matrix(file_path: str) -> sparse.csr_matrix:
+    """
+    Reads a sparse matrix written by save_sparse_matrix. The raw arrays are opened with np.load(mmap_mode='r'):
+    the pages are only read when used and are shared by the processes reading the same graph.
+    """
+    if file_path.endswith(".npz"):
+        return sparse.load_npz(file_path).tocsr()
+    data, indices, indptr, shape = (np.load(array_file, mmap_mode='r') for array_file in sparse_matrix_files(file_path))
+    return sparse.csr_matrix((data, indices, indptr), shape=tuple(shape.tolist()), copy=False)
+
+
+# Format of the artifacts written by the stages: 'npz' for the binary columnar format, 'json' for the nested JSON
+ARTIFACT_FORMAT = 'npz'
+
+
+def artifact_file(file_path: str) -> str:
+    """
+    Get the path of an artifact in ARTIFACT_FORMAT, from its path with the .json extension. Other paths,
+    e.g. the .npz adjacency matrices, are returned unchanged.
+    """
+    root, extension = os.path.splitext(file_path)
+    return f"{root}.{ARTIFACT_FORMAT}" if extension == ".json" else file_path
+
+
+def _lists_to_columns(lists):
+    """
+    Flattens a list of lists into (offsets, values), the row i being values[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(values) for values in lists])
+    values = np.fromiter((value for values in lists for value in values), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, values
+
+
+def _columns_to_lists(offsets, values):
+    values = values.tolist()
+    return [values[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _stats_to_columns(prefix: str, entries: dict, keys) -> dict:
+    """
+    Turns {id: {"stats": {...}, "suspicion": ...}} into the id, count and suspicion columns of an artifact.
+    """
+    columns = {f"{prefix}_ids": np.fromiter((int(key) for key in entries), dtype=np.int32, count=len(entries)),
+               f"{prefix}_suspicion": np.fromiter((details["suspicion"] for details in entries.values()),
+                                                  dtype=np.float64, count=len(entries))}
+    for key in keys:
+        columns[f"{prefix}_{key}"] = np.fromiter((details["stats"][key] for details in entries.values()),
+                                                 dtype=np.int32, count=len(entries))
+    return columns
+
+
+def _columns_to_stats(prefix: str, columns, keys) -> dict:
+    counts = [columns[f"{prefix}_{key}"].tolist() for key in keys]
+    return {str(key): {"stats": dict(zip(keys, stats)), "suspicion": suspicion} for key, suspicion, *stats in zip(
+        columns[f"{prefix}_ids"].tolist(), columns[f"{prefix}_suspicion"].tolist(), *counts)}
+
+
+def dictionary_to_columns(dictionary: dict) -> dict:
+    """
+    Converts the result of a stage (SBFL, contribution, PageRank or MBFL) to named NumPy columns: int32 ids
+    and counts, float64 scores, and lists flattened into offsets and values. The scalar fields, e.g. "proj",
+    are stored as 0-d arrays.
+    """
+    columns, fields = {}, []
+    for key, value in dictionary.items():
+        if not isinstance(value, (dict, list)):
+            columns[f"field_{len(fields)}"] = np.asarray(value)
+            fields.append(key)
+    columns["fields"] = np.array(fields, dtype=str)
+
+    if "method suspicion" in dictionary:
+        columns["kind"] = np.asarray("sbfl")
+        line_suspicion = dictionary["line suspicion"]
+        columns.update(_stats_to_columns("method", dictionary["method suspicion"], STATS_KEYS[FaultLocalization.SBFL]))
+        columns.update(_stats_to_columns("line", line_suspicion, STATS_KEYS[FaultLocalization.SBFL]))
+        for test_cases in ("passed_test_cases", "failed_test_cases"):
+            columns[f"line_{test_cases}_offsets"], columns[f"line_{test_cases}"] = _lists_to_columns(
+                [details["test_cases"][test_cases] for details in line_suspicion.values()])
+    elif "mutant suspicion" in dictionary:
+        columns["kind"] = np.asarray("mbfl")
+        columns.update(_stats_to_columns("mutant", dictionary["mutant suspicion"], STATS_KEYS[FaultLocalization.MBFL]))
+        line_suspicion = dictionary["line suspicion"]
+        columns["line_ids"] = np.fromiter((int(key) for key in line_suspicion), dtype=np.int32, count=len(line_suspicion))
+        columns["line_suspicion"] = np.fromiter((details["suspicion"] for details in line_suspicion.values()),
+                                                dtype=np.float64, count=len(line_suspicion))
+        columns["line_mutants_offsets"], columns["line_mutants"] = _lists_to_columns(
+            [details["mutants"] for details in line_suspicion.values()])
+    elif "ftest" in dictionary and "rtest" in dictionary:
+        columns["kind"] = np.asarray("contribution")
+        for key in ("ftest", "rtest"):
+            columns[f"{key}_ids"] = np.fromiter((int(test) for test in dictionary[key]), dtype=np.int32, count=len(dictionary[key]))
+            columns[f"{key}_contribution"] = np.fromiter(dictionary[key].values(), dtype=np.float64, count=len(dictionary[key]))
+    else:
+        prefixes = [key[:-len("_results")] for key in dictionary if key.endswith("_results")]
+        if len(prefixes) != 1:
+            raise ValueError("Unsupported artifact")
+        columns["kind"] = np.asarray("page_rank")
+        columns["prefix"] = np.asarray(prefixes[0])
+        lengths = dictionary[f"{prefixes[0]}_lengths"]
+        columns["lengths"] = np.array([lengths[key] for key in ("methods", "statements", "rtest", "ftest")], dtype=np.int64)
+        columns["results"] = np.asarray(dictionary[f"{prefixes[0]}_results"], dtype=np.float64)
+    return columns
+
+
+def columns_to_dictionary(columns) -> dict:
+    """
+    Rebuilds the JSON layout of a stage result from its columns, with string ids like json.load gives.
+    """
+    dictionary = {str(field): columns[f"field_{index}"].item() for index, field in enumerate(columns["fields"].tolist())}
+    kind = str(columns["kind"])
+    if kind == "sbfl":
+        dictionary["method suspicion"] = _columns_to_stats("method", columns, STATS_KEYS[FaultLocalization.SBFL])
+        line_suspicion = _columns_to_stats("line", columns, STATS_KEYS[FaultLocalization.SBFL])
+        test_cases = {key: _columns_to_lists(columns[f"line_{key}_offsets"], columns[f"line_{key}"])
+                      for key in ("passed_test_cases", "failed_test_cases")}
+        for index, details in enumerate(line_suspicion.values()):
+            details["test_cases"] = {key: test_cases[key][index] for key in ("passed_test_cases", "failed_test_cases")}
+        dictionary["line suspicion"] = line_suspicion
+    elif kind == "mbfl":
+        mutants = _columns_to_lists(columns["line_mutants_offsets"], columns["line_mutants"])
+        dictionary["line suspicion"] = {str(line): {"mutants": line_mutants, "suspicion": suspicion} for line, line_mutants, suspicion in zip(
+            columns["line_ids"].tolist(), mutants, columns["line_suspicion"].tolist())}
+        dictionary["mutant suspicion"] = _columns_to_stats("mutant", columns, STATS_KEYS[FaultLocalization.MBFL])
+    elif kind == "contribution":
+        for key in ("ftest", "rtest"):
+            dictionary[key] = {str(test): contribution for test, contribution in zip(
+                columns[f"{key}_ids"].tolist(), columns[f"{key}_contribution"].tolist())}
+    elif kind == "page_rank":
+        prefix = str(columns["prefix"])
+        dictionary[f"{prefix}_lengths"] = dict(zip(("methods", "statements", "rtest", "ftest"), columns["lengths"].tolist()))
+        dictionary[f"{prefix}_results"] = columns["results"].tolist()
+    else:
+        raise ValueError("Unsupported artifact")
+    return dictionary
+
+
+def page_rank_file(file_path: str) -> str:
+    """
+    Get the path of a PageRank result from its path with the .json extension: a raw .npy vector, unless
+    ARTIFACT_FORMAT is 'json'.
+    """
+    root, extension = os.path.splitext(file_path)
+    return f"{root}.npy" if extension == ".json" and ARTIFACT_FORMAT != 'json' else file_path
+
+
+def save_artifact(dictionary: dict, file_path: str):
+    """
+    Writes the result of a stage, depending on the extension of file_path: as JSON, as compressed NumPy
+    columns (.npz), or for a PageRank result as its raw vector (.npy), which can be memory-mapped.
+    """
+    if file_path.endswith(".json"):
+        dictionary_to_json(dictionary, file_path)
+        return
+    directory = os.path.dirname(file_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    columns = dictionary_to_columns(dictionary)
+    if file_path.endswith(".npy"):
+        if str(columns["kind"]) != "page_rank":
+            raise ValueError("Only PageRank results are stored as .npy vectors")
+        np.save(file_path, columns["results"])
+        return
+    np.savez_compressed(file_path, **columns)
+
+
+def load_artifact_columns(file_path: str) -> dict:
+    """
+    Reads the columns of a .npz artifact, without rebuilding the JSON layout.
+    """
+    with np.load(file_path) as columns:
+        return {key: columns[key] for key in columns.files}
+
+
+def load_artifact(file_path: str) -> dict:
+    """
+    Reads the result of a stage written by save_artifact, in the layout json.load gives.
+    """
+    if file_path.endswith(".json"):
+        with open(file_path, 'r') as rf:
+            return json.load(rf)
+    return columns_to_dictionary(load_artifact_columns(file_path))
+
+
+def load_page_rank_result(file_path: str, prefix: str, lengths: dict) -> dict:
+    """
+    Reads a PageRank result in the layout of page_rank_results_to_string. A .npy vector is memory-mapped, so
+    slicing the statements or the passed test cases only reads their pages.
+
+    Args:
+    - file_path (str): The path given by page_rank_file.
+    - prefix (str): The prefix of the result, e.g. "failed_passed_diff".
+    - lengths (dict): The number of "methods", "statements", "rtest" and "ftest" of the project, which the
+      .npy vectors do not store.
+    """
+    if not file_path.endswith(".npy"):
+        return load_artifact(file_path)
+    return {f"{prefix}_lengths": lengths, f"{prefix}_results": np.load(file_path, mmap_mode='r')}
+
+
+def export_artifacts_to_json(directory: str):
+    """
+    Writes a .json copy next to every .npz artifact of a directory, for tools that read the JSON layout.
+    """
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if file_name.endswith(".npz") and "kind" in np.load(file_path).files:
+                dictionary_to_json(load_artifact(file_path), f"{os.path.splitext(file_path)[0]}.json")
+
+
 def adjacency_matrix_to_mermaid(matrix, number_of_methods, number_of_lines, number_of_test_cases, passed_or_failed=True):
     """
     Converts an adjacency matrix to a Mermaid graph representation.
@@ -30,6 +330,8 @@ def adjacency_matrix_to_mermaid(matrix, number_of_methods, number_of_lines, numb
     - str: A string formatted in Mermaid syntax representing the directed graph.
     """
     mermaid_str = "```mermaid\ngraph LR\n"
+    if sparse.issparse(matrix):
+        matrix = matrix.toarray()
     rows, cols = matrix.shape
     assert (rows == cols)
     assert (rows == number_of_methods + number_of_lines + number_of_test_cases)
@@ -84,132 +386,187 @@ class Formula(Enum):
             return "DSTAR"
 
 
-def GP13(line_suspicion, type: FaultLocalization):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = ef * \
-                (1 + 1 / (2 * ep + ef)) if ef != 0 else 0
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = kf * \
-                (1 + 1 / (2 * kp + kf)) if kf != 0 else 0
-        return line_suspicion
-        return
+def _guarded_divide(numerator, denominator, mask):
+    """
+    Divides numerator by denominator where mask is set, and returns 0 everywhere else.
+    """
+    result = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=result, where=mask)
+    return result
 
 
-def Ochiai(line_suspicion, type: FaultLocalization):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            denominator = math.sqrt((ef + nf) * (ef + np))
-            line_suspicion[line]['suspicion'] = ef / \
-                denominator if denominator > 0 else 0
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            denominator = math.sqrt((kf + nf) * (kf + np))
-            line_suspicion[line]['suspicion'] = kf / \
-                denominator if denominator > 0 else 0
-        return line_suspicion
-
-
-def Jaccard(line_suspicion, type: FaultLocalization):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            denominator = ef + nf + ep
-            line_suspicion[line]['suspicion'] = ef / \
-                denominator if denominator > 0 else 0
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            denominator = kf + nf + kp
-            line_suspicion[line]['suspicion'] = kf / \
-                denominator if denominator > 0 else 0
-        return line_suspicion
-
-
-def OP2(line_suspicion, type: FaultLocalization):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = ef - ep / (np + ep + 1)
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = kf - kp / (np + kp + 1)
-        return line_suspicion
-
-
-def Tarantula(line_suspicion, type: FaultLocalization):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            if ef == 0:
-                line_suspicion[line]['suspicion'] = 0
-                continue
-            ef_ratio_in_failed_cases = ef / (ef + nf) if ef + nf != 0 else 0
-            ep_ratio_in_passed_cases = ep / (ep + np) if ep + np != 0 else 1
-            line_suspicion[line]['suspicion'] = ef_ratio_in_failed_cases / \
-                (ef_ratio_in_failed_cases + ep_ratio_in_passed_cases)
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            if kf == 0:
-                line_suspicion[line]['suspicion'] = 0
-                continue
-            kf_ratio_in_failed_cases = kf / (kf + nf) if kf + nf != 0 else 0
-            kp_ratio_in_passed_cases = kp / (kp + np) if kp + np != 0 else 1
-            line_suspicion[line]['suspicion'] = kf_ratio_in_failed_cases / \
-                (kf_ratio_in_failed_cases + kp_ratio_in_passed_cases)
-        return line_suspicion
-
-
-def Dstar(line_suspicion, type: FaultLocalization, star_value=2):
-    if type == FaultLocalization.SBFL:
-        for line in line_suspicion:
-            ef, ep, nf, np = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = math.pow(
-                ef, star_value) / ((ep + nf)) if ep + nf > 0 else 0
-        return line_suspicion
-    elif type == FaultLocalization.MBFL:
-        for line in line_suspicion:
-            kp, np, kf, nf = line_suspicion[line]['stats'].values()
-            line_suspicion[line]['suspicion'] = math.pow(
-                kf, star_value) / ((kp + nf)) if kp + nf > 0 else 0
-        return line_suspicion
+# Every formula kernel takes the four count arrays of a spectrum and returns the suspiciousness array.
+# SBFL passes (ef, ep, nf, np), MBFL passes (akf, akp, anf, anp) in the same positions.
+def GP13(ef, ep, nf, np_):
+    return ef * (1 + _guarded_divide(1, 2 * ep + ef, ef != 0))
 
 
-def CalculateSuspiciousnessByMBFL(formula_type, line_suspicion):
-    if formula_type == Formula.GP13:
-        return GP13(line_suspicion, FaultLocalization.MBFL)
-    elif formula_type == Formula.OCHIAI:
-        return Ochiai(line_suspicion, FaultLocalization.MBFL)
-    elif formula_type == Formula.JACCARD:
-        return Jaccard(line_suspicion, FaultLocalization.MBFL)
-    elif formula_type == Formula.OP2:
-        return OP2(line_suspicion, FaultLocalization.MBFL)
-    elif formula_type == Formula.TARANTULA:
-        return Tarantula(line_suspicion, FaultLocalization.MBFL)
-    elif formula_type == Formula.DSTAR:
-        return Dstar(line_suspicion, FaultLocalization.MBFL)
-    else:
+def Ochiai(ef, ep, nf, np_):
+    product = (ef + nf) * (ef + np_)
+    denominator = np.sqrt(np.where(product > 0, product, 0))
+    return _guarded_divide(ef, denominator, product > 0)
+
+
+def Jaccard(ef, ep, nf, np_):
+    denominator = ef + nf + ep
+    return _guarded_divide(ef, denominator, denominator > 0)
+
+
+def OP2(ef, ep, nf, np_):
+    denominator = np_ + ep + 1
+    return ef - _guarded_divide(ep, denominator, denominator != 0)
+
+
+def Tarantula(ef, ep, nf, np_):
+    ef_ratio_in_failed_cases = _guarded_divide(ef, ef + nf, ef + nf != 0)
+    ep_ratio_in_passed_cases = np.where(
+        ep + np_ != 0, _guarded_divide(ep, ep + np_, ep + np_ != 0), 1)
+    denominator = ef_ratio_in_failed_cases + ep_ratio_in_passed_cases
+    return _guarded_divide(ef_ratio_in_failed_cases, denominator, (ef != 0) & (denominator != 0))
+
+
+def Dstar(ef, ep, nf, np_, star_value=2):
+    denominator = ep + nf
+    return _guarded_divide(np.power(np.asarray(ef, dtype=float), star_value), denominator, denominator > 0)
+
+
+FORMULA_KERNELS = {
+    Formula.GP13: GP13,
+    Formula.OCHIAI: Ochiai,
+    Formula.JACCARD: Jaccard,
+    Formula.OP2: OP2,
+    Formula.TARANTULA: Tarantula,
+    Formula.DSTAR: Dstar,
+}
+
+STATS_KEYS = {
+    FaultLocalization.SBFL: ('ef', 'ep', 'nf', 'np'),
+    FaultLocalization.MBFL: ('akf', 'akp', 'anf', 'anp'),
+}
+
+
+def suspiciousness(formula_type, ef, ep, nf, np_):
+    """
+    Scores whole count arrays with the kernel registered for a formula.
+
+    Args:
+    - formula_type (Formula): The formula to apply.
+    - ef, ep, nf, np_ (np.array): The spectrum counts, (akf, akp, anf, anp) for MBFL.
+
+    Returns:
+    - np.array: The suspiciousness of every entry.
+    """
+    if formula_type not in FORMULA_KERNELS:
         raise ValueError("Unsupported formula type")
+    counts = [np.asarray(count, dtype=np.int64) for count in (ef, ep, nf, np_)]
+    return FORMULA_KERNELS[formula_type](*counts)
 
 
-def MBFL(mutants2lines, mutants_list, line_list, original_line_test_case_data, mutants2passed_test_cases, mutants2failed_test_cases, formula):
+def CalculateSuspiciousness(formula_type, line_suspicion, type: FaultLocalization):
+    """
+    Adapter for the dict of dicts layout: reads every "stats" entry, scores them in one call and writes
+    the result back to "suspicion".
+    """
+    keys = STATS_KEYS[type]
+    counts = [np.fromiter((details["stats"][key] for details in line_suspicion.values()),
+                          dtype=np.int64, count=len(line_suspicion)) for key in keys]
+    scores = suspiciousness(formula_type, *counts).tolist()
+    for details, score in zip(line_suspicion.values(), scores):
+        details["suspicion"] = score
+    return line_suspicion
 
-    line_suspicion = {number_index: {"mutants": [], "suspicion": 0}
-                      for number_index in line_list}
-    mutant_suspicion = {number_index: {"stats": {'akp': 0, 'anp': 0, 'akf': 0, 'anf': 0}, "suspicion": 0}
-                        for number_index in mutants_list}
+
+def CalculateSuspiciousnessBySBFL(formula_type, line_suspicion):
+    return CalculateSuspiciousness(formula_type, line_suspicion, FaultLocalization.SBFL)
+
+
+def CalculateSuspiciousnessByMBFL(formula_type, line_suspicion):
+    return CalculateSuspiciousness(formula_type, line_suspicion, FaultLocalization.MBFL)
+
+
+def _edges_to_matrix(rows, columns, shape) -> sparse.csr_matrix:
+    """
+    Builds a 0/1 sparse matrix with a one at every (row, column) edge, duplicated edges counting once.
+    """
+    matrix = sparse.csr_matrix((np.ones(len(columns), dtype=np.int64), (rows, columns)), shape=shape)
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def _indicator_matrix(lists, number_of_columns: int) -> sparse.csr_matrix:
+    """
+    Builds a 0/1 sparse matrix whose row i has a one in the columns of lists[i].
+    """
+    offsets, columns = _lists_to_columns(lists)
+    rows = np.repeat(np.arange(len(lists)), np.diff(offsets))
+    return _edges_to_matrix(rows, columns, (len(lists), number_of_columns))
+
+
+def _row_sums(matrix) -> np.ndarray:
+    return np.asarray(matrix.sum(axis=1), dtype=np.int64).ravel()
+
+
+def MBFL_stats(mutants2lines, mutants_list, original_line_test_case_data, mutants2passed_test_cases, mutants2failed_test_cases):
+    """
+    Counts akp, anp, akf and anf of every mutant. The counts only depend on the kill information, so they
+    can be shared by all formulas.
+
+    The kills are a sparse mutant × test matrix and the coverage a line × test matrix whose rows are gathered
+    for the line of every mutant, so the counts of all mutants are row sums of elementwise products. The
+    passed and failed test cases share their ids, and the counts are the same as MBFL_stats_by_sets:
+    - akp = |(killed passed ∪ killed failed) ∩ passed of the line|, when the mutant kills a passed test case
+    - anp = |passed of the line - killed passed|, when the mutant kills a passed test case
+    - akf = |(killed passed ∪ killed failed) ∩ failed of the line|, when the mutant kills a failed test case
+    - anf = |(passed of the line - killed passed) ∩ failed of the line|, when the mutant kills both
+
+    Returns:
+    - dict: Maps every mutant to its {"akp", "anp", "akf", "anf"} counts.
+    """
+    mutants = list(dict.fromkeys(mutants_list))
+    if not mutants:
+        return {}
+    has_passed = np.fromiter((mutant in mutants2passed_test_cases for mutant in mutants), dtype=bool, count=len(mutants))
+    has_failed = np.fromiter((mutant in mutants2failed_test_cases for mutant in mutants), dtype=bool, count=len(mutants))
+    killed_passed = [mutants2passed_test_cases.get(mutant, []) for mutant in mutants]
+    killed_failed = [mutants2failed_test_cases.get(mutant, []) for mutant in mutants]
+
+    # Only the lines of the mutants which kill a test case are read from the coverage
+    lines = list(dict.fromkeys(mutants2lines[mutant] for mutant, kills in zip(mutants, has_passed | has_failed) if kills))
+    line_index = {line: index for index, line in enumerate(lines)}
+    covered = {key: [original_line_test_case_data[f"{line}"]["test_cases"][key] for line in lines]
+               for key in ("passed_test_cases", "failed_test_cases")}
+    number_of_test_cases = 1 + max((max(test_cases, default=-1) for lists in (killed_passed, killed_failed, *covered.values())
+                                    for test_cases in lists), default=-1)
+
+    killed_passed = _indicator_matrix(killed_passed, number_of_test_cases)
+    killed = killed_passed + _indicator_matrix(killed_failed, number_of_test_cases)
+    killed.data[:] = 1
+    # The coverage row of the line of every mutant. The mutants which kill nothing take the first row, their counts are masked
+    rows = np.fromiter((line_index.get(mutants2lines[mutant], 0) for mutant in mutants), dtype=np.int64, count=len(mutants))
+    passed = _indicator_matrix(covered["passed_test_cases"] or [[]], number_of_test_cases)[rows]
+    failed = _indicator_matrix(covered["failed_test_cases"] or [[]], number_of_test_cases)[rows]
+    passed_and_failed = passed.multiply(failed)
+
+    akp = np.where(has_passed, _row_sums(killed.multiply(passed)), 0)
+    anp = np.where(has_passed, _row_sums(passed) - _row_sums(killed_passed.multiply(passed)), 0)
+    akf = np.where(has_failed, _row_sums(killed.multiply(failed)), 0)
+    anf = np.where(has_passed & has_failed,
+                   _row_sums(passed_and_failed) - _row_sums(killed_passed.multiply(passed_and_failed)), 0)
+    return {mutant: {'akp': stats[0], 'anp': stats[1], 'akf': stats[2], 'anf': stats[3]}
+            for mutant, stats in zip(mutants, np.column_stack((akp, anp, akf, anf)).tolist())}
+
+
+def MBFL_stats_by_sets(mutants2lines, mutants_list, original_line_test_case_data, mutants2passed_test_cases, mutants2failed_test_cases):
+    """
+    Counts akp, anp, akf and anf of every mutant with sets of test cases, one mutant at a time. This is the
+    reference implementation of MBFL_stats, kept for benchmark.py.
+
+    Returns:
+    - dict: Maps every mutant to its {"akp", "anp", "akf", "anf"} counts.
+    """
+    mutant_stats = {number_index: {'akp': 0, 'anp': 0, 'akf': 0, 'anf': 0}
+                    for number_index in mutants_list}
     mutant_set = {number_index: {"killed": set(), "non-killed": set(), "passed": set(), "failed": set()}
                   for number_index in mutants_list}
 
@@ -233,27 +590,171 @@ def MBFL(mutants2lines, mutants_list, line_list, original_line_test_case_data, m
             original_line_test_case_data[f"{line}"]["test_cases"]["failed_test_cases"]).difference(mutant_set[mutant]["killed"]))
 
     for index, test_cases_sets in mutant_set.items():
-        mutant_suspicion[index]["stats"]["akp"] = len(
+        mutant_stats[index]["akp"] = len(
             test_cases_sets["killed"].intersection(test_cases_sets["passed"]))
-        mutant_suspicion[index]["stats"]["anp"] = len(
+        mutant_stats[index]["anp"] = len(
             test_cases_sets["non-killed"].intersection(test_cases_sets["passed"]))
-        mutant_suspicion[index]["stats"]["akf"] = len(
+        mutant_stats[index]["akf"] = len(
             test_cases_sets["killed"].intersection(test_cases_sets["failed"]))
-        mutant_suspicion[index]["stats"]["anf"] = len(
+        mutant_stats[index]["anf"] = len(
             test_cases_sets["non-killed"].intersection(test_cases_sets["failed"]))
-    mutant_suspicion = CalculateSuspiciousnessByMBFL(formula, mutant_suspicion)
-    # print("mutant set", mutant_set)
-    # print("mutant suspicion", mutant_suspicion)
-    for mutant in mutant_suspicion.keys():
+    return mutant_stats
+
+
+def MBFL_scores(formula, mutants2lines, line_list, mutant_stats):
+    """
+    Scores the mutants with a formula and gives every line the highest suspiciousness of its mutants.
+
+    The mutants are sorted by line and the line suspicion is a segment maximum (np.fmax.reduceat) of their
+    scores. A line keeps the suspicion 0 when none of its mutants has a positive score.
+    """
+    line_suspicion = {number_index: {"mutants": [], "suspicion": 0}
+                      for number_index in line_list}
+    mutants = list(mutant_stats)
+    counts = [np.fromiter((mutant_stats[mutant][key] for mutant in mutants), dtype=np.int64, count=len(mutants))
+              for key in STATS_KEYS[FaultLocalization.MBFL]]
+    scores = suspiciousness(formula, *counts)
+    mutant_suspicion = {mutant: {"stats": dict(mutant_stats[mutant]), "suspicion": score}
+                        for mutant, score in zip(mutants, scores.tolist())}
+    if not mutants:
+        return line_suspicion, mutant_suspicion
+
+    line_index = {line: index for index, line in enumerate(line_suspicion)}
+    lines = np.empty(len(mutants), dtype=np.int64)
+    for position, mutant in enumerate(mutants):
         line = mutants2lines[mutant]
         line_suspicion[line]["mutants"].append(mutant)
-        if line_suspicion[line]["suspicion"] < mutant_suspicion[mutant]["suspicion"]:
-            line_suspicion[line]["suspicion"] = mutant_suspicion[mutant]["suspicion"]
+        lines[position] = line_index[line]
+    order = np.argsort(lines, kind='stable')
+    line_indices, starts = np.unique(lines[order], return_index=True)
+    maxima = np.fmax.reduceat(scores[order], starts)
+    line_keys = list(line_suspicion)
+    for index, maximum in zip(line_indices.tolist(), maxima.tolist()):
+        if maximum > 0:
+            line_suspicion[line_keys[index]]["suspicion"] = maximum
     return line_suspicion, mutant_suspicion
 
 
+def MBFL(mutants2lines, mutants_list, line_list, original_line_test_case_data, mutants2passed_test_cases, mutants2failed_test_cases, formula):
+    return MBFL_by_formulas(mutants2lines, mutants_list, line_list, original_line_test_case_data,
+                            mutants2passed_test_cases, mutants2failed_test_cases, [formula])[formula]
+
+
+def MBFL_by_formulas(mutants2lines, mutants_list, line_list, original_line_test_case_data, mutants2passed_test_cases, mutants2failed_test_cases, formulas):
+    """
+    Runs MBFL for several formulas, counting the kill information of the mutants only once.
+
+    Returns:
+    - dict: Maps every formula to the (line suspicion, mutant suspicion) pair returned by MBFL.
+    """
+    mutant_stats = MBFL_stats(mutants2lines, mutants_list, original_line_test_case_data,
+                              mutants2passed_test_cases, mutants2failed_test_cases)
+    return {formula: MBFL_scores(formula, mutants2lines, line_list, mutant_stats) for formula in formulas}
+
+
+def kill_matrix(mutant2line, mutant2rtest, mutant2ftest, original_line_test_case_data) -> dict:
+    """
+    Precomputes the kill information of all the mutants of a project once, so that MBFL_stats_by_masks counts
+    the mutants kept by any reduction with one sparse matrix-vector product instead of building the reduced
+    mutant to test case dictionaries again.
+
+    Args:
+    - mutant2line (list): The [mutant, line] edges, e.g. data["edge12"]. Every mutant has one line.
+    - mutant2rtest (list): The [mutant, passed test case] kill edges, e.g. data["edge13"].
+    - mutant2ftest (list): The [mutant, failed test case] kill edges, e.g. data["edge14"].
+    - original_line_test_case_data (dict): The "line suspicion" of the SBFL result, with the test cases of every line.
+
+    Returns:
+    - dict: "mutant2line" (the edges as an array), "mutants2lines", "kills failed" (whether every mutant kills a
+      failed test case), "counts" (the counts of every mutant which do not depend on the passed test cases)
+      and "passed kills" (the matrices of the kills of passed test cases which do, stacked).
+    """
+    mutant2line = np.asarray(mutant2line, dtype=np.int64).reshape(-1, 2)
+    mutant2rtest = np.asarray(mutant2rtest, dtype=np.int64).reshape(-1, 2)
+    mutant2ftest = np.asarray(mutant2ftest, dtype=np.int64).reshape(-1, 2)
+    mutants, lines = mutant2line[:, 0], mutant2line[:, 1]
+    if len(np.unique(mutants)) != len(mutants):
+        raise ValueError("A mutant has more than one line")
+
+    # Row of every mutant id, -1 for the kill edges of mutants without a line, which are never kept
+    size = 1 + max(int(mutants.max(initial=-1)), int(mutant2rtest[:, 0].max(initial=-1)), int(mutant2ftest[:, 0].max(initial=-1)))
+    row_of = np.full(size, -1, dtype=np.int64)
+    row_of[mutants] = np.arange(len(mutants))
+    rtest_rows, ftest_rows = row_of[mutant2rtest[:, 0]], row_of[mutant2ftest[:, 0]]
+    mutant2rtest, mutant2ftest = mutant2rtest[rtest_rows >= 0], mutant2ftest[ftest_rows >= 0]
+    rtest_rows, ftest_rows = rtest_rows[rtest_rows >= 0], ftest_rows[ftest_rows >= 0]
+
+    empty = {"passed_test_cases": [], "failed_test_cases": []}
+    covered = {key: [original_line_test_case_data.get(f"{line}", {"test_cases": empty})["test_cases"][key]
+                     for line in lines.tolist()] for key in ("passed_test_cases", "failed_test_cases")}
+    number_of_test_cases = 1 + max(int(mutant2rtest[:, 1].max(initial=-1)), int(mutant2ftest[:, 1].max(initial=-1)),
+                                   max((max(test_cases, default=-1) for lists in covered.values() for test_cases in lists), default=-1))
+    shape = (len(mutants), number_of_test_cases)
+    killed_passed = _edges_to_matrix(rtest_rows, mutant2rtest[:, 1], shape)
+    killed_failed = _edges_to_matrix(ftest_rows, mutant2ftest[:, 1], shape)
+    passed = _indicator_matrix(covered["passed_test_cases"], number_of_test_cases)
+    failed = _indicator_matrix(covered["failed_test_cases"], number_of_test_cases)
+    passed_and_failed = passed.multiply(failed)
+
+    return {
+        "mutant2line": mutant2line,
+        "mutants2lines": dict(zip(mutants.tolist(), lines.tolist())),
+        "kills failed": np.bincount(ftest_rows, minlength=len(mutants)) > 0,
+        "counts": {
+            "passed": _row_sums(passed),
+            "passed and failed": _row_sums(passed_and_failed),
+            "killed failed and passed": _row_sums(killed_failed.multiply(passed)),
+            "killed failed and failed": _row_sums(killed_failed.multiply(failed)),
+        },
+        # Kp, Kp ⊙ P, Kp ⊙ Kf ⊙ P, Kp ⊙ F, Kp ⊙ Kf ⊙ F and Kp ⊙ P ⊙ F: multiplied by the mask of the
+        # selected passed test cases, they give the counts of the kills of the selected ones
+        "passed kills": sparse.vstack([
+            killed_passed,
+            killed_passed.multiply(passed),
+            killed_passed.multiply(killed_failed).multiply(passed),
+            killed_passed.multiply(failed),
+            killed_passed.multiply(killed_failed).multiply(failed),
+            killed_passed.multiply(passed_and_failed),
+        ]).tocsr(),
+    }
+
+
+def MBFL_stats_by_masks(kills: dict, kept_mutants, passed_test_cases) -> dict:
+    """
+    Counts akp, anp, akf and anf of the mutants kept by a reduction, with the kill edges of the passed test
+    cases restricted to the selected ones. The counts are the same as MBFL_stats on the dictionaries built
+    by mbfl.refactor_data, but only the kills of the selected passed test cases are counted again.
+
+    Args:
+    - kills (dict): The result of kill_matrix.
+    - kept_mutants (np.array): A boolean mask of the kept mutant2line edges.
+    - passed_test_cases (iterable): The selected passed test cases.
+
+    Returns:
+    - dict: Maps every kept mutant, in the order of mutant2line, to its {"akp", "anp", "akf", "anf"} counts.
+    """
+    passed_kills = kills["passed kills"]
+    selected = np.zeros(passed_kills.shape[1], dtype=np.int64)
+    passed_test_cases = np.fromiter(passed_test_cases, dtype=np.int64)
+    selected[passed_test_cases[passed_test_cases < len(selected)]] = 1
+    killed, killed_passed, killed_both_passed, killed_failed, killed_both_failed, killed_passed_and_failed = \
+        (passed_kills @ selected).reshape(6, -1)
+
+    counts = kills["counts"]
+    kills_passed = kept_mutants & (killed > 0)
+    kills_failed = kept_mutants & kills["kills failed"]
+    akp = np.where(kills_passed, killed_passed + counts["killed failed and passed"] - killed_both_passed, 0)
+    anp = np.where(kills_passed, counts["passed"] - killed_passed, 0)
+    akf = np.where(kills_failed, killed_failed + counts["killed failed and failed"] - killed_both_failed, 0)
+    anf = np.where(kills_passed & kills_failed, counts["passed and failed"] - killed_passed_and_failed, 0)
+
+    kept = np.flatnonzero(kept_mutants)
+    mutants = kills["mutant2line"][kept, 0].tolist()
+    return {mutant: {'akp': stats[0], 'anp': stats[1], 'akf': stats[2], 'anf': stats[3]}
+            for mutant, stats in zip(mutants, np.column_stack((akp[kept], anp[kept], akf[kept], anf[kept])).tolist())}
+
+
 if __name__ == "__main__":
-    import numpy as np
     adj_matrix = np.array([[0, 1, 0], [0, 0, 1], [1, 0, 0]])
 
     # Convert to Mermaid graph